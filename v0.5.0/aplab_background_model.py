@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import aplab_grid_stats as apgs
+import aplab_robust_stats as aprs
+
+MODEL_BLOCKS = 64      # Number of blocks along the longer side of the frame
+MODEL_ORDER = 3        # Highest total power of the coordinates in the fitted polynomial
+REJECT_SIGMA = 3.0     # Blocks deviating by more than this many robust standard deviations are left out
+REJECT_ITERATIONS = 5  # Largest number of fits with rejection of deviating blocks
+
+def gridShape(shape, blocks=MODEL_BLOCKS):
+
+    '''Return the number of blocks horizontally and vertically that gives nearly square blocks.'''
+
+    h, w = shape
+
+    if w >= h:
+        return blocks, max(int(round(blocks*h/w)), 1)
+    else:
+        return max(int(round(blocks*w/h)), 1), blocks
+
+def polynomialTerms(x, y, order=MODEL_ORDER):
+
+    '''Return the values of every term x**i*y**j with i + j <= order, along the last axis.'''
+
+    return np.stack([x**i*y**j for i in range(order + 1) for j in range(order + 1 - i)], axis=-1)
+
+class BackgroundModel:
+
+    def __init__(self, img, mask=None, offset=0.0, order=MODEL_ORDER, blocks=MODEL_BLOCKS):
+
+        '''
+        Fit a smooth 2-D polynomial surface of the given order to the background of a frame, from
+        the medians of a grid of blocks with the offset (black level) subtracted, so that only a few
+        thousand values enter the fit. Blocks with stars or other objects are left out, both those
+        with an unusually large spread and those deviating strongly from the fitted surface.
+        Coordinates run from -1 to 1 across the frame in each direction. Pixels where the mask
+        is true are not used.
+        '''
+
+        self.shape = img.shape
+        self.order = order
+
+        nx, ny = gridShape(img.shape, blocks)
+        bh, bw = apgs.blockShape(img.shape, nx, ny)
+
+        if bh == 0 or bw == 0:
+            raise ValueError('The image is too small to fit a background model.')
+
+        grid = apgs.gridStatistics(img, nx, ny, mask=mask)
+
+        # Normalized coordinates of the block centres
+        self.x, self.y = np.meshgrid(2*(np.arange(nx) + 0.5)*bw/img.shape[1] - 1,
+                                     2*(np.arange(ny) + 0.5)*bh/img.shape[0] - 1)
+
+        self.level = grid['Median'] - offset
+
+        noise = grid['Noise']
+        valid = np.isfinite(self.level) & np.isfinite(noise)
+
+        if np.sum(valid) < len(polynomialTerms(0.0, 0.0, order)):
+            raise ValueError('Too few blocks to fit a background model.')
+
+        # Stars raise the spread of the pixel values in a block
+        noise_median = np.median(noise[valid])
+        noise_sigma = aprs.madStd(noise[valid], noise_median)
+
+        valid &= noise <= noise_median + REJECT_SIGMA*max(noise_sigma, 1e-3*noise_median)
+
+        self.used = valid.copy()
+
+        for i in range(REJECT_ITERATIONS):
+
+            self.coefficients = np.linalg.lstsq(polynomialTerms(self.x[self.used], self.y[self.used], order),
+                                                self.level[self.used], rcond=None)[0]
+
+            residuals = self.level - self.evaluate(self.x, self.y)
+            sigma = aprs.madStd(residuals[self.used], 0.0)
+
+            used = valid & (np.abs(residuals) <= REJECT_SIGMA*max(sigma, 1e-12))
+
+            if np.array_equal(used, self.used): break
+
+            self.used = used
+
+    def evaluate(self, x, y):
+
+        '''Return the value of the fitted surface at the given normalized coordinates.'''
+
+        return polynomialTerms(np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64),
+                               self.order).dot(self.coefficients)
+
+    def sample(self, n=101):
+
+        '''Return the fitted surface on an n x n grid spanning the frame.'''
+
+        return self.evaluate(*np.meshgrid(np.linspace(-1, 1, n), np.linspace(-1, 1, n)))
+
+    def gradient(self):
+
+        '''
+        Return the mean level of the surface, the difference between its highest and lowest value
+        across the frame in percent of the mean level, and the direction in which the linear part
+        of the surface increases, in degrees counterclockwise from the right.
+        '''
+
+        surface = self.sample()
+        mean = np.mean(surface)
+
+        # Coefficients of the x and y terms (y increases downwards in the image)
+        terms = [(i, j) for i in range(self.order + 1) for j in range(self.order + 1 - i)]
+        slope_x = self.coefficients[terms.index((1, 0))] if self.order > 0 else 0.0
+        slope_y = self.coefficients[terms.index((0, 1))] if self.order > 0 else 0.0
+
+        return mean, 100*(np.max(surface) - np.min(surface))/mean, \
+               np.degrees(np.arctan2(-slope_y, slope_x)) % 360
+
+    def vignetting(self):
+
+        '''
+        Return the falloff of the surface in the corners of the frame, in percent of its peak
+        value, as for a flat frame with vignetting.
+        '''
+
+        corners = self.evaluate([-1, 1, -1, 1], [-1, -1, 1, 1])
+
+        return 100*(1 - np.mean(corners)/np.max(self.sample()))
@@ -116,6 +116,8 @@ class C:
     FOV_WINDOW_SIZE = (l_x, l_y)
     SOLV_WINDOW_SIZE = (l_x, l_y)
 
+    FRAME_CACHE_SIZE = 2*1024**3 # Largest total size in bytes of the decoded frames kept between sessions
+
     # Lists for camera data
     CNAME = []
     TYPE = []
@@ -397,18 +399,27 @@ def clipLevel(img, black_point, white_point):
     values black and the "white_point" pixel values white.
     '''
     
+    if isLUTImage(img):
+        return applyLUT(img, clipLevelLUT(black_point, white_point))
+
     return (65535*(img - black_point).astype('float')/(white_point - black_point)).astype('uint16')
     
 def stretch(img, m):
     
     '''Stretch the image with a "midtones transfer function".'''
 
+    if isLUTImage(img):
+        return applyLUT(img, stretchLUT(m))
+
     return (img*(m - 1)/((img/65535.0)*(2*m - 1) - m)).astype('uint16')
     
 def autostretch(img):
 
     '''Returns a clipped and stretched image where the mean is at 25% gray.'''
     
+    if isLUTImage(img):
+        return applyLUT(img, autostretchLUT(imageHistogram(img)))
+
     if np.min(img) < np.max(img):
     
         # Clip both ends of histogram
@@ -424,7 +435,142 @@ def autostretch(img):
         img = 65535*np.ones(img.shape, dtype='uint16')
     
     return img
-    
+
+def isLUTImage(img):
+
+    '''Return true if the image is 16-bit, so that any stretch can be done with a lookup table.'''
+
+    return isinstance(img, np.ndarray) and img.dtype == np.uint16
+
+def linearLUT():
+
+    '''Return the lookup table that leaves a 16-bit image unchanged.'''
+
+    return np.arange(65536, dtype='uint16')
+
+def clipLevelLUT(black_point, white_point):
+
+    '''Return the lookup table for the "clipLevel" stretch, clipped to the 16-bit range.'''
+
+    x = np.arange(65536, dtype='float64')
+
+    return np.clip(65535*(x - black_point)/float(white_point - black_point), 0, 65535).astype('uint16')
+
+def stretchLUT(m):
+
+    '''Return the lookup table for the "stretch" midtones transfer function.'''
+
+    x = np.arange(65536, dtype='float64')
+
+    return np.clip(x*(m - 1)/((x/65535.0)*(2*m - 1) - m), 0, 65535).astype('uint16')
+
+def arcsinhLUT(beta):
+
+    '''Return the lookup table for an arcsinh stretch, where a higher "beta" gives a stronger stretch.'''
+
+    if beta <= 0:
+        return linearLUT()
+
+    x = np.arange(65536, dtype='float64')
+
+    return (65535*np.arcsinh(beta*x/65535.0)/np.arcsinh(beta)).astype('uint16')
+
+def arcsinhBeta(m):
+
+    '''
+    Return the "beta" of the arcsinh stretch that brings the level m to 50 %, like the "stretch"
+    midtones transfer function with the same m. Levels above 50 % give no stretch (zero).
+    '''
+
+    if m >= 0.5:
+        return 0.0
+
+    # The level m is raised more the higher beta is, so beta is found by bisection of its logarithm
+    low, high = -6.0, 12.0
+
+    for i in range(60):
+
+        beta = 10**(0.5*(low + high))
+
+        if np.arcsinh(beta*m)/np.arcsinh(beta) > 0.5:
+            high = np.log10(beta)
+        else:
+            low = np.log10(beta)
+
+    return 10**(0.5*(low + high))
+
+def autostretchLUT(hist, lut=None):
+
+    '''
+    Return the lookup table for the "autostretch" stretch of the 16-bit image with
+    the given histogram, optionally applied after the stretch given by "lut".
+    '''
+
+    if lut is None:
+        lut = linearLUT()
+
+    values = lut[hist > 0]
+    black_point = np.min(values)
+    white_point = np.max(values)
+
+    if black_point < white_point:
+
+        # Clip both ends of histogram
+        lut = composeLUTs(lut, clipLevelLUT(black_point, white_point))
+
+        # Stretch the image with to bring the mean level to 25 %
+        new_mean = 0.25
+        mean = histogramMean(hist, lut)/65535.0
+        m = mean*(new_mean - 1)/(2*new_mean*mean - new_mean - mean)
+        lut = composeLUTs(lut, stretchLUT(m))
+
+    else:
+        lut = 65535*np.ones(65536, dtype='uint16')
+
+    return lut
+
+def composeLUTs(*luts):
+
+    '''Combine lookup tables into one that performs all of them in the given order.'''
+
+    lut = luts[0]
+
+    for next_lut in luts[1:]:
+        lut = next_lut[lut]
+
+    return lut
+
+def applyLUT(img, lut):
+
+    '''Return the image stretched with the lookup table, in a single indexing pass.'''
+
+    return lut[img]
+
+def imageHistogram(img):
+
+    '''Return the number of pixels in the 16-bit image having each of the 65536 possible values.'''
+
+    return np.bincount(img.ravel(), minlength=65536)
+
+def histogramMean(hist, lut=None):
+
+    '''Return the mean value of the image with the given histogram, after applying any lookup table.'''
+
+    values = np.arange(65536, dtype='float64') if lut is None else lut.astype('float64')
+
+    return np.dot(hist, values)/np.sum(hist)
+
+def histogramLUT(hist, lut, bins):
+
+    '''
+    Return the histogram (like "np.histogram") of the 16-bit image
+    with the given histogram, after applying the lookup table.
+    '''
+
+    present = hist > 0
+
+    return np.histogram(lut[present], bins=bins, weights=hist[present])
+
 def itpData(datastring, d_type):
 
     '''Recognizes user modified data in the string and returns the values with indicators.'''
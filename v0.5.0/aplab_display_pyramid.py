@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+from PIL import Image
+
+class DisplayPyramid:
+
+    def __init__(self, img, min_size=256):
+
+        '''
+        Initialize pyramid of successively halved versions of the given 8-bit image,
+        down to the level where the largest dimension is below the given minimum size.
+        '''
+
+        self.levels = [np.ascontiguousarray(img)]
+
+        level = self.levels[0]
+
+        while np.max(level.shape) >= 2*min_size:
+
+            h = level.shape[0] - level.shape[0] % 2
+            w = level.shape[1] - level.shape[1] % 2
+
+            # Average 2x2 blocks
+            blocks = level[:h, :w].reshape(h//2, 2, w//2, 2).astype(np.uint16)
+            level = ((blocks.sum(axis=(1, 3)) + 2)//4).astype(np.uint8)
+
+            self.levels.append(level)
+
+        self.height, self.width = self.levels[0].shape
+
+    def render(self, zoom, x, y, w, h):
+
+        '''
+        Return the region of the image at the given zoom factor with the given position
+        and size (in zoomed pixels) as a PIL image. Only the pixels of the pyramid level
+        closest above the zoom factor that fall within the region are resampled.
+        '''
+
+        # Limit the region to the zoomed image
+        x1 = max(int(x), 0)
+        y1 = max(int(y), 0)
+        x2 = min(int(np.ceil(x + w)), int(round(zoom*self.width)))
+        y2 = min(int(np.ceil(y + h)), int(round(zoom*self.height)))
+
+        if x2 <= x1 or y2 <= y1: return None
+
+        # Pick the smallest level that still has at least the displayed resolution
+        n = 0
+        while n + 1 < len(self.levels) and zoom <= 0.5**(n + 1): n += 1
+
+        level = self.levels[n]
+        f = zoom*2**n # Zoom factor relative to the chosen level
+
+        # Pixels of the level covered by the region
+        lx1 = int(np.floor(x1/f))
+        ly1 = int(np.floor(y1/f))
+        lx2 = min(int(np.ceil(x2/f)), level.shape[1])
+        ly2 = min(int(np.ceil(y2/f)), level.shape[0])
+
+        crop = Image.fromarray(level[ly1:ly2, lx1:lx2])
+
+        if f == 1: return crop
+
+        # Show individual pixels when magnifying, and smooth when reducing
+        resample = Image.NEAREST if f > 1 else Image.BILINEAR
+
+        # Map the region onto the covered level pixels, which may extend slightly beyond it
+        box = (x1/f - lx1, y1/f - ly1, x2/f - lx1, y2/f - ly1)
+
+        return crop.resize((x2 - x1, y2 - y1), resample, box=box)
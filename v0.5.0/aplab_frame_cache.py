@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import hashlib
+import numpy as np
+import aplab_frame_reader as apfr
+
+# Metadata needed by the Image Analyser, which are the only ones kept in the cache
+CACHED_KEYS = ['EXIF ISOSpeedRatings', 'EXIF ExposureTime', 'EXPTIME', 'EXPOSURE']
+
+class FrameCache:
+
+    def __init__(self, directory, max_size=2*1024**3):
+
+        '''
+        Initialize persistent cache of decoded frames in the given directory. Frames are
+        identified by a hash of the file content together with the modification time, and
+        the least recently used frames are deleted when the total size exceeds max_size bytes.
+        '''
+
+        self.directory = directory
+        self.max_size = max_size
+
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+    def getKey(self, filepath, hdu=None, plane=0):
+
+        '''Return the cache key of the given file, and of the HDU and plane for FITS files.'''
+
+        digest = hashlib.blake2b(digest_size=16)
+
+        file = open(filepath, 'rb')
+
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            digest.update(chunk)
+
+        file.close()
+
+        stat = os.stat(filepath)
+        digest.update('{:d},{:d},{},{:d}'.format(stat.st_mtime_ns, stat.st_size, hdu, plane).encode('ascii'))
+
+        return digest.hexdigest()
+
+    def readFrame(self, filepath, getPattern=False, hdu=None, plane=0):
+
+        '''
+        Return the decoded frame in the same form as "readFrame" in aplab_frame_reader,
+        from the cache if possible. Otherwise the file is decoded and added to the cache.
+        Can be called from worker processes.
+        '''
+
+        key = self.getKey(filepath, hdu=hdu, plane=plane)
+
+        decoded = self.get(key)
+
+        # A frame cached without a CFA pattern is decoded again if the pattern is needed
+        if decoded is not None and not (getPattern and decoded[2] and decoded[3] is None):
+            return decoded
+
+        # Detect the CFA pattern of raw files, so that it is available later
+        isRaw = filepath.split('.')[-1].lower() not in ['tif', 'tiff', 'fit', 'fits']
+
+        decoded = apfr.readFrame(filepath, getPattern=(getPattern or isRaw), hdu=hdu, plane=plane)
+
+        try:
+            self.put(key, decoded)
+        except (OSError, TypeError, ValueError):
+            # A full disk or unusual metadata only prevents caching
+            pass
+
+        return decoded
+
+    def get(self, key):
+
+        '''Return the cached frame with the given key, or None if it is not cached.'''
+
+        imgpath = os.path.join(self.directory, key + '.npy')
+        infopath = os.path.join(self.directory, key + '.json')
+
+        try:
+            file = open(infopath, 'r')
+            info = json.load(file)
+            file.close()
+
+            img = np.load(imgpath, mmap_mode='r')
+
+            # Mark as recently used
+            os.utime(imgpath, None)
+
+        except (OSError, ValueError):
+            return None
+
+        return img, info['metadata'], info['isExif'], info['pattern']
+
+    def put(self, key, decoded):
+
+        '''Store the decoded frame under the given key, and evict old frames if necessary.'''
+
+        img, metadata, isExif, pattern = decoded
+
+        info = {'metadata' : {k : str(metadata[k]) for k in CACHED_KEYS if k in metadata},
+                'isExif' : isExif, 'pattern' : pattern}
+
+        imgpath = os.path.join(self.directory, key + '.npy')
+        infopath = os.path.join(self.directory, key + '.json')
+
+        # Write to temporary files first, so that other processes never see partial files
+        tag = '.{:d}.tmp'.format(os.getpid())
+
+        file = open(imgpath + tag, 'wb')
+        np.save(file, np.ascontiguousarray(img), allow_pickle=False)
+        file.close()
+
+        file = open(infopath + tag, 'w')
+        json.dump(info, file)
+        file.close()
+
+        os.replace(infopath + tag, infopath)
+        os.replace(imgpath + tag, imgpath)
+
+        self.evict()
+
+    def evict(self):
+
+        '''Delete the least recently used frames until the cache is within the size limit.'''
+
+        entries = []
+        total = 0
+
+        for name in os.listdir(self.directory):
+
+            if not name.endswith('.npy'):
+                continue
+
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+
+            entries.append((stat.st_mtime, stat.st_size, name[:-4]))
+            total += stat.st_size
+
+        entries.sort()
+
+        # Keep at least the most recently used frame
+        for mtime, size, key in entries[:-1]:
+
+            if total <= self.max_size:
+                break
+
+            for extension in ['.npy', '.json']:
+                try:
+                    os.remove(os.path.join(self.directory, key + extension))
+                except OSError:
+                    # The file may be in use or already removed by another process
+                    pass
+
+            total -= size
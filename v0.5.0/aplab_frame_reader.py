@@ -0,0 +1,282 @@
+# -*- coding: utf-8 -*-
+
+import io
+import re
+import subprocess
+import numpy as np
+from PIL import Image
+import astropy.io.fits as pyfits
+import exifread
+
+# Use LibRaw for in-process decoding if it is installed
+try:
+    import rawpy
+    has_rawpy = True
+except ImportError:
+    has_rawpy = False
+
+# dcraw options for writing the undemosaiced, unscaled raw data as a 16-bit TIFF to stdout
+DCRAW_ARGS = ['-4', '-o', '0', '-D', '-t', '0', '-k', '0', '-H', '1', '-T', '-j', '-W', '-c']
+
+CFA_PATTERNS = ['RGGB', 'BGGR', 'GRBG', 'GBRG']
+
+def readFrame(filepath, getPattern=False, hdu=None, plane=0):
+
+    '''
+    Read image data and metadata from a raw, TIFF or FITS file. Returns the image data,
+    the metadata, whether the metadata are Exif tags (rather than a FITS header) and
+    the CFA pattern.
+    For FITS files, the HDU and the plane of a data cube to read can be given.
+    '''
+
+    extension = filepath.split('.')[-1].lower()
+
+    if extension in ['tif', 'tiff']:
+
+        img, tags = readTiff(filepath)
+
+        return img, tags, True, None
+
+    elif extension in ['fit', 'fits']:
+
+        img, header = readFits(filepath, hdu=hdu, plane=plane)
+
+        return img, header, False, None
+
+    else:
+
+        img, tags, pattern = readRaw(filepath, getPattern)
+
+        return img, tags, True, pattern
+
+def readMetadata(filepath):
+
+    '''
+    Read only the metadata of a raw, TIFF or FITS file, without decoding the image data.
+    Returns the metadata and whether they are Exif tags (rather than a FITS header).
+    '''
+
+    if filepath.split('.')[-1].lower() in ['fit', 'fits']:
+        return pyfits.getheader(filepath), False
+
+    file = open(filepath, 'rb')
+    tags = exifread.process_file(file, details=False)
+    file.close()
+
+    return tags, True
+
+def readTiff(filepath):
+
+    '''Read image data and Exif tags from a TIFF file.'''
+
+    img = np.array(Image.open(filepath))
+
+    file = open(filepath, 'rb')
+    tags = exifread.process_file(file, details=False)
+    file.close()
+
+    return img, tags
+
+def imageShape(shape):
+
+    '''
+    Return the shape of FITS image data with more than two axes without its axes of length
+    one, keeping the last three of the remaining axes. Other shapes are returned unchanged.
+    '''
+
+    return tuple(n for n in shape if n > 1)[-3:] if len(shape) > 2 else tuple(shape)
+
+def fitsImages(filepath):
+
+    '''
+    Return the index, name and shape of each HDU of a FITS file that contains an image
+    or a data cube. Only the headers are read.
+    '''
+
+    images = []
+
+    hdulist = pyfits.open(filepath, memmap=True)
+
+    for i, hdu in enumerate(hdulist):
+
+        if isinstance(hdu, (pyfits.PrimaryHDU, pyfits.ImageHDU, pyfits.CompImageHDU)):
+
+            shape = imageShape(hdu.shape)
+
+            if len(shape) >= 2:
+                images.append((i, hdu.name, shape))
+
+    hdulist.close()
+
+    return images
+
+def readFits(filepath, hdu=None, plane=0):
+
+    '''
+    Read a plane of image data and the header from a FITS file. The first HDU containing
+    image data is used unless an HDU index is given. The data are memory-mapped, so only
+    the selected plane of a data cube is read, and integer data stay integers.
+    '''
+
+    hdulist = pyfits.open(filepath, memmap=True, do_not_scale_image_data=True)
+
+    if hdu is None:
+        images = fitsImages(filepath)
+        hdu = images[0][0] if len(images) > 0 else 0
+
+    header = hdulist[hdu].header
+
+    # Keywords like the exposure time are often only in the primary header
+    if hdu != 0:
+        header = hdulist[0].header.copy()
+        header.update(hdulist[hdu].header)
+
+    bscale = hdulist[hdu].header.get('BSCALE', 1)
+    bzero = hdulist[hdu].header.get('BZERO', 0)
+
+    data = hdulist[hdu].data
+
+    hdulist.close()
+
+    # Select plane of a data cube, ignoring axes of length one as "fitsImages" does
+    if data.ndim > 2:
+
+        data = data.reshape(tuple(n for n in data.shape if n > 1))
+
+        while data.ndim > 3:
+            data = data[0]
+
+        if data.ndim == 3:
+            data = data[plane]
+
+    return scaleFitsData(data, bscale, bzero), header
+
+def scaleFitsData(data, bscale, bzero):
+
+    '''
+    Apply the BSCALE and BZERO keywords to stored FITS data. Integer data with an integer
+    offset, like unsigned 16-bit data stored as signed integers, are kept as integers of
+    the smallest sufficient type. Otherwise the data are converted to single precision.
+    '''
+
+    if bscale == 1 and bzero == 0:
+        return data
+
+    if np.issubdtype(data.dtype, np.integer) and bscale == 1 and bzero == int(bzero):
+
+        bzero = int(bzero)
+        info = np.iinfo(data.dtype)
+
+        # The usual way of storing unsigned integers, where the offset just flips the sign bit
+        if info.min < 0 and bzero == -info.min:
+            data = data.astype(data.dtype.newbyteorder('=')).view('uint{:d}'.format(info.bits))
+            data ^= 1 << (info.bits - 1)
+            return data
+
+        dtype = np.promote_types(np.min_scalar_type(info.min + bzero), np.min_scalar_type(info.max + bzero))
+
+        return data.astype(dtype) + np.array(bzero, dtype=dtype)
+
+    return data.astype(np.float32)*np.float32(bscale) + np.float32(bzero)
+
+def readRaw(filepath, getPattern=True):
+
+    '''
+    Decode a DSLR raw file without writing anything to disk. Returns the raw
+    pixel values, the Exif tags (with ISO and exposure time) and the CFA pattern,
+    which is None if it is not requested or could not be detected.
+    '''
+
+    if has_rawpy:
+        return readRawLibRaw(filepath, getPattern)
+    else:
+        return readRawDcraw(filepath, getPattern)
+
+def readRawLibRaw(filepath, getPattern):
+
+    '''Decode raw file in-process with LibRaw.'''
+
+    with rawpy.imread(filepath) as raw:
+
+        img = raw.raw_image_visible.copy()
+
+        pattern = None
+
+        if getPattern:
+
+            # Translate the colour indices of the upper left 2x2 pixels to a pattern string
+            desc = raw.color_desc.decode('ascii')
+            colours = raw.raw_colors_visible[:2, :2].flatten()
+            pattern = ''.join([desc[c] for c in colours]).upper()
+
+    # Only the header of the raw file is needed to get the Exif tags
+    file = open(filepath, 'rb')
+    tags = exifread.process_file(file, details=False)
+    file.close()
+
+    return img, tags, (pattern if pattern in CFA_PATTERNS else None)
+
+def readRawDcraw(filepath, getPattern):
+
+    '''Decode raw file by streaming the TIFF produced by dcraw directly into memory.'''
+
+    process = subprocess.Popen(['dcraw'] + DCRAW_ARGS + [filepath], stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE)
+    data = process.communicate()[0]
+
+    if process.returncode != 0 or len(data) == 0:
+        raise IOError('dcraw could not decode "{}".'.format(filepath))
+
+    # The TIFF written by dcraw contains the ISO and exposure time
+    buffer = io.BytesIO(data)
+    tags = exifread.process_file(buffer, details=False)
+
+    buffer.seek(0)
+    img = np.array(Image.open(buffer))
+
+    pattern = readPatternDcraw(filepath) if getPattern else None
+
+    return img, tags, pattern
+
+def readPatternDcraw(filepath):
+
+    '''Get the CFA pattern of the raw file from the dcraw file information.'''
+
+    metadata = subprocess.check_output(['dcraw', '-i', '-v', filepath]).decode('UTF-8')
+
+    for line in metadata.split('\n'):
+
+        parts = line.split(': ')
+
+        if parts[0] == 'Filter pattern' and len(parts) > 1:
+
+            pattern = (re.sub(r'[^a-zA-Z]', '', parts[1])[:4]).upper()
+
+            return pattern if pattern in CFA_PATTERNS else None
+
+    return None
+
+def cfaChannels(pattern):
+
+    '''
+    Return the names of the CFA channels at the upper left, upper right, lower left and
+    lower right pixel of each 2x2 block. The first green pixel in a block is G1.
+    '''
+
+    channels = []
+
+    for colour in pattern.upper():
+        channels.append(colour if colour != 'G' else ('G2' if 'G1' in channels else 'G1'))
+
+    return channels
+
+def cfaPlanes(img, pattern):
+
+    '''
+    Return the four CFA planes of a raw frame as strided views of the frame, in a
+    dictionary with the channel names as keys. No pixel data is copied.
+    '''
+
+    channels = cfaChannels(pattern)
+
+    return {channels[i]: img[i//2::2, i%2::2] for i in range(4)}
\ No newline at end of file
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+
+import os
+import numpy as np
+
+class FrameStore:
+
+    def __init__(self, directory):
+
+        '''Initialize store of raw frames kept as memory-mapped files in the given directory.'''
+
+        self.directory = directory
+
+        self.frames = {} # Memory-mapped raw frame for each key
+        self.paths = {}  # Path of the file backing each frame
+        self.stale = []  # Files that could not be removed because they were still mapped
+
+        self.count = 0 # Used to give every written file a unique name
+
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+    def __contains__(self, key):
+
+        return key in self.frames
+
+    def add(self, key, img):
+
+        '''Write the raw frame to a memory-mapped file and return a read-only view of it.'''
+
+        self.remove(key)
+
+        self.count += 1
+        path = os.path.join(self.directory, '{}_{:d}.npy'.format(key, self.count))
+
+        # Copy the frame into the file with its original data type
+        mm = np.lib.format.open_memmap(path, mode='w+', dtype=img.dtype, shape=img.shape)
+        mm[...] = img
+        mm.flush()
+        del mm
+
+        self.frames[key] = np.load(path, mmap_mode='r')
+        self.paths[key] = path
+
+        return self.frames[key]
+
+    def get(self, key):
+
+        '''Return a zero-copy view of the raw frame stored under the given key.'''
+
+        return self.frames[key]
+
+    def move(self, key, new_key):
+
+        '''Store the frame under a new key, replacing any frame already stored there.'''
+
+        self.remove(new_key)
+
+        self.frames[new_key] = self.frames.pop(key)
+        self.paths[new_key] = self.paths.pop(key)
+
+    def remove(self, key):
+
+        '''Forget the frame stored under the given key and delete its file.'''
+
+        if key not in self.frames:
+            return None
+
+        del self.frames[key]
+        self.stale.append(self.paths.pop(key))
+
+        self.deleteStale()
+
+    def clear(self):
+
+        '''Forget all stored frames and delete their files.'''
+
+        for key in list(self.frames.keys()):
+            self.remove(key)
+
+        self.deleteStale()
+
+    def deleteStale(self):
+
+        '''Delete the files of forgotten frames that are no longer mapped.'''
+
+        remaining = []
+
+        for path in self.stale:
+
+            try:
+                os.remove(path)
+            except OSError:
+                # On Windows the file stays locked while a view of it is alive
+                if os.path.exists(path):
+                    remaining.append(path)
+
+        self.stale = remaining
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+GRID_QUANTITIES = ['Median', 'Mean', 'Noise', 'Maximum'] # Statistics computed for every block
+
+def blockShape(shape, nx, ny):
+
+    '''
+    Return the height and width of the blocks when an image of the given shape is divided into
+    ny rows and nx columns of blocks. Rows and columns of pixels left over at the lower and
+    right edges are not part of any block.
+    '''
+
+    return shape[0]//ny, shape[1]//nx
+
+def gridStatistics(img, nx, ny, mask=None):
+
+    '''
+    Return the median, mean, standard deviation and maximum of the pixel values in each block
+    when the image is divided into ny rows and nx columns of blocks, as a dictionary with the
+    names in GRID_QUANTITIES as keys and arrays of shape (ny, nx) as values. Each row of blocks
+    is reshaped so that the statistics of all its blocks are computed together, without
+    copying more than one row of blocks at a time. Pixels where the mask is true are left out.
+    '''
+
+    bh, bw = blockShape(img.shape, nx, ny)
+
+    if bh == 0 or bw == 0:
+        raise ValueError('The image is too small for a {:d}x{:d} grid.'.format(nx, ny))
+
+    grid = {quantity: np.empty((ny, nx)) for quantity in GRID_QUANTITIES}
+
+    for j in range(ny):
+
+        strip = img[j*bh:(j+1)*bh, :nx*bw]
+
+        # Gather the pixels of each block along the last axis
+        blocks = strip.reshape(bh, nx, bw).transpose(1, 0, 2).reshape(nx, bh*bw)
+
+        if mask is None:
+
+            grid['Median'][j] = np.median(blocks, axis=1)
+            grid['Mean'][j] = np.mean(blocks, axis=1, dtype=np.float64)
+            grid['Noise'][j] = np.std(blocks, axis=1, dtype=np.float64)
+            grid['Maximum'][j] = np.max(blocks, axis=1)
+
+        else:
+
+            blocks = blocks.astype(np.float32)
+            blocks[mask[j*bh:(j+1)*bh, :nx*bw].reshape(bh, nx, bw).transpose(1, 0, 2).reshape(nx, bh*bw)] = np.nan
+
+            grid['Median'][j] = np.nanmedian(blocks, axis=1)
+            grid['Mean'][j] = np.nanmean(blocks, axis=1, dtype=np.float64)
+            grid['Noise'][j] = np.nanstd(blocks, axis=1, dtype=np.float64)
+            grid['Maximum'][j] = np.nanmax(blocks, axis=1)
+
+    return grid
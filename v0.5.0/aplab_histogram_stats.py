@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+
+import concurrent.futures
+import numpy as np
+
+BLOCK_SIZE = 1 << 20 # Number of pixels counted at a time when computing histograms
+
+def hasHistogram(img):
+
+    '''Return whether order statistics of the image can be computed from a histogram.'''
+
+    return np.issubdtype(img.dtype, np.integer) and img.dtype.itemsize <= 2
+
+def histogram(img):
+
+    '''
+    Return the histogram of an 8- or 16-bit integer image, with one bin per integer value,
+    and the value of the first bin. The pixels are counted in blocks of rows, so
+    the memory use does not grow with the size of the image.
+    '''
+
+    img = np.asarray(img)
+
+    offset = int(np.iinfo(img.dtype).min)
+    length = int(np.iinfo(img.dtype).max) - offset + 1
+
+    hist = np.zeros(length, dtype=np.int64)
+
+    rows = max(BLOCK_SIZE//max(img.shape[-1], 1), 1)
+
+    for i in range(0, img.shape[0], rows):
+
+        block = img[i:i+rows].ravel()
+
+        if offset != 0:
+            block = block.astype(np.int32) - offset
+
+        hist += np.bincount(block, minlength=length)
+
+    return hist, offset
+
+def histogramValues(hist, indices, offset=0):
+
+    '''Return the values at the given indices of the sorted pixel values counted in the histogram.'''
+
+    return np.searchsorted(np.cumsum(hist), np.asarray(indices) + 1) + offset
+
+def histogramPercentile(hist, q, offset=0):
+
+    '''
+    Return the q-th percentile of the pixel values counted in the histogram,
+    interpolated between sorted values in the same way as "np.percentile".
+    '''
+
+    n = np.sum(hist)
+
+    pos = np.asarray(q, dtype=np.float64)/100.0*(n - 1)
+    lo = np.floor(pos).astype(np.int64)
+    hi = np.ceil(pos).astype(np.int64)
+
+    v_lo = histogramValues(hist, lo, offset)
+    v_hi = histogramValues(hist, hi, offset)
+
+    return v_lo + (v_hi - v_lo)*(pos - lo)
+
+def histogramMedian(hist, offset=0):
+
+    '''Return the median of the pixel values counted in the histogram.'''
+
+    return float(histogramPercentile(hist, 50, offset))
+
+def histogramMAD(hist, offset=0):
+
+    '''Return the median absolute deviation from the median of the pixel values counted in the histogram.'''
+
+    median = histogramMedian(hist, offset)
+
+    # Bin closest to the median from below, and whether the median lies between two bins
+    centre = int(np.floor(median)) - offset
+    isHalf = median - np.floor(median) > 0
+
+    # Fold the histogram around the median to get a histogram of absolute deviations,
+    # where bin k holds the deviation k (or k + 1/2 if the median lies between two bins)
+    above = hist[centre + 1:]
+    below = hist[centre::-1] if isHalf else hist[centre - 1::-1] if centre > 0 else hist[:0]
+    start = 0 if isHalf else 1
+
+    deviations = np.zeros(start + max(len(above), len(below)), dtype=np.int64)
+    deviations[start:start + len(above)] += above
+    deviations[start:start + len(below)] += below
+
+    if not isHalf: deviations[0] = hist[centre]
+
+    # With a median between bins, the smallest deviation is one half
+    return histogramMedian(deviations) + (0.5 if isHalf else 0.0)
+
+def mosaicHistograms(img, exclude=None, cancel=None):
+
+    '''
+    Return the histograms of the pixels at each of the four positions in the 2x2 blocks
+    of an 8- or 16-bit integer image (upper left, upper right, lower left, lower right),
+    and the value of the first bin. All four histograms are counted in a single pass.
+    Pixels where the boolean exclude mask is true are left out. Raises CancelledError between
+    blocks once the given cancel event (a threading.Event) is set.
+    '''
+
+    img = np.asarray(img)
+
+    offset = int(np.iinfo(img.dtype).min)
+    length = int(np.iinfo(img.dtype).max) - offset + 1
+
+    hists = np.zeros(4*length, dtype=np.int64)
+
+    # Use an even number of rows per block so that row parities stay the same
+    rows = max(2*(BLOCK_SIZE//max(2*img.shape[-1], 1)), 2)
+
+    # Bin offset of each position in a block of rows
+    positions = ((np.arange(rows) % 2)[:, np.newaxis]*2 + (np.arange(img.shape[1]) % 2)[np.newaxis, :])*length
+
+    for i in range(0, img.shape[0], rows):
+
+        if cancel is not None and cancel.is_set():
+            raise concurrent.futures.CancelledError()
+
+        block = img[i:i+rows]
+
+        hists += np.bincount((block + (positions[:block.shape[0]] - offset)).ravel(), minlength=4*length)
+
+    # Take the few excluded pixels out again
+    if exclude is not None:
+        ys, xs = np.nonzero(exclude)
+        values = img[ys, xs].astype(np.int64) - offset
+        hists -= np.bincount(((ys % 2)*2 + xs % 2)*length + values, minlength=4*length)
+
+    return hists.reshape(4, length), offset
+
+def histogramMoments(hist, offset=0):
+
+    '''
+    Return the number of counted pixel values and their mean, standard
+    deviation, minimum and maximum, computed from the histogram.
+    '''
+
+    n = int(np.sum(hist))
+
+    if n == 0: return 0, np.nan, np.nan, np.nan, np.nan
+
+    values = np.arange(len(hist), dtype=np.float64)
+    nonzero = np.nonzero(hist)[0]
+
+    # Moments about the first bin, to keep the numbers small
+    mean = np.dot(hist, values)/n
+    var = max(np.dot(hist, (values - mean)**2)/n, 0.0)
+
+    return n, mean + offset, np.sqrt(var), nonzero[0] + offset, nonzero[-1] + offset
+
+class HistogramStatistics:
+
+    def __init__(self, max_regions=16):
+
+        '''
+        Initialize cache of histograms of frames and regions of frames, used to compute exact
+        medians and percentiles of integer frames. Histograms of the most recently
+        used regions are kept, while those of entire frames are kept until removed.
+        '''
+
+        self.max_regions = max_regions
+
+        self.frames = {}  # Histogram and offset of each entire frame
+        self.regions = {} # Histogram and offset of each (key, region) pair, oldest first
+
+    def getHistogram(self, key, img, region=None):
+
+        '''
+        Return the histogram and offset of the given region (x1, x2, y1, y2) of the frame stored
+        under the given key, or of the entire frame if no region is given.
+        '''
+
+        if region is None:
+
+            if key not in self.frames:
+                self.frames[key] = histogram(img)
+
+            return self.frames[key]
+
+        region = tuple(int(v) for v in region)
+
+        if (key, region) in self.regions:
+            # Mark region as recently used
+            self.regions[(key, region)] = self.regions.pop((key, region))
+        else:
+            self.regions[(key, region)] = histogram(img[region[2]:region[3], region[0]:region[1]])
+
+            while len(self.regions) > self.max_regions:
+                del self.regions[next(iter(self.regions))]
+
+        return self.regions[(key, region)]
+
+    def setHistogram(self, key, hist, offset=0):
+
+        '''Store an already computed histogram of an entire frame.'''
+
+        self.frames[key] = (hist, offset)
+
+    def median(self, key, img, region=None):
+
+        '''Return the median of the given region of the frame.'''
+
+        if not hasHistogram(img):
+            return np.median(self.crop(img, region))
+
+        return histogramMedian(*self.getHistogram(key, img, region))
+
+    def percentile(self, key, img, q, region=None):
+
+        '''Return the q-th percentile of the given region of the frame.'''
+
+        if not hasHistogram(img):
+            return np.percentile(self.crop(img, region), q)
+
+        hist, offset = self.getHistogram(key, img, region)
+
+        return histogramPercentile(hist, q, offset)
+
+    def mad(self, key, img, region=None):
+
+        '''Return the median absolute deviation of the given region of the frame.'''
+
+        if not hasHistogram(img):
+            crop = self.crop(img, region)
+            return np.median(np.abs(crop - np.median(crop)))
+
+        return histogramMAD(*self.getHistogram(key, img, region))
+
+    def crop(self, img, region):
+
+        '''Return the given region of the image.'''
+
+        return img if region is None else img[region[2]:region[3], region[0]:region[1]]
+
+    def remove(self, key):
+
+        '''Forget all histograms of the frame stored under the given key.'''
+
+        self.frames.pop(key, None)
+
+        for cached in [cached for cached in self.regions if cached[0] == key]:
+            del self.regions[cached]
+
+    def move(self, key, new_key):
+
+        '''Store the histograms of a frame under a new key, replacing any stored there.'''
+
+        self.remove(new_key)
+
+        if key in self.frames:
+            self.frames[new_key] = self.frames.pop(key)
+
+        for cached in [cached for cached in self.regions if cached[0] == key]:
+            self.regions[(new_key, cached[1])] = self.regions.pop(cached)
+
+    def clear(self):
+
+        '''Forget all histograms.'''
+
+        self.frames = {}
+        self.regions = {}
@@ -5,18 +5,30 @@ import tkinter.ttk as ttk
 import tkinter.filedialog
 import sys
 import os
-import subprocess
-import re
 import atexit
+import threading
+import concurrent.futures
 import numpy as np
 import matplotlib
 import matplotlib.pyplot as plt
-import matplotlib.image as mpimg
-from PIL import Image, ImageTk
-import astropy.io.fits as pyfits
-import exifread
+from PIL import ImageTk
 import aplab_common as apc
+import aplab_background_model as apbm
+import aplab_frame_reader as apfr
+import aplab_grid_stats as apgs
+import aplab_histogram_stats as aphs
+import aplab_night_analysis as apna
+import aplab_pattern_noise as appn
+import aplab_photon_transfer as appt
+import aplab_pixel_maps as appm
+import aplab_robust_stats as aprs
+import aplab_sample_stats as aps
+import aplab_stacking as apst
 from aplab_common import C
+from aplab_display_pyramid import DisplayPyramid
+from aplab_frame_cache import FrameCache
+from aplab_frame_store import FrameStore
+from aplab_region_stats import RegionStatistics
 from aplab_image_calculator import ImageCalculator
 from aplab_image_simulator import ImageSimulator
 from aplab_plotting_tool import PlottingTool
@@ -31,6 +43,21 @@ class ImageAnalyser(ttk.Frame):
 
         self.cont = controller
 
+        # Memory-mapped raw data of the added frames
+        self.frameStore = FrameStore('aplab_temp')
+
+        # Decoded frames kept between sessions, so that files are only decoded once
+        self.frameCache = FrameCache('aplab_cache', max_size=C.FRAME_CACHE_SIZE)
+
+        # Cached histograms of the added frames, used for medians
+        self.histStats = aphs.HistogramStatistics()
+
+        # Per-pixel read noise and dark maps, used to leave hot and warm pixels out of statistics
+        self.pixelMaps = None
+        self.varExcludeBad = tk.IntVar()
+        self.varSigmaClip = tk.IntVar()
+        self.varApproxStats = tk.IntVar()
+
         #self.cont.protocol('WM_DELETE_WINDOW', lambda: self.deleteTemp(True))
         atexit.register(lambda: self.deleteTemp(True))
 
@@ -57,7 +84,6 @@ class ImageAnalyser(ttk.Frame):
 
         self.mode = 'select'
         self.noInput = True # True if no files are added
-        self.useGreen = None # Used to decide which CFA colour to extract
         self.CFAPattern = None # Used to decide the CFA pattern of the colour camera
         self.currentImage = None # ID for the currently showing canvas image
         self.selectionBox = None # ID for the canvas selection box
@@ -67,7 +93,12 @@ class ImageAnalyser(ttk.Frame):
         self.previousPath = os.path.expanduser('~/Pictures') # Default file path
         self.busy = False # True when a topwindow is showing to disable use of other widgets
         self.currentCCDType = 'mono' # Camera type for the added images
-        self.showResized = False # True when the displayed image is resized
+        self.showResized = False # True when the displayed image is resized to fit the window
+        self.zoom = 1.0 # Scale of the displayed image relative to the raw image
+        self.renderPending = False # True when the visible part of the image is about to be redrawn
+
+        # Available zoom factors
+        self.zoomSteps = [1.0/16, 1.0/8, 1.0/4, 1.0/2, 1.0, 2.0, 4.0, 8.0]
 
         # Define values to keep track of number of added files
         self.displayed_bias = 0
@@ -173,6 +204,8 @@ class ImageAnalyser(ttk.Frame):
                                         command=self.updateFrameButtonText)
         self.buttonAdd = ttk.Button(frameLeft, textvariable=self.varAddButtonLabel,
                                     command=self.addImage)
+        self.buttonAddBatch = ttk.Button(frameLeft, text='Add multiple frames',
+                                         command=self.addImageBatch)
 
         if not C.is_win:
             self.optionAdd.config(width=10)
@@ -192,6 +225,21 @@ class ImageAnalyser(ttk.Frame):
         self.buttonCompute = ttk.Button(frameLeft, text='Compute sensor data',
                                         command=self.computeSensorData, width=19)
 
+        self.buttonPTC = ttk.Button(frameLeft, text='Photon transfer curve',
+                                    command=self.computePhotonTransfer, width=19)
+
+        self.buttonSweep = ttk.Button(frameLeft, text='ISO sweep',
+                                      command=self.sweepSensorISOs, width=19)
+
+        self.buttonMaps = ttk.Button(frameLeft, text='Pixel maps',
+                                     command=self.buildPixelMaps, width=19)
+
+        self.buttonStack = ttk.Button(frameLeft, text='Stack frames',
+                                      command=self.stackFrames, width=19)
+
+        self.buttonNight = ttk.Button(frameLeft, text='Analyse night folder',
+                                      command=self.analyseNightFolder, width=19)
+
         # Define file frame widgets
 
         self.frameBias = ttk.Frame(self.frameFiles, style='files.TFrame')
@@ -268,12 +316,18 @@ class ImageAnalyser(ttk.Frame):
         labelAdd.pack(side='top', pady=(10*C.scsy, 0))
         self.optionAdd.pack(side='top', pady=(5*C.scsy, 5*C.scsy))
         self.buttonAdd.pack(side='top')
+        self.buttonAddBatch.pack(side='top', pady=(5*C.scsy, 0))
 
         labelFiles.pack(side='top', pady=(10*C.scsy, 5*C.scsy))
         self.frameFiles.pack(side='top', fill='both', expand=True)
 
         self.buttonClear.pack(side='top', pady=(10*C.scsy, 5*C.scsy))
-        self.buttonCompute.pack(side='top', pady=(0, 10*C.scsy))
+        self.buttonCompute.pack(side='top', pady=(0, 5*C.scsy))
+        self.buttonPTC.pack(side='top', pady=(0, 5*C.scsy))
+        self.buttonSweep.pack(side='top', pady=(0, 5*C.scsy))
+        self.buttonMaps.pack(side='top', pady=(0, 5*C.scsy))
+        self.buttonStack.pack(side='top', pady=(0, 5*C.scsy))
+        self.buttonNight.pack(side='top', pady=(0, 10*C.scsy))
 
         # *** Right frame ***
 
@@ -291,8 +345,11 @@ class ImageAnalyser(ttk.Frame):
                                        yscrollcommand=self.scrollbarCanvVer.set, xscrollincrement='1',
                                        yscrollincrement='1', background=C.DEFAULT_BG)
 
-        self.scrollbarCanvHor.config(command=self.canvasDisplay.xview)
-        self.scrollbarCanvVer.config(command=self.canvasDisplay.yview)
+        self.scrollbarCanvHor.config(command=self.scrollCanvasX)
+        self.scrollbarCanvVer.config(command=self.scrollCanvasY)
+
+        # Only the visible part of the image is drawn, so redraw when the visible area changes
+        self.canvasDisplay.bind('<Configure>', lambda event: self.scheduleRender())
 
         self.canvasDisplay.bind('<Button-1>', self.createSelectionBoxEvent)
         self.canvasDisplay.bind('<B1-Motion>', self.drawSelectionBoxEvent)
@@ -325,6 +382,8 @@ class ImageAnalyser(ttk.Frame):
         self.menuRC = tk.Menu(self.canvasDisplay, tearoff=0)
         self.menuRC.add_command(label='Show at 1:1 scale', command=self.useFullImage)
         self.menuRC.add_command(label='Fit to window', command=self.useResImage)
+        self.menuRC.add_command(label='Zoom in', command=lambda: self.zoomImage(1))
+        self.menuRC.add_command(label='Zoom out', command=lambda: self.zoomImage(-1))
         self.menuRC.add_separator()
         self.menuRC.add_command(label='"Select" mode', command=self.useSelectMode)
         self.menuRC.add_command(label='"Measure" mode', command=self.useMeasureMode)
@@ -333,6 +392,13 @@ class ImageAnalyser(ttk.Frame):
         self.menuRC.add_command(label='Show histogram', command=self.showHistogram)
         self.menuRC.add_command(label='Show statistics', command=self.getStatistics)
         self.menuRC.add_command(label='Transfer data to Image Calculator', command=self.transferData)
+        self.menuRC.add_command(label='Show grid statistics', command=self.showGridStatistics)
+        self.menuRC.add_command(label='Hide grid statistics', command=self.hideGridStatistics)
+        self.menuRC.add_command(label='Fit background model', command=self.fitBackgroundModel)
+        self.menuRC.add_command(label='Analyse pattern noise', command=self.analysePatternNoise)
+        self.menuRC.add_separator()
+        self.menuRC.add_checkbutton(label='Sigma-clip statistics', variable=self.varSigmaClip)
+        self.menuRC.add_checkbutton(label='Fast approximate statistics', variable=self.varApproxStats)
 
         # Clear selection state of file labels
         for label in self.labelList:
@@ -340,77 +406,164 @@ class ImageAnalyser(ttk.Frame):
             label.rightselected = False
             label.exposure = None
             label.iso = None
+            label.pyramid = None
+            label.regionStats = None
+            label.gridStats = None
 
     def useFullImage(self):
 
         '''Show the displayed images at 100%.'''
 
-        self.showResized = False
+        self.setZoom(1.0, False)
 
-        if self.mode == 'select':
-            self.useSelectMode()
-        elif self.mode == 'drag':
-            self.useDragMode()
+    def useResImage(self):
+
+        '''Show a resized version of the image.'''
 
-        self.menuRC.entryconfig(3, state='normal')
-        self.menuRC.entryconfig(5, state='normal')
-        self.menuRC.entryconfig(8, state='normal')
+        self.setZoom(None, True)
 
-        self.showImage(self.getSelectedLabel())
+    def zoomImage(self, direction):
 
-    def loadImage(self, label, filename=False):
+        '''Show the image at the next zoom step in the given direction.'''
 
-        '''Create an image resized to fit the window.'''
+        if direction > 0:
+            larger = [zoom for zoom in self.zoomSteps if zoom > self.zoom*1.001]
+            if len(larger) == 0: return None
+            self.setZoom(larger[0], False)
+        else:
+            smaller = [zoom for zoom in self.zoomSteps if zoom < self.zoom/1.001]
+            if len(smaller) == 0: return None
+            self.setZoom(smaller[-1], False)
 
-        self.varMessageLabel.set('Reading temporary image file..' if not filename \
-                                               else '{} - Reading temporary image file..'.format(filename))
-        self.labelMessage.configure(foreground='navy')
-        self.labelMessage.update_idletasks()
+    def setZoom(self, zoom, resized):
 
-        pil_img = Image.open('aplab_temp' + os.sep + self.labelNames[label] + '.png')
+        '''
+        Change the zoom factor of the displayed image, keeping the centre of the view in place.
+        Selections are only possible at 1:1 scale, and dragging only when not fitting to window.
+        '''
 
-        self.photo_img = ImageTk.PhotoImage(pil_img)
+        label = self.getSelectedLabel()
 
+        # Image coordinates of the centre of the view
         if self.showResized:
+            centre_x = 0.5*self.fullSize[0]
+            centre_y = 0.5*self.fullSize[1]
+        else:
+            centre_x = (self.canvasDisplay.canvasx(0) + 0.5*self.canvasDisplay.winfo_width())/self.zoom
+            centre_y = (self.canvasDisplay.canvasy(0) + 0.5*self.canvasDisplay.winfo_height())/self.zoom
 
-            self.varMessageLabel.set('Resizing..' if not filename else '{} - Resizing..'.format(filename))
-            self.labelMessage.configure(foreground='navy')
-            self.labelMessage.update_idletasks()
+        self.showResized = resized
+        if zoom is not None: self.zoom = zoom
 
-            w, h = pil_img.size
-            f = np.min([(self.scrollbarCanvHor.winfo_width() - 17.0)/w,
-                        self.scrollbarCanvVer.winfo_height()/float(h)])
+        self.canvasDisplay.delete(self.selectionBox)
+        self.localSelection = False
 
-            self.photo_img_res = ImageTk.PhotoImage(pil_img.resize((int(round(f*w)), int(round(f*h))),
-                                                    Image.ANTIALIAS))
+        isFull = not self.showResized and self.zoom == 1.0
 
-    def useResImage(self):
+        if self.mode == 'select':
+            if isFull:
+                self.useSelectMode()
+            else:
+                self.canvasDisplay.unbind('<Button-1>')
+                self.canvasDisplay.unbind('<B1-Motion>')
+                self.canvasDisplay.unbind('<ButtonRelease-1>')
+        elif self.mode == 'drag':
+            if self.showResized:
+                self.canvasDisplay.unbind('<Button-1>')
+                self.canvasDisplay.unbind('<B1-Motion>')
+            else:
+                self.useDragMode()
 
-        '''Show a resized version of the image.'''
+        self.menuRC.entryconfig(5, state=('normal' if isFull else 'disabled'))
+        self.menuRC.entryconfig(7, state=('disabled' if self.showResized else 'normal'))
+        self.menuRC.entryconfig(10, state=('normal' if isFull else 'disabled'))
 
-        self.showResized = True
+        self.showImage(label)
 
-        self.canvasDisplay.delete(self.selectionBox)
-        self.localSelection = False
+        if not self.showResized:
+            self.canvasDisplay.xview_moveto((centre_x*self.zoom - 0.5*self.canvasDisplay.winfo_width())
+                                            /max(self.imageSize[0], 1))
+            self.canvasDisplay.yview_moveto((centre_y*self.zoom - 0.5*self.canvasDisplay.winfo_height())
+                                            /max(self.imageSize[1], 1))
+            self.renderImage()
+
+    def scrollCanvasX(self, *args):
+
+        '''Scroll canvas horizontally and redraw the visible part of the image.'''
+
+        self.canvasDisplay.xview(*args)
+        self.scheduleRender()
+
+    def scrollCanvasY(self, *args):
+
+        '''Scroll canvas vertically and redraw the visible part of the image.'''
+
+        self.canvasDisplay.yview(*args)
+        self.scheduleRender()
+
+    def scheduleRender(self):
+
+        '''Redraw the visible part of the image once pending events have been handled.'''
+
+        if self.renderPending: return None
 
-        if self.mode != 'measure':
-            self.canvasDisplay.unbind('<Button-1>')
-            self.canvasDisplay.unbind('<B1-Motion>')
-            self.canvasDisplay.unbind('<ButtonRelease-1>')
+        self.renderPending = True
+        self.after_idle(self.renderImage)
 
-        self.menuRC.entryconfig(3, state='disabled')
-        self.menuRC.entryconfig(5, state='disabled')
-        self.menuRC.entryconfig(8, state='disabled')
+    def renderImage(self):
+
+        '''Draw the part of the image pyramid of the selected label that is visible in the canvas.'''
+
+        self.renderPending = False
 
         label = self.getSelectedLabel()
 
-        self.showImage(label)
+        if label is None or label.pyramid is None: return None
+
+        if self.showResized:
+
+            # The whole image is visible and centered
+            x = 0
+            y = 0
+            w, h = self.imageSize
+
+        else:
+
+            x = self.canvasDisplay.canvasx(0)
+            y = self.canvasDisplay.canvasy(0)
+            w = self.canvasDisplay.winfo_width()
+            h = self.canvasDisplay.winfo_height()
+
+        pil_img = label.pyramid.render(self.zoom, x, y, w, h)
+
+        if pil_img is None: return None
+
+        self.photo_img = ImageTk.PhotoImage(pil_img)
+
+        self.canvasDisplay.delete(self.currentImage)
+
+        if self.showResized:
+            cw = self.scrollbarCanvHor.winfo_width() - 17.0
+            ch = self.scrollbarCanvVer.winfo_height()
+            self.currentImage = self.canvasDisplay.create_image(cw/2, ch/2, image=self.photo_img,
+                                                                anchor='center')
+        else:
+            self.currentImage = self.canvasDisplay.create_image(max(int(x), 0), max(int(y), 0),
+                                                                image=self.photo_img, anchor='nw')
+
+        # Keep drawings on top of the image
+        self.canvasDisplay.tag_lower(self.currentImage)
 
     def forgetAttributes(self, label):
 
         '''Clear label attributes, including the images related to the label.'''
 
         label.stretched_img = None
+        label.pyramid = None
+        label.regionStats = None
+        label.gridStats = None
+        label.hist = None
+        label.lut = None
         label.exposure = None
         label.iso = None
 
@@ -753,17 +906,14 @@ class ImageAnalyser(ttk.Frame):
 
                     try:
                         self.getImage(self.labelFlat1, flat1path, filename, 'flat',
-                                      splitCFA=(self.cont.isDSLR or self.varCCDType.get() == 'colour'))
+                                      hasCFA=(self.cont.isDSLR or self.varCCDType.get() == 'colour'))
                     except:
                         self.enableWidgets()
                         return None
 
                     self.displayed_flat = 1
 
-                    colour = ' (green)' if self.useGreen == True \
-                                       else (' (red)' if self.useGreen == False else '')
-
-                    self.varFlat1Label.set(self.adjustName(self.labelFlat1, filename + colour))
+                    self.varFlat1Label.set(self.adjustName(self.labelFlat1, filename))
                     self.varFlatHLabel.set('Flat frame')
 
                     self.frameFlat.pack(side='top', fill='x', anchor='w')
@@ -789,12 +939,9 @@ class ImageAnalyser(ttk.Frame):
                         self.enableWidgets()
                         return None
 
-                    colour = ' (green)' if self.useGreen == True \
-                                       else (' (red)' if self.useGreen == False else '')
-
                     try:
                         self.getImage(self.labelFlat2, flat2path, filename, 'flat',
-                                      splitCFA=(self.cont.isDSLR or self.varCCDType.get() == 'colour'),
+                                      hasCFA=(self.cont.isDSLR or self.varCCDType.get() == 'colour'),
                                       compare=self.labelFlat1)
                     except:
                         self.enableWidgets()
@@ -802,7 +949,7 @@ class ImageAnalyser(ttk.Frame):
 
                     self.displayed_flat = 2
 
-                    self.varFlat2Label.set(self.adjustName(self.labelFlat2, filename + colour))
+                    self.varFlat2Label.set(self.adjustName(self.labelFlat2, filename))
                     self.varFlatHLabel.set('Flat frames')
 
                     self.labelFlat2.pack(side='top', fill='x', anchor='w')
@@ -825,17 +972,14 @@ class ImageAnalyser(ttk.Frame):
 
                 try:
                     self.getImage(self.labelFlat1, flat1path, filename1, 'flat',
-                                  splitCFA=(self.cont.isDSLR or self.varCCDType.get() == 'colour'))
+                                  hasCFA=(self.cont.isDSLR or self.varCCDType.get() == 'colour'))
                 except:
                     self.enableWidgets()
                     return None
 
                 self.displayed_flat = 1
 
-                colour = ' (green)' if self.useGreen == True \
-                                   else (' (red)' if self.useGreen == False else '')
-
-                self.varFlat1Label.set(self.adjustName(self.labelFlat1, filename1 + colour))
+                self.varFlat1Label.set(self.adjustName(self.labelFlat1, filename1))
                 self.varFlatHLabel.set('Flat frames')
 
                 self.frameFlat.pack(side='top', fill='x', anchor='w')
@@ -850,7 +994,7 @@ class ImageAnalyser(ttk.Frame):
 
                 try:
                     self.getImage(self.labelFlat2, flat2path, filename2, 'flat',
-                                  splitCFA=(self.cont.isDSLR or self.varCCDType.get() == 'colour'),
+                                  hasCFA=(self.cont.isDSLR or self.varCCDType.get() == 'colour'),
                                   compare=self.labelFlat1)
                 except:
                     self.enableWidgets()
@@ -858,7 +1002,7 @@ class ImageAnalyser(ttk.Frame):
 
                 self.displayed_flat = 2
 
-                self.varFlat2Label.set(self.adjustName(self.labelFlat2, filename2 + colour))
+                self.varFlat2Label.set(self.adjustName(self.labelFlat2, filename2))
 
                 self.labelFlat2.pack(side='top', fill='x', anchor='w')
 
@@ -899,17 +1043,14 @@ class ImageAnalyser(ttk.Frame):
 
             try:
                 self.getImage(self.labelLight, lightpath, filename, 'light',
-                              splitCFA=(self.cont.isDSLR or self.varCCDType.get() == 'colour'))
+                              hasCFA=(self.cont.isDSLR or self.varCCDType.get() == 'colour'))
             except:
                 self.enableWidgets()
                 return None
 
             self.displayed_light = 1
 
-            colour = ' (green)' if self.useGreen == True \
-                               else (' (red)' if self.useGreen == False else '')
-
-            self.varLightLabel.set(self.adjustName(self.labelLight, filename + colour))
+            self.varLightLabel.set(self.adjustName(self.labelLight, filename))
 
             self.labelLightH.pack(side='top', fill='x', anchor='w')
             self.labelLight.pack(side='top', fill='x', anchor='w')
@@ -977,1518 +1118,3082 @@ class ImageAnalyser(ttk.Frame):
         self.enableWidgets()
         self.noInput = False
 
-    def showCanvas(self):
+    def addImageBatch(self):
 
-        '''Show canvas widget and scrollbars.'''
+        '''Add files of several image types at once, decoding them in parallel.'''
 
-        self.labelCanv.pack_forget()
-        self.scrollbarCanvHor.pack(side='bottom', fill='x')
-        self.scrollbarCanvVer.pack(side='right', fill='y')
-        self.canvasDisplay.pack(side='left', fill='both', expand=True)
+        self.disableWidgets()
 
-    def disableWidgets(self):
+        supportedformats = self.supportedformats if self.cont.isDSLR \
+                                                 else [self.supportedformats[1]]
 
-        '''Disable widgets that can be interacted with.'''
+        files = tkinter.filedialog.askopenfilenames(filetypes=supportedformats,
+                                                    initialdir=self.previousPath)
 
-        self.radioCCDm.configure(state='disabled')
-        self.radioCCDc.configure(state='disabled')
-        self.optionAdd.configure(state='disabled')
-        self.buttonAdd.configure(state='disabled')
-        self.buttonClear.configure(state='disabled')
-        self.buttonCompute.configure(state='disabled')
-        for label in self.labelList:
-            label.configure(state='disabled')
+        # Do nothing if no files were selected
+        if len(files) == 0:
+            self.enableWidgets()
+            return None
 
-    def enableWidgets(self):
+        self.previousPath = '/'.join(files[-1].split('/')[:-1])
 
-        '''Enable widgets that can be interacted with.'''
+        filenames = [filepath.split('/')[-1] for filepath in files]
 
-        try:
-            self.radioCCDm.configure(state='normal')
-            self.radioCCDc.configure(state='normal')
-            self.optionAdd.configure(state='normal')
-            self.buttonAdd.configure(state='normal')
-            self.buttonClear.configure(state='normal')
-            self.buttonCompute.configure(state='normal')
-            for label in self.labelList:
-                label.configure(state='normal')
-        except:
-            pass
+        maxcounts = {'Bias': 2, 'Dark': 2, 'Flat': 2, 'Light': 1, 'Saturated': 1}
+        displayed = {'Bias': self.displayed_bias, 'Dark': self.displayed_dark,
+                     'Flat': self.displayed_flat, 'Light': self.displayed_light,
+                     'Saturated': self.displayed_saturated}
 
-    def adjustName(self, label, name):
+        varState = tk.StringVar() # Set to "start", "decoded" or "cancel" to continue
+        varBatchMessage = tk.StringVar()
+        varTypes = []
+        varStatuses = []
 
-        '''Cut the filename if it reaches the end of the file frame.'''
+        varState.set('')
 
-        namewidth = self.cont.small_font.measure(name)
-        framewidth = self.frameFiles.winfo_width()*0.9
+        # Guess the image type of each file from its name
+        for filename in filenames:
 
-        if namewidth > framewidth:
+            varType = tk.StringVar()
+            varType.set(self.varImType.get())
 
-            apc.createToolTip(label, name, self.cont.tt_fs)
+            for type in self.imagetypes:
+                if type.lower()[:3] in filename.lower():
+                    varType.set(type)
+                    break
 
-            maxidx = int(np.floor(len(name)*framewidth/namewidth))
-            name = name[:maxidx] + '..'
+            varTypes.append(varType)
+            varStatuses.append(tk.StringVar())
 
-        else:
+        self.busy = True
 
-            label.unbind('<Enter>')
-            label.unbind('<Motion>')
-            label.unbind('<Leave>')
+        # Setup window for choosing image types and showing progress
 
-        return name
+        topBatch = tk.Toplevel(background=C.DEFAULT_BG)
+        topBatch.title('Add multiple frames')
+        self.cont.addIcon(topBatch)
+        apc.setupWindow(topBatch, 400, 140 + 25*len(files))
+        topBatch.protocol('WM_DELETE_WINDOW', lambda: varState.set('cancel'))
+        topBatch.focus_force()
 
-    def changeCCDType(self):
+        ttk.Label(topBatch, text='Choose the image type of each file.',
+                  anchor='center').pack(side='top', pady=(15*C.scsy, 5*C.scsy), expand=True)
 
-        '''Warn user that added data will be lost when changing camera type.'''
+        frameBatchFiles = ttk.Frame(topBatch)
+        frameBatchFiles.pack(side='top', expand=True)
 
-        # If files have been added
-        if not self.noInput:
+        optionTypes = []
 
-            def cmd():
-                self.clearFiles()
-                self.currentCCDType = self.varCCDType.get()
-                self.varMessageLabel.set('CCD type changed to {}.'.format(self.varCCDType.get()))
-                self.labelMessage.configure(foreground='navy')
+        for i in range(len(files)):
 
-            self.showWarning('Warning', 'Changing CCD type will\nremove added files. Proceed?',
-                             'Yes', 'Cancel', cmd)
+            ttk.Label(frameBatchFiles, text=filenames[i]).grid(row=i, column=0, sticky='W')
 
-            # Change camera type back to previous state if the window was exited
-            if self.varCCDType.get() != self.currentCCDType:
-                self.varCCDType.set(self.currentCCDType)
+            optionType = ttk.OptionMenu(frameBatchFiles, varTypes[i], None, *self.imagetypes)
+            optionType.grid(row=i, column=1, padx=5*C.scsx)
+            optionTypes.append(optionType)
 
-        else:
-            # Show message that the camera type was changed
-            self.varMessageLabel.set('CCD type changed to {}.'.format(self.varCCDType.get()))
-            self.labelMessage.configure(foreground='navy')
-            self.currentCCDType = self.varCCDType.get()
+            ttk.Label(frameBatchFiles, textvariable=varStatuses[i], width=10).grid(row=i, column=2,
+                                                                                  sticky='W')
 
-    def clearFiles(self):
+        buttonStart = ttk.Button(topBatch, text='Add', command=lambda: varState.set('start'))
+        buttonStart.pack(side='top', pady=(10*C.scsy, 5*C.scsy), expand=True)
 
-        '''Reset attributes and clear added files.'''
+        ttk.Label(topBatch, textvariable=varBatchMessage, font=self.cont.small_font,
+                  background=C.DEFAULT_BG).pack(side='top', pady=(0, 10*C.scsy), expand=True)
 
-        self.noInput = True
+        # Wait until the selected types give a valid combination of frames
+        while True:
 
-        self.useGreen = None
-        self.CFAPattern = None
+            self.wait_variable(varState)
 
-        self.displayed_bias = 0
-        self.displayed_dark = 0
-        self.displayed_flat = 0
-        self.displayed_light = 0
-        self.displayed_saturated = 0
+            if varState.get() == 'cancel':
+                topBatch.destroy()
+                self.varMessageLabel.set('Cancelled.')
+                self.labelMessage.configure(foreground='crimson')
+                self.busy = False
+                self.enableWidgets()
+                return None
 
-        for label in self.labelList:
-            self.forgetAttributes(label)
-            label.leftselected = False
-            label.rightselected = False
-            label.pack_forget()
+            types = [varType.get() for varType in varTypes]
 
-        self.photo_img = None
-        self.photo_img_res = None
+            error = None
 
-        self.deleteTemp(False)
+            for type in self.imagetypes:
+                if types.count(type) + displayed[type] > maxcounts[type]:
+                    error = 'Cannot have more than {:d} {} frame{}.'.format(maxcounts[type], type.lower(),
+                                                                           's' if maxcounts[type] > 1 else '')
+                    break
 
-        self.varBias1Label.set('')
-        self.varBias2Label.set('')
-        self.varDark1Label.set('')
-        self.varDark2Label.set('')
-        self.varFlat1Label.set('')
-        self.varFlat2Label.set('')
-        self.varLightLabel.set('')
-        self.varSaturatedLabel.set('')
+            if error is None:
+                break
 
-        self.varImInfo.set('')
-        self.varFOV.set('')
+            varBatchMessage.set(error)
 
-        self.frameBias.pack_forget()
-        self.labelBiasH.pack_forget()
-        self.frameDark.pack_forget()
-        self.labelDarkH.pack_forget()
-        self.frameFlat.pack_forget()
-        self.labelFlatH.pack_forget()
-        self.labelLightH.pack_forget()
-        self.labelSaturatedH.pack_forget()
+        buttonStart.configure(state='disabled')
+        for optionType in optionTypes:
+            optionType.configure(state='disabled')
 
-        self.canvasDisplay.delete(self.currentImage)
-        self.canvasDisplay.delete(self.selectionBox)
-        self.canvasDisplay.pack_forget()
-        self.scrollbarCanvHor.pack_forget()
-        self.scrollbarCanvVer.pack_forget()
-        self.labelCanv.pack(expand=True)
+        hasCFA = self.cont.isDSLR or self.varCCDType.get() == 'colour'
 
-        self.currentImage = None
+        # Decode all the files concurrently in separate processes
 
-    def getImage(self, label, filepath, filename, type, splitCFA=False, compare=False):
+        executor = concurrent.futures.ProcessPoolExecutor(max_workers=min(len(files),
+                                                                          os.cpu_count() or 1))
 
-        '''Read image data and store as label attributes.'''
+        futures = [executor.submit(self.frameCache.readFrame, os.sep.join(files[i].split('/')),
+                                   hasCFA and types[i] in ['Flat', 'Light'] \
+                                            and self.CFAPattern is None) for i in range(len(files))]
 
-        self.varMessageLabel.set('{} - Loading file..'.format(filename))
-        self.labelMessage.configure(foreground='navy')
-        self.labelMessage.update_idletasks()
+        def updateProgress():
 
-        # Create path string compatible with terminal
-        norm_filepath = '\"' + filepath + '\"'
+            '''Show the decoding status of each file until all are done.'''
 
-        # Create path string compatible with python file opening methods
-        py_filepath = os.sep.join(filepath.split('/'))
+            if varState.get() == 'cancel':
+                return None
 
-        # If image is a DSLR raw image
-        if '*.' + filename.split('.')[-1].lower() in self.supportedformats[0][1]:
+            done = 0
 
-            self.varMessageLabel.set('{} - Converting to TIFF..'.format(filename))
-            self.labelMessage.configure(foreground='navy')
-            self.labelMessage.update_idletasks()
+            for i in range(len(futures)):
 
-            # Create TIFF file from raw with dcraw
-            subprocess.call('dcraw -4 -o 0 -D -t 0 -k 0 -H 1 -T -j -W {}'.format(norm_filepath), shell=True)
+                if futures[i].done():
+                    done += 1
+                    varStatuses[i].set('Failed' if futures[i].exception() is not None else 'Decoded')
+                elif futures[i].running():
+                    varStatuses[i].set('Decoding..')
+                else:
+                    varStatuses[i].set('Waiting..')
 
-            self.varMessageLabel.set('{} - Reading Exif metadata..'.format(filename))
+            self.varMessageLabel.set('Decoding frames.. ({:d} of {:d} done)'.format(done, len(futures)))
             self.labelMessage.configure(foreground='navy')
-            self.labelMessage.update_idletasks()
 
-            tiff_filepath = '.'.join(py_filepath.split('.')[:-1]) + '.tiff'
+            if done == len(futures):
+                varState.set('decoded')
+            else:
+                self.after(100, updateProgress)
 
-            file = open(tiff_filepath, 'rb')
-            tags = exifread.process_file(file)
-            file.close()
+        updateProgress()
+        self.wait_variable(varState)
 
-            try:
-                iso = int(str(tags['EXIF ISOSpeedRatings']))
+        # Stop decoding if the window was exited
+        if varState.get() == 'cancel':
 
-            except (KeyError, ValueError):
-                iso = None
+            for future in futures:
+                future.cancel()
 
-            if iso is not None:
+            executor.shutdown(wait=False)
 
-                isovals = []
+            topBatch.destroy()
+            self.varMessageLabel.set('Cancelled.')
+            self.labelMessage.configure(foreground='crimson')
+            self.busy = False
+            self.enableWidgets()
+            return None
 
-                for otherlabel in self.labelList:
+        executor.shutdown(wait=False)
+        topBatch.destroy()
 
-                    if label is not otherlabel and otherlabel.iso is not None:
+        self.busy = False
 
-                        isovals.append(otherlabel.iso)
+        # Run the usual checks and store the frames, one image type at a time
 
-                if len(isovals) > 0 and isovals[1:] == isovals[:-1] and not iso in isovals:
+        added = 0
+        skipped = []
 
-                    warning = 'This frame has ISO {:d}, whereas the\nother added frames have ISO {:d}.' \
-                               .format(iso, isovals[0]) + '\nStill proceed?'
+        for type in self.imagetypes:
 
-                    if not self.showWarning('Warning', warning, 'Yes', 'Cancel', lambda: None):
+            for i in range(len(files)):
 
-                        self.varMessageLabel.set('Cancelled.')
-                        self.labelMessage.configure(foreground='crimson')
-                        raise Exception
+                if types[i] != type:
+                    continue
 
-            label.exposure = self.checkExp(True, tags, compare, label, type)
-            label.iso = iso
+                if futures[i].exception() is not None:
+                    skipped.append(filenames[i])
+                    continue
 
-            self.varMessageLabel.set('{} - Extracting raw data..'.format(filename))
-            self.labelMessage.configure(foreground='navy')
-            self.labelMessage.update_idletasks()
+                try:
+                    self.addDecodedImage(type, files[i], futures[i].result())
+                except:
+                    skipped.append(filenames[i])
+                    continue
 
-            # Get array of image data
-            img = mpimg.imread(tiff_filepath)
+                added += 1
 
-            self.varMessageLabel.set('{} - Deleting TIFF file..'.format(filename))
+        if len(skipped) == 0:
+            self.varMessageLabel.set('{:d} frame{} added.'.format(added, 's' if added != 1 else ''))
             self.labelMessage.configure(foreground='navy')
-            self.labelMessage.update_idletasks()
+        else:
+            self.varMessageLabel.set('{:d} frame{} added. Could not add: {}.'.format(added,
+                                                                                    's' if added != 1 else '',
+                                                                                    ', '.join(skipped)))
+            self.labelMessage.configure(foreground='crimson')
 
-            # Delete TIFF file created by dcraw
+        self.enableWidgets()
 
-            del_command = 'del /Q' if C.is_win else 'rm -f'
+    def analyseNightFolder(self):
 
-            subprocess.call('{} "{}"'.format(del_command, tiff_filepath),
-                            shell=True)
+        '''
+        Measure the sky background of every light frame in a chosen folder in parallel,
+        and save the exposure, ISO, background level, noise and sky flux in a table.
+        '''
 
-        # If image is a CCD raw image
-        else:
+        self.disableWidgets()
 
-            # If image is a TIFF file
-            if filename.split('.')[-1].lower() in ['tif', 'tiff']:
+        directory = tkinter.filedialog.askdirectory(initialdir=self.previousPath)
 
-                self.varMessageLabel.set('{} - Reading TIFF file..'.format(filename))
-                self.labelMessage.configure(foreground='navy')
-                self.labelMessage.update_idletasks()
+        # Do nothing if no folder was selected
+        if not directory:
+            self.enableWidgets()
+            return None
 
-                # Get array of image data from TIFF file
-                img = mpimg.imread(py_filepath)
+        self.previousPath = directory
 
-                self.varMessageLabel.set('{} - Reading Exif metadata..'.format(filename))
-                self.labelMessage.configure(foreground='navy')
-                self.labelMessage.update_idletasks()
+        directory = os.sep.join(directory.split('/'))
+        filepaths = apna.frameFiles(directory)
 
-                file = open(py_filepath, 'rb')
-                tags = exifread.process_file(file)
-                file.close()
+        if len(filepaths) == 0:
+            self.varMessageLabel.set('No supported image files found in the folder.')
+            self.labelMessage.configure(foreground='crimson')
+            self.enableWidgets()
+            return None
 
-                label.exposure = self.checkExp(True, tags, compare, label, type)
+        hasCFA = self.cont.isDSLR or self.varCCDType.get() == 'colour'
 
-            # If image is a FITS file
-            elif filename.split('.')[-1].lower() in ['fit', 'fits']:
+        self.busy = True
 
-                self.varMessageLabel.set('{} - Reading FITS file..'.format(filename))
-                self.labelMessage.configure(foreground='navy')
-                self.labelMessage.update_idletasks()
+        # Analyse all the frames concurrently in separate processes
 
-                # Get array of image data from FITS file
-                hdulist = pyfits.open(py_filepath)
+        executor, futures = apna.analyseFrames(filepaths, hasCFA, self.CFAPattern if hasCFA else None)
 
-                img = hdulist[0].data
-                header = hdulist[0].header
+        varState = tk.StringVar() # Set to "done" when all frames are analysed
+        varState.set('')
 
-                hdulist.close()
+        def updateProgress():
 
-                if len(img.shape) != 2:
-                    self.varMessageLabel.set('Image file "{}" contains colour channels.'.format(filename) \
-                                            + 'Please use a non-debayered image.')
-                    self.labelMessage.configure(foreground='crimson')
-                    raise Exception
+            '''Show the number of analysed frames until all are done.'''
 
-                self.varMessageLabel.set('{} - Reading FITS header..'.format(filename))
-                self.labelMessage.configure(foreground='navy')
-                self.labelMessage.update_idletasks()
+            done = sum(future.done() for future in futures)
 
-                label.exposure = self.checkExp(False, header, compare, label, type)
+            self.varMessageLabel.set('Analysing frames.. ({:d} of {:d} done)'.format(done, len(futures)))
+            self.labelMessage.configure(foreground='navy')
 
-        # If image has a CFA and a specific colour needs to be extracted
-        if splitCFA:
+            if done == len(futures):
+                varState.set('done')
+            else:
+                self.after(200, updateProgress)
 
-            self.varMessageLabel.set('{} - Detecting CFA pattern..'.format(filename))
-            self.labelMessage.configure(foreground='navy')
-            self.labelMessage.update_idletasks()
+        updateProgress()
+        self.wait_variable(varState)
 
-            # Get which colour of pixels to extract from user if necessary
-            if self.useGreen is None:
-                self.busy = True
-                self.askColour()
-                self.wait_window(self.topAskColour)
-                self.busy = False
-                self.useGreen = self.varUseGreen.get()
+        executor.shutdown(wait=False)
 
-            # Abort if user cancels
-            if self.cancelled:
-                self.varMessageLabel.set('Cancelled.')
-                self.labelMessage.configure(foreground='crimson')
-                raise Exception
+        self.busy = False
 
-            # If image is a DSLR raw image
-            if self.cont.isDSLR and not filename.split('.')[-1].lower() in ['tif', 'tiff', 'fit', 'fits']:
+        calframe = self.cont.frames[ImageCalculator]
+        isovals = list(C.ISO[self.cont.cnum])
 
-                # Get string of raw file information
-                metadata = subprocess.check_output('dcraw -i -v {}'.format(norm_filepath), shell=True).decode('UTF-8')
+        rows = []
+        skipped = []
 
-                # Extract string representing CFA pattern
-                if self.CFAPattern is None:
+        for filepath, future in zip(filepaths, futures):
 
-                    for line in metadata.split('\n'):
+            filename = os.path.basename(filepath)
 
-                        parts = line.split(': ')
+            if future.exception() is not None:
+                skipped.append(filename)
+                continue
 
-                        if parts[0] == 'Filter pattern':
+            exposure, iso, bg_level, bg_noise = future.result()
 
-                            try:
-                                self.CFAPattern = (re.sub(r'[^a-zA-Z]', '', parts[1])[:4]).upper()
-                            except:
-                                self.CFAPattern = None
+            # Use the camera data of the ISO of the frame, or of the ISO/gain selected in the Image Calculator,
+            # and leave the sky flux out if the camera has no data
+            if self.cont.noData:
+                black_level, gain = None, None
+            else:
+                idx = isovals.index(iso) if (self.cont.isDSLR and iso in isovals) else calframe.gain_idx
+                black_level, gain = C.BLACK_LEVEL[self.cont.cnum][0][idx], C.GAIN[self.cont.cnum][0][idx]
 
-            # Ask user for CFA pattern if it wasn't detected or if camera is colour CCD
-            if self.CFAPattern not in ['RGGB', 'BGGR', 'GRBG', 'GBRG']:
-                self.busy = True
-                self.askCFAPattern()
-                self.wait_window(self.topAskCFA)
-                self.busy = False
-                self.CFAPattern = self.varCFAPattern.get()
+            rows.append((filename, exposure, iso, bg_level, bg_noise,
+                         apna.skyFlux(bg_level, black_level, gain, exposure)))
 
-            # Abort if user cancels
-            if self.cancelled:
-                self.varMessageLabel.set('Cancelled.')
-                self.labelMessage.configure(foreground='crimson')
-                raise Exception
+        output = os.path.join(directory, 'night_analysis.txt')
 
-            self.varMessageLabel.set('{} - Extracting {} pixels..' \
-                                     .format(filename, ('green' if self.useGreen else 'red')))
-            self.labelMessage.configure(foreground='navy')
-            self.labelMessage.update_idletasks()
+        try:
+            apna.writeTable(output, rows)
+        except OSError:
+            self.varMessageLabel.set('Could not write the results to "{}".'.format(output))
+            self.labelMessage.configure(foreground='crimson')
+            self.enableWidgets()
+            return None
 
-            # Extract green and red pixels as separate images
+        if len(skipped) == 0:
+            self.varMessageLabel.set('{:d} frame{} analysed. Results saved in "night_analysis.txt".' \
+                                     .format(len(rows), 's' if len(rows) != 1 else ''))
+            self.labelMessage.configure(foreground='navy')
+        else:
+            self.varMessageLabel.set('{:d} frame{} analysed. Could not analyse: {}.' \
+                                     .format(len(rows), 's' if len(rows) != 1 else '', ', '.join(skipped)))
+            self.labelMessage.configure(foreground='crimson')
 
-            h, w = img.shape
+        self.enableWidgets()
 
-            if (self.CFAPattern == 'GBRG' and self.useGreen) \
-               or (self.CFAPattern == 'GRBG' and self.useGreen) \
-               or (self.CFAPattern == 'RGGB' and not self.useGreen):
-                img = img[0:(h-1):2, 0:(w-1):2] # Quadrant 1
-            elif (self.CFAPattern == 'RGGB' and self.useGreen) \
-                 or (self.CFAPattern == 'BGGR' and self.useGreen) \
-                 or (self.CFAPattern == 'GRBG' and not self.useGreen):
-                img = img[0:(h-1):2, 1:w:2] # Quadrant 2
-            elif self.CFAPattern == 'GBRG' and not self.useGreen:
-                img = img[1:h:2, 0:(w-1):2] # Quadrant 3
-            elif self.CFAPattern == 'BGGR' and not self.useGreen:
-                img = img[1:h:2, 1:w:2] # Quadrant 4
+    def buildPixelMaps(self):
 
-            if type == 'light':
-                self.labelLight.isSplitted = True
+        '''
+        Build per-pixel read noise and dark signal maps from any number of bias and dark frames,
+        and find hot and warm pixels, which can then be left out of all statistics.
+        '''
 
-        # If image is mono or is to keep all pixels
-        else:
+        self.disableWidgets()
 
-            if type == 'light':
-                self.labelLight.isSplitted = False
+        supportedformats = self.supportedformats if self.cont.isDSLR \
+                                                 else [self.supportedformats[1]]
 
-        self.varMessageLabel.set('{} - Checking image dimensions..'.format(filename))
-        self.labelMessage.configure(foreground='navy')
-        self.labelMessage.update_idletasks()
+        bias_files = tkinter.filedialog.askopenfilenames(title='Choose bias frames',
+                                                         filetypes=supportedformats,
+                                                         initialdir=self.previousPath)
 
-        # Show error if the image size if different from the previously added image
-        if compare and img.shape != compare.stretched_img.shape:
-            self.varMessageLabel.set('The dimensions of "{}" does not match '.format(filename) \
-                                     + 'those of the other added frame.')
-            self.labelMessage.configure(foreground='crimson')
-            raise Exception
+        if len(bias_files) == 0:
+            self.enableWidgets()
+            return None
 
-        # Store raw image data as label attribute
+        dark_files = tkinter.filedialog.askopenfilenames(title='Choose dark frames (optional)',
+                                                         filetypes=supportedformats,
+                                                         initialdir=self.previousPath)
 
-        self.varMessageLabel.set('{} - Creating temporary raw data file..'.format(filename))
-        self.labelMessage.configure(foreground='navy')
-        self.labelMessage.update_idletasks()
+        self.previousPath = '/'.join(bias_files[-1].split('/')[:-1])
 
-        np.save('aplab_temp' + os.sep + self.labelNames[label], img)
+        bias_files = [os.sep.join(filepath.split('/')) for filepath in bias_files]
+        dark_files = [os.sep.join(filepath.split('/')) for filepath in dark_files]
 
-        self.varMessageLabel.set('{} - Applying screen stretch..'.format(filename))
-        self.labelMessage.configure(foreground='navy')
-        self.labelMessage.update_idletasks()
+        total = len(bias_files) + len(dark_files)
 
-        label.stretched_img = apc.autostretch(img)
-        img = None
+        def showProgress(done):
 
-        self.varMessageLabel.set('{} - Creating temporary image file..'.format(filename))
-        self.labelMessage.configure(foreground='navy')
-        self.labelMessage.update_idletasks()
-        self.updateDisplayedImage(label)
+            '''Show the number of processed frames.'''
 
-    def checkExp(self, isTiff, metadata, compare, label, type):
+            self.varMessageLabel.set('Building pixel maps.. ({:d} of {:d} frames done)'.format(done, total))
+            self.labelMessage.configure(foreground='navy')
+            self.update_idletasks()
 
-        '''Find the exposure time of the added image, and compare to existing values.'''
+        showProgress(0)
 
         try:
-            # Check image metadata for exposure time
-            if isTiff:
-                exposure_str = str(metadata['EXIF ExposureTime'])
-            else:
-                try:
-                    exposure_str = str(metadata['EXPTIME'])
-                except:
-                    exposure_str = str(metadata['EXPOSURE'])
+            self.pixelMaps = appm.PixelMaps(bias_files, dark_files, progress=showProgress)
+        except Exception as error:
+            self.varMessageLabel.set('Could not build the pixel maps: {}'.format(error))
+            self.labelMessage.configure(foreground='crimson')
+            self.enableWidgets()
+            return None
 
-            # Calculate exposure in seconds if the quoted exposure time is a fraction
-            if '/' in exposure_str:
+        maps = self.pixelMaps
+        self.varExcludeBad.set(1)
 
-                fraction_parts = exposure_str.split('/')
-                exposure_num = float(fraction_parts[0])/float(fraction_parts[1])
+        self.varMessageLabel.set('Pixel maps built. {:d} hot and {:d} warm pixels found.' \
+                                 .format(int(np.sum(maps.hot)), int(np.sum(maps.warm))))
+        self.labelMessage.configure(foreground='navy')
 
-            else:
+        self.busy = True
 
-                exposure_num = float(exposure_str)
+        def saveMaps():
 
-            # Show a warning of two frames of the same (relevant) type have very different exposures
-            if compare and compare.exposure is not None:
+            '''Save the maps as a FITS file chosen by the user.'''
 
-                exp1 = compare.exposure
-                exp2 = exposure_num
+            filepath = tkinter.filedialog.asksaveasfilename(parent=topMaps, defaultextension='.fits',
+                                                            filetypes=[('FITS files', '*.fits')],
+                                                            initialdir=self.previousPath)
 
-                if self.tooDiff(exp1, exp2):
+            if not filepath: return None
 
-                    warning = 'The two {} frames have\nsignificantly different '.format(type) \
-                               + 'exposure times.\n({:.4g} s vs. {:.4g} s)\nStill proceed?' \
-                               .format(exp1, exp2)
+            try:
+                maps.save(os.sep.join(filepath.split('/')))
+            except OSError:
+                self.varMessageLabel.set('Could not save the pixel maps.')
+                self.labelMessage.configure(foreground='crimson')
+                return None
 
-                    if not self.showWarning('Warning', warning, 'Yes', 'Cancel', lambda: None):
+            self.varMessageLabel.set('Pixel maps saved as "{}".'.format(filepath.split('/')[-1]))
+            self.labelMessage.configure(foreground='navy')
 
-                        self.varMessageLabel.set('Cancelled.')
-                        self.labelMessage.configure(foreground='crimson')
-                        raise Exception
+        # Setup window displaying a summary of the maps
+        topMaps = tk.Toplevel(background=C.DEFAULT_BG)
+        topMaps.title('Pixel maps')
+        self.cont.addIcon(topMaps)
+        apc.setupWindow(topMaps, 340, 260)
+        topMaps.focus_force()
 
-        except (KeyError, ValueError):
-            exposure_num = None
+        ttk.Label(topMaps, text='Pixel maps', font=self.cont.smallbold_font,
+                  anchor='center').pack(side='top', pady=(15*C.scsy, 5*C.scsy), expand=True)
 
-        warning = False
+        frameResults = ttk.Frame(topMaps)
+        frameResults.pack(side='top', expand=True)
 
-        # Compare light and dark exposure times and show a warning if they are very different
-        if type == 'light' and exposure_num is not None:
+        rows = [('Median read noise: ', '{:.3g}'.format(float(np.median(maps.read_noise))), ' ADU'),
+                ('Hot pixels: ', '{:d}'.format(int(np.sum(maps.hot))), ''),
+                ('Warm pixels: ', '{:d}'.format(int(np.sum(maps.warm))), '')]
 
-            expvals = []
+        if maps.dark is not None:
 
-            for lab in [self.labelDark1, self.labelDark2]:
+            dark = float(np.median(maps.dark))
 
-                if lab.exposure is not None:
+            if maps.exposure is not None and maps.exposure > 0:
+                rows.append(('Median dark signal: ', '{:.3g}'.format(dark/maps.exposure), ' ADU/s'))
+            else:
+                rows.append(('Median dark signal: ', '{:.3g}'.format(dark), ' ADU'))
 
-                    expvals.append(lab.exposure)
+            rows.append(('Strongest amp glow: ', '{:.3g}'.format(float(np.nanmax(maps.amp_glow))), ' ADU'))
 
-            if len(expvals) == 1 and self.tooDiff(exposure_num, expvals[0]):
+        for j, (name, value, unit) in enumerate(rows):
+            ttk.Label(frameResults, text=name).grid(row=j, column=0, sticky='W')
+            ttk.Label(frameResults, text=value, width=7, anchor='center').grid(row=j, column=1)
+            ttk.Label(frameResults, text=unit).grid(row=j, column=2, sticky='W')
 
-                warning = 'This light frame and an added dark frame\nhave significantly ' \
-                           + 'different exposure times.\n({:.4g} s vs. {:.4g} s)\nStill proceed?' \
-                           .format(exposure_num, expvals[0])
+        ttk.Checkbutton(topMaps, text='Leave hot and warm pixels out of statistics',
+                        variable=self.varExcludeBad).pack(side='top', pady=(5*C.scsy, 0), expand=True)
 
-            elif len(expvals) == 2 and not self.tooDiff(*expvals) \
-                                   and self.tooDiff(exposure_num, expvals[0]):
+        frameButtons = ttk.Frame(topMaps)
+        frameButtons.pack(side='top', pady=(5*C.scsy, 15*C.scsy), expand=True)
 
-                warning = 'This light frame and the added dark frames\nhave significantly ' \
-                          + 'different exposure times.\n({:.4g} s vs. {:.4g} s)\nStill proceed?' \
-                          .format(exposure_num, expvals[0])
+        ttk.Button(frameButtons, text='Save maps', command=saveMaps).grid(row=0, column=0)
+        ttk.Button(frameButtons, text='Close', command=lambda: topMaps.destroy()).grid(row=0, column=1)
 
-        elif type == 'dark' and self.displayed_light == 1 and exposure_num is not None:
+        self.wait_window(topMaps)
 
-            if self.tooDiff(self.labelLight.exposure, exposure_num) \
-                                and (label is self.labelDark1 or self.labelDark1.exposure is None):
+        self.busy = False
+        self.enableWidgets()
 
-                warning = 'This dark frame and the added light frame\nhave significantly ' \
-                          + 'different exposure times.\n({:.4g} s vs. {:.4g} s)\nStill proceed?' \
-                          .format(exposure_num, self.labelLight.exposure)
+    def stackFrames(self):
 
-        # Display the warning window
-        if warning:
-            if not self.showWarning('Warning', warning, 'Yes', 'Cancel', lambda: None):
+        '''
+        Build master bias, dark and flat frames from chosen files, use them to calibrate
+        chosen light frames, and save the stack of the light frames as a FITS file.
+        '''
 
-                self.varMessageLabel.set('Cancelled.')
-                self.labelMessage.configure(foreground='crimson')
-                raise Exception
+        self.disableWidgets()
+        self.busy = True
 
-        return exposure_num
+        supportedformats = self.supportedformats if self.cont.isDSLR \
+                                                 else [self.supportedformats[1]]
 
-    def tooDiff(self, exp1, exp2):
+        chosen = {'Bias': [], 'Dark': [], 'Flat': [], 'Light': []}
+        varCounts = {}
 
-        '''Return true if the exposure times differ by more than 10%.'''
+        methods = {'Sigma-clipped mean': 'sigma', 'Median': 'median', 'Mean': 'mean'}
+        varMethod = tk.StringVar()
+        varMethod.set('Sigma-clipped mean')
 
-        return np.abs(exp1 - exp2) >= 0.05*(exp1 + exp2)
+        def choose(type):
 
-    def askColour(self):
+            '''Let the user choose the files of the given image type.'''
 
-        '''Show window with options for choosing which CFA colour to extract.'''
+            files = tkinter.filedialog.askopenfilenames(parent=topStack, filetypes=supportedformats,
+                                                        initialdir=self.previousPath)
 
-        def ok():
+            if len(files) > 0:
+                self.previousPath = '/'.join(files[-1].split('/')[:-1])
+                chosen[type] = [os.sep.join(filepath.split('/')) for filepath in files]
+                varCounts[type].set('{:d} file{}'.format(len(files), 's' if len(files) != 1 else ''))
 
-            '''Set confirmation that the window wasn't exited, and close window.'''
+        def ok():
 
             self.cancelled = False
-            self.topAskColour.destroy()
+            topStack.destroy()
 
-        # Setup window
+        # Setup window for choosing frames and combination method
 
-        self.topAskColour = tk.Toplevel(background=C.DEFAULT_BG)
-        self.topAskColour.title('Choose colour')
-        self.cont.addIcon(self.topAskColour)
-        apc.setupWindow(self.topAskColour, 300, 145)
-        self.topAskColour.focus_force()
+        topStack = tk.Toplevel(background=C.DEFAULT_BG)
+        topStack.title('Stack frames')
+        self.cont.addIcon(topStack)
+        apc.setupWindow(topStack, 320, 260)
+        topStack.focus_force()
 
         self.cancelled = True
-        self.varUseGreen = tk.IntVar()
-        self.varUseGreen.set(1)
 
-        ttk.Label(self.topAskColour,
-                  text='Choose which colour of pixels to extract.\nGreen is recommended unless the '\
-                       + 'image\nwas taken with a red narrowband filter.').pack(side='top', pady=(10*C.scsy, 5*C.scsy), expand=True)
-
-        frameRadio = ttk.Frame(self.topAskColour)
-        frameRadio.pack(side='top', expand=True, pady=(0, 10*C.scsy))
-        ttk.Radiobutton(frameRadio, text='Green', variable=self.varUseGreen,
-                        value=1).grid(row=0, column=0)
-        ttk.Radiobutton(frameRadio, text='Red', variable=self.varUseGreen,
-                        value=0).grid(row=0, column=1)
+        ttk.Label(topStack, text='Choose the frames to use. Calibration\nframes are optional.',
+                  anchor='center').pack(side='top', pady=(15*C.scsy, 5*C.scsy), expand=True)
 
-        ttk.Button(self.topAskColour, text='OK', command=ok).pack(side='top', expand=True,
-                                                                 pady=(0, 10*C.scsy))
+        frameTypes = ttk.Frame(topStack)
+        frameTypes.pack(side='top', expand=True)
 
-    def askCFAPattern(self):
+        for i, type in enumerate(chosen):
 
-        '''Show window with options for choosing which CFA pattern to use.'''
+            varCounts[type] = tk.StringVar()
+            varCounts[type].set('None')
 
-        def ok():
+            ttk.Label(frameTypes, text='{} frames: '.format(type)).grid(row=i, column=0, sticky='W')
+            ttk.Label(frameTypes, textvariable=varCounts[type], width=8).grid(row=i, column=1)
+            ttk.Button(frameTypes, text='Choose',
+                       command=lambda type=type: choose(type)).grid(row=i, column=2)
 
-            '''Set confirmation that the window wasn't exited, and close window.'''
+        frameMethod = ttk.Frame(topStack)
+        frameMethod.pack(side='top', pady=(5*C.scsy, 0), expand=True)
 
-            self.cancelled = False
-            self.topAskCFA.destroy()
+        ttk.Label(frameMethod, text='Combine with: ').grid(row=0, column=0)
+        ttk.OptionMenu(frameMethod, varMethod, None, *methods).grid(row=0, column=1)
 
-        # Setup window
+        ttk.Button(topStack, text='Stack', command=ok).pack(side='top', pady=(5*C.scsy, 15*C.scsy),
+                                                            expand=True)
 
-        self.topAskCFA = tk.Toplevel(background=C.DEFAULT_BG)
-        self.topAskCFA.title('Choose filter pattern')
-        self.cont.addIcon(self.topAskCFA)
-        apc.setupWindow(self.topAskCFA, 300, 145)
-        self.topAskCFA.focus_force()
+        self.wait_window(topStack)
 
-        self.cancelled = True
-        CFAList = ['RGGB', 'BGGR', 'GRBG', 'GBRG']
+        # Cancel if topwindow was exited
+        if self.cancelled:
+            self.varMessageLabel.set('Cancelled.')
+            self.labelMessage.configure(foreground='crimson')
+            self.busy = False
+            self.enableWidgets()
+            return None
 
-        self.varCFAPattern = tk.StringVar()
-        self.varCFAPattern.set(CFAList[0])
+        if len(chosen['Light']) < 2:
+            self.varMessageLabel.set('At least two light frames are required to make a stack.')
+            self.labelMessage.configure(foreground='crimson')
+            self.busy = False
+            self.enableWidgets()
+            return None
 
-        ttk.Label(self.topAskCFA, text='Choose the colour filter pattern of your camera.',
-                  anchor='center').pack(side='top', pady=(10*C.scsy, 5*C.scsy), expand=True)
+        filepath = tkinter.filedialog.asksaveasfilename(defaultextension='.fits',
+                                                        filetypes=[('FITS files', '*.fits')],
+                                                        initialdir=self.previousPath)
 
-        ttk.OptionMenu(self.topAskCFA, self.varCFAPattern, None, *CFAList).pack(side='top',
-                                                                                expand=True,
-                                                                                pady=(0, 10*C.scsy))
+        if not filepath:
+            self.varMessageLabel.set('Cancelled.')
+            self.labelMessage.configure(foreground='crimson')
+            self.busy = False
+            self.enableWidgets()
+            return None
 
-        ttk.Button(self.topAskCFA, text='OK', command=ok).pack(side='top', expand=True,
-                                                               pady=(0, 10*C.scsy))
+        def showProgress(message):
 
-    def showImageEvent(self, event):
+            '''Show the progress of the stacking.'''
 
-        '''Only call the show image method when label is clicked if no topwindow is showing.'''
+            self.varMessageLabel.set(message)
+            self.labelMessage.configure(foreground='navy')
+            self.update_idletasks()
 
-        if not self.busy: self.showImage(event.widget)
+        # Combine the frames in parallel blocks of rows, through memory-mapped files
+        stacker = apst.Stacker(os.path.join('aplab_temp', 'stack'), progress=showProgress)
 
-    def showImage(self, label, filename=False):
+        try:
+            for type in ['Bias', 'Dark', 'Flat']:
+                if len(chosen[type]) > 0:
+                    stacker.makeMaster(chosen[type], type)
 
-        '''Change background of given label to blue and show the photoimage of the label.'''
+            stacker.stackLights(chosen['Light'], os.sep.join(filepath.split('/')),
+                                method=methods[varMethod.get()])
 
-        label.configure(style='leftselectedfile.TLabel')
+        except Exception as error:
+            stacker.close()
+            self.varMessageLabel.set('Could not stack the frames: {}'.format(error))
+            self.labelMessage.configure(foreground='crimson')
+            self.busy = False
+            self.enableWidgets()
+            return None
 
-        label.leftselected = True
-        label.rightselected = False
+        stacker.close()
 
-        for other_label in self.labelList:
+        self.varMessageLabel.set('{:d} light frames stacked and saved as "{}". Add it as a light frame to analyse it.' \
+                                 .format(len(chosen['Light']), filepath.split('/')[-1]))
+        self.labelMessage.configure(foreground='navy')
 
-            other_label.rightselected = False
+        self.busy = False
+        self.enableWidgets()
 
-            if other_label is not label:
-                other_label.leftselected = False
-                other_label.configure(style='file.TLabel')
+    def addDecodedImage(self, type, filepath, decoded):
 
-        self.loadImage(label, filename=filename)
+        '''Store a decoded file as the next frame of the given type and show its name in the list.'''
 
-        # Create canvas image and store image dimensions
-        self.canvasDisplay.delete(self.currentImage)
-        self.canvasDisplay.delete(self.selectionBox)
-        self.canvasDisplay.delete(self.measureLine)
+        filename = filepath.split('/')[-1]
 
-        if self.showResized:
+        hasCFA = type in ['Flat', 'Light'] and (self.cont.isDSLR or self.varCCDType.get() == 'colour')
 
-            # Show the resized version of the image
+        frame = None
 
-            w = self.photo_img_res.width()
-            h = self.photo_img_res.height()
-            cw = self.scrollbarCanvHor.winfo_width() - 17.0
-            ch = self.scrollbarCanvVer.winfo_height()
+        if type == 'Bias':
+            labels = [self.labelBias1, self.labelBias2]
+            varLabels = [self.varBias1Label, self.varBias2Label]
+            varHeader = self.varBiasHLabel
+            frame = self.frameBias
+            labelHeader = self.labelBiasH
+            displayed = self.displayed_bias
+        elif type == 'Dark':
+            labels = [self.labelDark1, self.labelDark2]
+            varLabels = [self.varDark1Label, self.varDark2Label]
+            varHeader = self.varDarkHLabel
+            frame = self.frameDark
+            labelHeader = self.labelDarkH
+            displayed = self.displayed_dark
+        elif type == 'Flat':
+            labels = [self.labelFlat1, self.labelFlat2]
+            varLabels = [self.varFlat1Label, self.varFlat2Label]
+            varHeader = self.varFlatHLabel
+            frame = self.frameFlat
+            labelHeader = self.labelFlatH
+            displayed = self.displayed_flat
+        elif type == 'Light':
+            labels = [self.labelLight]
+            varLabels = [self.varLightLabel]
+            labelHeader = self.labelLightH
+            displayed = self.displayed_light
+        else:
+            labels = [self.labelSaturated]
+            varLabels = [self.varSaturatedLabel]
+            labelHeader = self.labelSaturatedH
+            displayed = self.displayed_saturated
 
-            self.imageSize = (w, h)
+        label = labels[displayed]
+        compare = labels[0] if displayed == 1 else False
 
-            self.currentImage = self.canvasDisplay.create_image(cw/2, ch/2,
-                                                                image=self.photo_img_res,
-                                                                anchor='center')
+        # Show error if the same file is already added
+        if displayed == 1 and filename == varLabels[0].get().split(' (')[0]:
+            self.varMessageLabel.set('This {} frame is already added.'.format(type.lower()))
+            self.labelMessage.configure(foreground='crimson')
+            raise Exception
 
-            self.canvasDisplay.configure(scrollregion=(0, 0, 0, 0))
+        # Extract image data and store as attributes for the label
+        self.getImage(label, filepath, filename, type.lower(), hasCFA=hasCFA, compare=compare,
+                      decoded=decoded)
 
-            # Display the FOV of the non-resized light frame
-            if label is self.labelLight:
-                self.setFOV(0, self.photo_img.width(), 0, self.photo_img.height(), False)
-            else:
-                self.varFOV.set('')
+        displayed += 1
 
+        if type == 'Bias':
+            self.displayed_bias = displayed
+        elif type == 'Dark':
+            self.displayed_dark = displayed
+        elif type == 'Flat':
+            self.displayed_flat = displayed
+        elif type == 'Light':
+            self.displayed_light = displayed
         else:
+            self.displayed_saturated = displayed
 
-            self.imageSize = (self.photo_img.width(), self.photo_img.height())
+        # Display header and file name
 
-            self.currentImage = self.canvasDisplay.create_image(0, 0, image=self.photo_img,
-                                                                anchor='nw')
+        varLabels[displayed - 1].set(self.adjustName(label, filename))
 
-            self.canvasDisplay.configure(scrollregion=(0, 0, self.imageSize[0], self.imageSize[1]))
+        if frame is not None:
+            varHeader.set('{} frame{}'.format(type, 's' if displayed == 2 else ''))
 
-            self.setFOV(0, self.imageSize[0], 0, self.imageSize[1], False)
+        if displayed == 1:
+            if frame is not None:
+                frame.pack(side='top', fill='x', anchor='w')
+            labelHeader.pack(side='top', fill='x', anchor='w')
 
-        # Update ISO and exposure time labels
+        label.pack(side='top', fill='x', anchor='w')
 
-        if label.exposure is not None:
-            self.varImInfo.set('Exposure time: {:.4g} s'.format(label.exposure))
-        else:
-            self.varImInfo.set('Exposure time: Not detected')
+        # Show canvas if this is the first added file
+        if self.noInput:
+            self.showCanvas()
+            self.noInput = False
 
-        if self.cont.isDSLR:
-            if label.iso is not None:
-                self.varImInfo.set('ISO: {:d}        {}'.format(label.iso, self.varImInfo.get()))
-            else:
-                self.varImInfo.set('ISO: Not detected        {}'.format(self.varImInfo.get()))
+        self.showImage(label, filename=filename)
 
-        # Disable image interaction for resized images, except for measuring in the light frame
-        if label is self.labelLight:
-            self.menuRC.entryconfig(4, state='normal')
-        else:
-            if self.mode == 'measure':
+        self.update() # Update window to show changes
 
-                self.useSelectMode()
+    def showCanvas(self):
 
-                if self.showResized:
-                    self.canvasDisplay.unbind('<Button-1>')
-                    self.canvasDisplay.unbind('<B1-Motion>')
-                    self.canvasDisplay.unbind('<ButtonRelease-1>')
+        '''Show canvas widget and scrollbars.'''
 
-            self.menuRC.entryconfig(4, state='disabled')
+        self.labelCanv.pack_forget()
+        self.scrollbarCanvHor.pack(side='bottom', fill='x')
+        self.scrollbarCanvVer.pack(side='right', fill='y')
+        self.canvasDisplay.pack(side='left', fill='both', expand=True)
 
-        self.varMessageLabel.set('Done.')
-        self.labelMessage.configure(foreground='navy')
-        self.labelMessage.update_idletasks()
+    def disableWidgets(self):
+
+        '''Disable widgets that can be interacted with.'''
+
+        self.radioCCDm.configure(state='disabled')
+        self.radioCCDc.configure(state='disabled')
+        self.optionAdd.configure(state='disabled')
+        self.buttonAdd.configure(state='disabled')
+        self.buttonAddBatch.configure(state='disabled')
+        self.buttonClear.configure(state='disabled')
+        self.buttonCompute.configure(state='disabled')
+        self.buttonPTC.configure(state='disabled')
+        self.buttonSweep.configure(state='disabled')
+        self.buttonMaps.configure(state='disabled')
+        self.buttonStack.configure(state='disabled')
+        self.buttonNight.configure(state='disabled')
+        for label in self.labelList:
+            label.configure(state='disabled')
+
+    def enableWidgets(self):
+
+        '''Enable widgets that can be interacted with.'''
+
+        try:
+            self.radioCCDm.configure(state='normal')
+            self.radioCCDc.configure(state='normal')
+            self.optionAdd.configure(state='normal')
+            self.buttonAdd.configure(state='normal')
+            self.buttonAddBatch.configure(state='normal')
+            self.buttonClear.configure(state='normal')
+            self.buttonCompute.configure(state='normal')
+            self.buttonPTC.configure(state='normal')
+            self.buttonSweep.configure(state='normal')
+            self.buttonMaps.configure(state='normal')
+            self.buttonStack.configure(state='normal')
+            self.buttonNight.configure(state='normal')
+            for label in self.labelList:
+                label.configure(state='normal')
+        except:
+            pass
+
+    def adjustName(self, label, name):
+
+        '''Cut the filename if it reaches the end of the file frame.'''
+
+        namewidth = self.cont.small_font.measure(name)
+        framewidth = self.frameFiles.winfo_width()*0.9
+
+        if namewidth > framewidth:
+
+            apc.createToolTip(label, name, self.cont.tt_fs)
+
+            maxidx = int(np.floor(len(name)*framewidth/namewidth))
+            name = name[:maxidx] + '..'
+
+        else:
+
+            label.unbind('<Enter>')
+            label.unbind('<Motion>')
+            label.unbind('<Leave>')
+
+        return name
+
+    def changeCCDType(self):
+
+        '''Warn user that added data will be lost when changing camera type.'''
+
+        # If files have been added
+        if not self.noInput:
+
+            def cmd():
+                self.clearFiles()
+                self.currentCCDType = self.varCCDType.get()
+                self.varMessageLabel.set('CCD type changed to {}.'.format(self.varCCDType.get()))
+                self.labelMessage.configure(foreground='navy')
+
+            self.showWarning('Warning', 'Changing CCD type will\nremove added files. Proceed?',
+                             'Yes', 'Cancel', cmd)
+
+            # Change camera type back to previous state if the window was exited
+            if self.varCCDType.get() != self.currentCCDType:
+                self.varCCDType.set(self.currentCCDType)
+
+        else:
+            # Show message that the camera type was changed
+            self.varMessageLabel.set('CCD type changed to {}.'.format(self.varCCDType.get()))
+            self.labelMessage.configure(foreground='navy')
+            self.currentCCDType = self.varCCDType.get()
+
+    def clearFiles(self):
+
+        '''Reset attributes and clear added files.'''
+
+        self.noInput = True
+
+        self.CFAPattern = None
+
+        self.displayed_bias = 0
+        self.displayed_dark = 0
+        self.displayed_flat = 0
+        self.displayed_light = 0
+        self.displayed_saturated = 0
+
+        for label in self.labelList:
+            self.forgetAttributes(label)
+            label.leftselected = False
+            label.rightselected = False
+            label.pack_forget()
+
+        self.photo_img = None
+
+        self.deleteTemp(False)
+
+        self.varBias1Label.set('')
+        self.varBias2Label.set('')
+        self.varDark1Label.set('')
+        self.varDark2Label.set('')
+        self.varFlat1Label.set('')
+        self.varFlat2Label.set('')
+        self.varLightLabel.set('')
+        self.varSaturatedLabel.set('')
+
+        self.varImInfo.set('')
+        self.varFOV.set('')
+
+        self.frameBias.pack_forget()
+        self.labelBiasH.pack_forget()
+        self.frameDark.pack_forget()
+        self.labelDarkH.pack_forget()
+        self.frameFlat.pack_forget()
+        self.labelFlatH.pack_forget()
+        self.labelLightH.pack_forget()
+        self.labelSaturatedH.pack_forget()
+
+        self.canvasDisplay.delete(self.currentImage)
+        self.canvasDisplay.delete(self.selectionBox)
+        self.canvasDisplay.pack_forget()
+        self.scrollbarCanvHor.pack_forget()
+        self.scrollbarCanvVer.pack_forget()
+        self.labelCanv.pack(expand=True)
+
+        self.currentImage = None
+
+    def getImage(self, label, filepath, filename, type, hasCFA=False, compare=False, decoded=None):
+
+        '''
+        Read image data and store as label attributes. Image data and metadata
+        that have already been decoded can be provided with "decoded".
+        '''
+
+        self.varMessageLabel.set('{} - Loading file..'.format(filename))
+        self.labelMessage.configure(foreground='navy')
+        self.labelMessage.update_idletasks()
+
+        # Create path string compatible with python file opening methods
+        py_filepath = os.sep.join(filepath.split('/'))
+
+        isRaw = '*.' + filename.split('.')[-1].lower() in self.supportedformats[0][1]
+
+        if decoded is None:
+
+            if isRaw:
+                self.varMessageLabel.set('{} - Decoding raw data..'.format(filename))
+            elif filename.split('.')[-1].lower() in ['tif', 'tiff']:
+                self.varMessageLabel.set('{} - Reading TIFF file..'.format(filename))
+            else:
+                self.varMessageLabel.set('{} - Reading FITS file..'.format(filename))
+            self.labelMessage.configure(foreground='navy')
+            self.labelMessage.update_idletasks()
+
+            # Ask which image to use if the FITS file contains several images or a data cube
+            hdu = None
+            plane = 0
+
+            if filename.split('.')[-1].lower() in ['fit', 'fits']:
+
+                try:
+                    images = apfr.fitsImages(py_filepath)
+                except Exception:
+                    images = []
+
+                if len(images) > 1 or (len(images) == 1 and len(images[0][2]) > 2):
+
+                    self.busy = True
+                    self.askFitsImage(images)
+                    self.wait_window(self.topAskFits)
+                    self.busy = False
+
+                    if self.cancelled:
+                        self.varMessageLabel.set('Cancelled.')
+                        self.labelMessage.configure(foreground='crimson')
+                        raise Exception
+
+                    hdu, plane = self.fitsChoices[self.varFitsImage.get()]
+
+            # Get image data, metadata and CFA pattern in one pass without temporary files
+            try:
+                decoded = self.frameCache.readFrame(py_filepath,
+                                                    getPattern=(hasCFA and self.CFAPattern is None),
+                                                    hdu=hdu, plane=plane)
+            except Exception:
+                self.varMessageLabel.set('Could not read the image data of "{}".'.format(filename))
+                self.labelMessage.configure(foreground='crimson')
+                raise Exception
+
+        img, metadata, isExif, pattern = decoded
+
+        if len(img.shape) != 2:
+            self.varMessageLabel.set('Image file "{}" contains colour channels. '.format(filename) \
+                                    + 'Please use a non-debayered image.')
+            self.labelMessage.configure(foreground='crimson')
+            raise Exception
+
+        # If image is a DSLR raw image
+        if isRaw:
+
+            try:
+                iso = int(str(metadata['EXIF ISOSpeedRatings']))
+
+            except (KeyError, ValueError):
+                iso = None
+
+            if iso is not None:
+
+                isovals = []
+
+                for otherlabel in self.labelList:
+
+                    if label is not otherlabel and otherlabel.iso is not None:
+
+                        isovals.append(otherlabel.iso)
+
+                if len(isovals) > 0 and isovals[1:] == isovals[:-1] and not iso in isovals:
+
+                    warning = 'This frame has ISO {:d}, whereas the\nother added frames have ISO {:d}.' \
+                               .format(iso, isovals[0]) + '\nStill proceed?'
+
+                    if not self.showWarning('Warning', warning, 'Yes', 'Cancel', lambda: None):
+
+                        self.varMessageLabel.set('Cancelled.')
+                        self.labelMessage.configure(foreground='crimson')
+                        raise Exception
+
+            label.exposure = self.checkExp(isExif, metadata, compare, label, type)
+            label.iso = iso
+
+        # If image is a CCD raw image
+        else:
+
+            label.exposure = self.checkExp(isExif, metadata, compare, label, type)
+
+        # If image has a CFA, find the pattern so that the colour channels can be separated
+        if hasCFA:
+
+            self.varMessageLabel.set('{} - Detecting CFA pattern..'.format(filename))
+            self.labelMessage.configure(foreground='navy')
+            self.labelMessage.update_idletasks()
+
+            self.cancelled = False
+
+            # Use the CFA pattern detected while decoding the raw file
+            if self.CFAPattern is None:
+                self.CFAPattern = pattern
+
+            # Ask user for CFA pattern if it wasn't detected or if camera is colour CCD
+            if self.CFAPattern not in ['RGGB', 'BGGR', 'GRBG', 'GBRG']:
+                self.busy = True
+                self.askCFAPattern()
+                self.wait_window(self.topAskCFA)
+                self.busy = False
+                self.CFAPattern = self.varCFAPattern.get()
+
+            # Abort if user cancels
+            if self.cancelled:
+                self.varMessageLabel.set('Cancelled.')
+                self.labelMessage.configure(foreground='crimson')
+                raise Exception
+
+        self.varMessageLabel.set('{} - Checking image dimensions..'.format(filename))
+        self.labelMessage.configure(foreground='navy')
+        self.labelMessage.update_idletasks()
+
+        # Show error if the image size if different from the previously added image
+        if compare and img.shape != compare.stretched_img.shape:
+            self.varMessageLabel.set('The dimensions of "{}" does not match '.format(filename) \
+                                     + 'those of the other added frame.')
+            self.labelMessage.configure(foreground='crimson')
+            raise Exception
+
+        # Store raw image data as label attribute
+
+        self.varMessageLabel.set('{} - Creating temporary raw data file..'.format(filename))
+        self.labelMessage.configure(foreground='navy')
+        self.labelMessage.update_idletasks()
+
+        self.frameStore.add(self.labelNames[label], img)
+        self.histStats.remove(self.labelNames[label])
+
+        self.varMessageLabel.set('{} - Indexing image regions..'.format(filename))
+        self.labelMessage.configure(foreground='navy')
+        self.labelMessage.update_idletasks()
+
+        # Index used for statistics of selected regions
+        label.regionStats = RegionStatistics(self.frameStore.get(self.labelNames[label]))
+
+        self.varMessageLabel.set('{} - Applying screen stretch..'.format(filename))
+        self.labelMessage.configure(foreground='navy')
+        self.labelMessage.update_idletasks()
+
+        img = None
+
+        # Compute the histogram once, so that any stretch can be done with lookup tables
+        linear_img = self.getLinearImage(label)
+        label.hist = apc.imageHistogram(linear_img)
+
+        # The histogram of 16-bit data also gives the exact median of the frame
+        if apc.isLUTImage(self.frameStore.get(self.labelNames[label])):
+            self.histStats.setHistogram(self.labelNames[label], label.hist)
+        label.lut = apc.autostretchLUT(label.hist)
+        label.stretched_img = apc.applyLUT(linear_img, label.lut)
+
+        self.varMessageLabel.set('{} - Creating display image..'.format(filename))
+        self.labelMessage.configure(foreground='navy')
+        self.labelMessage.update_idletasks()
+        self.updateDisplayedImage(label)
+
+    def checkExp(self, isTiff, metadata, compare, label, type):
+
+        '''Find the exposure time of the added image, and compare to existing values.'''
+
+        try:
+            # Check image metadata for exposure time
+            if isTiff:
+                exposure_str = str(metadata['EXIF ExposureTime'])
+            else:
+                try:
+                    exposure_str = str(metadata['EXPTIME'])
+                except:
+                    exposure_str = str(metadata['EXPOSURE'])
+
+            # Calculate exposure in seconds if the quoted exposure time is a fraction
+            if '/' in exposure_str:
+
+                fraction_parts = exposure_str.split('/')
+                exposure_num = float(fraction_parts[0])/float(fraction_parts[1])
+
+            else:
+
+                exposure_num = float(exposure_str)
+
+            # Show a warning of two frames of the same (relevant) type have very different exposures
+            if compare and compare.exposure is not None:
+
+                exp1 = compare.exposure
+                exp2 = exposure_num
+
+                if self.tooDiff(exp1, exp2):
+
+                    warning = 'The two {} frames have\nsignificantly different '.format(type) \
+                               + 'exposure times.\n({:.4g} s vs. {:.4g} s)\nStill proceed?' \
+                               .format(exp1, exp2)
+
+                    if not self.showWarning('Warning', warning, 'Yes', 'Cancel', lambda: None):
+
+                        self.varMessageLabel.set('Cancelled.')
+                        self.labelMessage.configure(foreground='crimson')
+                        raise Exception
+
+        except (KeyError, ValueError):
+            exposure_num = None
+
+        warning = False
+
+        # Compare light and dark exposure times and show a warning if they are very different
+        if type == 'light' and exposure_num is not None:
+
+            expvals = []
+
+            for lab in [self.labelDark1, self.labelDark2]:
+
+                if lab.exposure is not None:
+
+                    expvals.append(lab.exposure)
+
+            if len(expvals) == 1 and self.tooDiff(exposure_num, expvals[0]):
+
+                warning = 'This light frame and an added dark frame\nhave significantly ' \
+                           + 'different exposure times.\n({:.4g} s vs. {:.4g} s)\nStill proceed?' \
+                           .format(exposure_num, expvals[0])
+
+            elif len(expvals) == 2 and not self.tooDiff(*expvals) \
+                                   and self.tooDiff(exposure_num, expvals[0]):
+
+                warning = 'This light frame and the added dark frames\nhave significantly ' \
+                          + 'different exposure times.\n({:.4g} s vs. {:.4g} s)\nStill proceed?' \
+                          .format(exposure_num, expvals[0])
+
+        elif type == 'dark' and self.displayed_light == 1 and exposure_num is not None:
+
+            if self.tooDiff(self.labelLight.exposure, exposure_num) \
+                                and (label is self.labelDark1 or self.labelDark1.exposure is None):
+
+                warning = 'This dark frame and the added light frame\nhave significantly ' \
+                          + 'different exposure times.\n({:.4g} s vs. {:.4g} s)\nStill proceed?' \
+                          .format(exposure_num, self.labelLight.exposure)
+
+        # Display the warning window
+        if warning:
+            if not self.showWarning('Warning', warning, 'Yes', 'Cancel', lambda: None):
+
+                self.varMessageLabel.set('Cancelled.')
+                self.labelMessage.configure(foreground='crimson')
+                raise Exception
+
+        return exposure_num
+
+    def tooDiff(self, exp1, exp2):
+
+        '''Return true if the exposure times differ by more than 10%.'''
+
+        return np.abs(exp1 - exp2) >= 0.05*(exp1 + exp2)
+
+    def askCFAPattern(self):
+
+        '''Show window with options for choosing which CFA pattern to use.'''
+
+        def ok():
+
+            '''Set confirmation that the window wasn't exited, and close window.'''
+
+            self.cancelled = False
+            self.topAskCFA.destroy()
+
+        # Setup window
+
+        self.topAskCFA = tk.Toplevel(background=C.DEFAULT_BG)
+        self.topAskCFA.title('Choose filter pattern')
+        self.cont.addIcon(self.topAskCFA)
+        apc.setupWindow(self.topAskCFA, 300, 145)
+        self.topAskCFA.focus_force()
+
+        self.cancelled = True
+        CFAList = ['RGGB', 'BGGR', 'GRBG', 'GBRG']
+
+        self.varCFAPattern = tk.StringVar()
+        self.varCFAPattern.set(CFAList[0])
+
+        ttk.Label(self.topAskCFA, text='Choose the colour filter pattern of your camera.',
+                  anchor='center').pack(side='top', pady=(10*C.scsy, 5*C.scsy), expand=True)
+
+        ttk.OptionMenu(self.topAskCFA, self.varCFAPattern, None, *CFAList).pack(side='top',
+                                                                                expand=True,
+                                                                                pady=(0, 10*C.scsy))
+
+        ttk.Button(self.topAskCFA, text='OK', command=ok).pack(side='top', expand=True,
+                                                               pady=(0, 10*C.scsy))
+
+    def askFitsImage(self, images):
+
+        '''Show window with options for choosing which image of a FITS file to use.'''
+
+        def ok():
+
+            '''Set confirmation that the window wasn't exited, and close window.'''
+
+            self.cancelled = False
+            self.topAskFits.destroy()
+
+        # List every image, and every plane of data cubes
+        self.fitsChoices = {}
+
+        for index, name, shape in images:
+
+            hduname = 'HDU {:d}{}'.format(index, (' ({})'.format(name) if name not in ['', 'PRIMARY'] else ''))
+
+            if len(shape) == 2:
+                self.fitsChoices['{} - {:d}x{:d}'.format(hduname, shape[1], shape[0])] = (index, 0)
+            else:
+                for plane in range(shape[0]):
+                    self.fitsChoices['{} - plane {:d} of {:d}'.format(hduname, plane + 1, shape[0])] \
+                                                                                        = (index, plane)
+
+        choices = list(self.fitsChoices.keys())
+
+        # Setup window
+
+        self.topAskFits = tk.Toplevel(background=C.DEFAULT_BG)
+        self.topAskFits.title('Choose image')
+        self.cont.addIcon(self.topAskFits)
+        apc.setupWindow(self.topAskFits, 300, 145)
+        self.topAskFits.focus_force()
+
+        self.cancelled = True
+
+        self.varFitsImage = tk.StringVar()
+        self.varFitsImage.set(choices[0])
+
+        ttk.Label(self.topAskFits, text='The FITS file contains several images.\nChoose which one to use.',
+                  anchor='center').pack(side='top', pady=(10*C.scsy, 5*C.scsy), expand=True)
+
+        ttk.OptionMenu(self.topAskFits, self.varFitsImage, None, *choices).pack(side='top',
+                                                                                expand=True,
+                                                                                pady=(0, 10*C.scsy))
+
+        ttk.Button(self.topAskFits, text='OK', command=ok).pack(side='top', expand=True,
+                                                                pady=(0, 10*C.scsy))
+
+    def showImageEvent(self, event):
+
+        '''Only call the show image method when label is clicked if no topwindow is showing.'''
+
+        if not self.busy: self.showImage(event.widget)
+
+    def showImage(self, label, filename=False):
+
+        '''Change background of given label to blue and show the photoimage of the label.'''
+
+        label.configure(style='leftselectedfile.TLabel')
+
+        label.leftselected = True
+        label.rightselected = False
+
+        for other_label in self.labelList:
+
+            other_label.rightselected = False
+
+            if other_label is not label:
+                other_label.leftselected = False
+                other_label.configure(style='file.TLabel')
+
+        # Store dimensions of the raw and the displayed image
+        self.canvasDisplay.delete(self.selectionBox)
+        self.canvasDisplay.delete(self.measureLine)
+
+        self.fullSize = (label.pyramid.width, label.pyramid.height)
+
+        if self.showResized:
+
+            # Fit the image to the window
+
+            cw = self.scrollbarCanvHor.winfo_width() - 17.0
+            ch = self.scrollbarCanvVer.winfo_height()
+
+            self.zoom = np.min([cw/self.fullSize[0], ch/float(self.fullSize[1])])
+
+            self.imageSize = (int(round(self.zoom*self.fullSize[0])), int(round(self.zoom*self.fullSize[1])))
+
+            self.canvasDisplay.configure(scrollregion=(0, 0, 0, 0))
+
+        else:
+
+            self.imageSize = (int(round(self.zoom*self.fullSize[0])), int(round(self.zoom*self.fullSize[1])))
+
+            self.canvasDisplay.configure(scrollregion=(0, 0, self.imageSize[0], self.imageSize[1]))
+
+        self.renderImage()
+        self.drawGridOverlay(label)
+
+        # Display the FOV of the non-resized light frame
+        self.setFOV(0, self.fullSize[0], 0, self.fullSize[1], False)
+
+        # Update ISO and exposure time labels
+
+        if label.exposure is not None:
+            self.varImInfo.set('Exposure time: {:.4g} s'.format(label.exposure))
+        else:
+            self.varImInfo.set('Exposure time: Not detected')
+
+        if self.cont.isDSLR:
+            if label.iso is not None:
+                self.varImInfo.set('ISO: {:d}        {}'.format(label.iso, self.varImInfo.get()))
+            else:
+                self.varImInfo.set('ISO: Not detected        {}'.format(self.varImInfo.get()))
+
+        # Disable image interaction for resized images, except for measuring in the light frame
+        if label is self.labelLight:
+            self.menuRC.entryconfig(6, state='normal')
+        else:
+            if self.mode == 'measure':
+
+                self.useSelectMode()
+
+                if self.showResized or self.zoom != 1.0:
+                    self.canvasDisplay.unbind('<Button-1>')
+                    self.canvasDisplay.unbind('<B1-Motion>')
+                    self.canvasDisplay.unbind('<ButtonRelease-1>')
+
+            self.menuRC.entryconfig(6, state='disabled')
+
+        self.varMessageLabel.set('Done.')
+        self.labelMessage.configure(foreground='navy')
+        self.labelMessage.update_idletasks()
 
         self.menuActive = False
 
-    def removeImageEvent(self, event):
+    def removeImageEvent(self, event):
+
+        '''Mark right-clicked label with red, and remove marked labels if right-clicked again.'''
+
+        if self.busy: return None
+
+        if event.widget.rightselected:
+
+            activateNew = False
+            activelabel = None
+            count = 0
+
+            # Loop through all labels
+            for label in self.labelList:
+
+                if label.rightselected:
+
+                    # Remove info for labels that have been right-clicked
+
+                    if label is self.labelBias1 or label is self.labelBias2:
+
+                        if self.displayed_bias == 1:
+
+                            self.forgetAttributes(self.labelBias1)
+                            self.frameStore.remove(self.labelNames[self.labelBias1])
+                            self.histStats.remove(self.labelNames[self.labelBias1])
+
+                            self.labelBias1.pack_forget()
+                            self.varBias1Label.set('')
+                            self.frameBias.pack_forget()
+                            self.labelBiasH.pack_forget()
+
+                            self.displayed_bias = 0
+
+                        elif self.displayed_bias == 2:
+
+                            # Shift info from label 2 to label 1 if label 2 is removed
+
+                            if label is self.labelBias1:
+                                self.labelBias1.stretched_img = self.labelBias2.stretched_img
+                                self.labelBias1.pyramid = self.labelBias2.pyramid
+                                self.labelBias1.regionStats = self.labelBias2.regionStats
+                                self.labelBias1.hist = self.labelBias2.hist
+                                self.labelBias1.lut = self.labelBias2.lut
+                                self.labelBias2.stretched_img = None
+                                self.labelBias1.exposure = self.labelBias2.exposure
+                                self.labelBias1.iso = self.labelBias2.iso
+                                self.varBias1Label.set(self.varBias2Label.get())
+                                self.frameStore.move(self.labelNames[self.labelBias2], self.labelNames[self.labelBias1])
+                                self.histStats.move(self.labelNames[self.labelBias2], self.labelNames[self.labelBias1])
+
+                                if self.labelBias2.leftselected:
+                                    self.showImage(self.labelBias1)
+
+                            self.forgetAttributes(self.labelBias2)
+
+                            self.labelBias2.pack_forget()
+                            self.varBias2Label.set('')
+                            self.varBiasHLabel.set('Bias frame')
+
+                            self.displayed_bias = 1
+
+                    elif label is self.labelDark1 or label is self.labelDark2:
+
+                        if self.displayed_dark == 1:
+
+                            self.forgetAttributes(self.labelDark1)
+                            self.frameStore.remove(self.labelNames[self.labelDark1])
+                            self.histStats.remove(self.labelNames[self.labelDark1])
+
+                            self.labelDark1.pack_forget()
+                            self.varDark1Label.set('')
+                            self.frameDark.pack_forget()
+                            self.labelDarkH.pack_forget()
+
+                            self.displayed_dark = 0
+
+                        elif self.displayed_dark == 2:
+
+                            if label is self.labelDark1:
+                                self.labelDark1.stretched_img = self.labelDark2.stretched_img
+                                self.labelDark1.pyramid = self.labelDark2.pyramid
+                                self.labelDark1.regionStats = self.labelDark2.regionStats
+                                self.labelDark1.hist = self.labelDark2.hist
+                                self.labelDark1.lut = self.labelDark2.lut
+                                self.labelDark2.stretched_img = None
+                                self.labelDark1.exposure = self.labelDark2.exposure
+                                self.labelDark1.iso = self.labelDark2.iso
+                                self.varDark1Label.set(self.varDark2Label.get())
+                                self.frameStore.move(self.labelNames[self.labelDark2], self.labelNames[self.labelDark1])
+                                self.histStats.move(self.labelNames[self.labelDark2], self.labelNames[self.labelDark1])
+
+                                if self.labelDark2.leftselected:
+                                    self.showImage(self.labelDark1)
+
+                            self.forgetAttributes(self.labelDark2)
+
+                            self.labelDark2.pack_forget()
+                            self.varDark2Label.set('')
+                            self.varDarkHLabel.set('Dark frame')
+
+                            self.displayed_dark = 1
+
+                    elif label is self.labelFlat1 or label is self.labelFlat2:
+
+                        if self.displayed_flat == 1:
+
+                            self.forgetAttributes(self.labelFlat1)
+                            self.frameStore.remove(self.labelNames[self.labelFlat1])
+                            self.histStats.remove(self.labelNames[self.labelFlat1])
+
+                            self.labelFlat1.pack_forget()
+                            self.varFlat1Label.set('')
+                            self.frameFlat.pack_forget()
+                            self.labelFlatH.pack_forget()
+
+                            self.displayed_flat = 0
+
+                        elif self.displayed_flat == 2:
+
+                            if label is self.labelFlat1:
+                                self.labelFlat1.stretched_img = self.labelFlat2.stretched_img
+                                self.labelFlat1.pyramid = self.labelFlat2.pyramid
+                                self.labelFlat1.regionStats = self.labelFlat2.regionStats
+                                self.labelFlat1.hist = self.labelFlat2.hist
+                                self.labelFlat1.lut = self.labelFlat2.lut
+                                self.labelFlat2.stretched_img = None
+                                self.labelFlat1.exposure = self.labelFlat2.exposure
+                                self.labelFlat1.iso = self.labelFlat2.iso
+                                self.varFlat1Label.set(self.varFlat2Label.get())
+                                self.frameStore.move(self.labelNames[self.labelFlat2], self.labelNames[self.labelFlat1])
+                                self.histStats.move(self.labelNames[self.labelFlat2], self.labelNames[self.labelFlat1])
+
+                                if self.labelFlat2.leftselected:
+                                    self.showImage(self.labelFlat1)
+
+                            self.forgetAttributes(self.labelFlat2)
+
+                            self.labelFlat2.pack_forget()
+                            self.varFlat2Label.set('')
+                            self.varFlatHLabel.set('Flat frame')
+
+                            self.displayed_flat = 1
+
+                    elif label is self.labelLight:
+
+                        self.forgetAttributes(self.labelLight)
+                        self.frameStore.remove(self.labelNames[self.labelLight])
+                        self.histStats.remove(self.labelNames[self.labelLight])
+
+                        self.labelLight.pack_forget()
+                        self.varLightLabel.set('')
+                        self.labelLightH.pack_forget()
+                        self.displayed_light = 0
+                        self.varFOV.set('')
+
+                    elif label is self.labelSaturated:
+
+                        self.forgetAttributes(self.labelSaturated)
+                        self.frameStore.remove(self.labelNames[self.labelSaturated])
+                        self.histStats.remove(self.labelNames[self.labelSaturated])
+
+                        self.labelSaturated.pack_forget()
+                        self.varSaturatedLabel.set('')
+                        self.labelSaturatedH.pack_forget()
+                        self.displayed_saturated = 0
+
+                    label.configure(style='file.TLabel')
+                    label.rightselected = False
+
+                    # Store left-clicked label if it exists
+                    if label.leftselected:
+                        activateNew = True
+                        activelabel = label
+
+                    count += 1
+
+            # Move selection if the left-clicked label was removed
+            if activateNew:
+
+                if self.displayed_dark == 1 and (activelabel is self.labelDark1 \
+                                                 or activelabel is self.labelDark2):
+                    self.showImage(self.labelDark1)
+                elif self.displayed_flat == 1 and (activelabel is self.labelFlat1 \
+                                                   or activelabel is self.labelFlat2):
+                    self.showImage(self.labelFlat1)
+                elif self.displayed_bias >= 1:
+                    self.showImage(self.labelBias1)
+                elif self.displayed_dark >= 1:
+                    self.showImage(self.labelDark1)
+                elif self.displayed_flat >= 1:
+                    self.showImage(self.labelFlat1)
+                elif self.displayed_light == 1:
+                    self.showImage(self.labelLight)
+                elif self.displayed_saturated == 0:
+                    self.clearFiles()
+            else:
+                self.getSelectedLabel().configure(style='leftselectedfile.TLabel')
+
+            self.varMessageLabel.set('Frame removed.' if count == 1 else 'Frames removed.')
+            self.labelMessage.configure(foreground='navy')
+
+        # Change label background to red if it isn't already right-clicked
+        else:
+            if event.widget.leftselected:
+                event.widget.configure(style='leftrightselectedfile.TLabel')
+            else:
+                event.widget.configure(style='rightselectedfile.TLabel')
+            event.widget.rightselected = True
+
+    def computeSensorData(self):
+
+        '''Calculate sensor parameters from added files.'''
+
+        # If not all required files have been added
+        if not (self.displayed_bias == 2 and \
+                self.displayed_flat == 2 and \
+                self.displayed_saturated == 1):
+
+            # Ask user to use light frame instead of saturated frame if added
+            if self.displayed_bias == 2 and \
+               self.displayed_flat == 2 and \
+               self.displayed_light == 1:
+
+                text='A frame containing saturated pixels is required\nto compute sensor data. ' \
+                      + 'Does the added\nlight frame contain saturated pixels?'
+
+                if not self.showWarning('Note', text, 'Yes', 'No', lambda: None):
+                    self.varMessageLabel.set('Cancelled. Please add a saturated ' \
+                                             + 'frame to compute sensor data.')
+                    self.labelMessage.configure(foreground='crimson')
+                    self.menuActive = False
+                    return False
+
+                # Use light frame as saturated frame
+                saturated = self.frameStore.get(self.labelNames[self.labelLight])
+                useLight = True
+
+            # Show message if required files haven't been added
+            else:
+                self.varMessageLabel.set('Two bias frames, two flat frames and ' \
+                             + 'one saturated (or light) frame is required to compute sensor data.')
+                self.labelMessage.configure(foreground='crimson')
+                return None
+        else:
+
+            saturated = self.frameStore.get(self.labelNames[self.labelSaturated])
+            useLight = False
+
+        # Get raw image data
+        bias1 = self.frameStore.get(self.labelNames[self.labelBias1])
+        bias2 = self.frameStore.get(self.labelNames[self.labelBias2])
+        flat1 = self.frameStore.get(self.labelNames[self.labelFlat1])
+        flat2 = self.frameStore.get(self.labelNames[self.labelFlat2])
+
+        # Define central crop area for flat frames, starting at a CFA block
+        h, w = flat1.shape
+        a = int(0.25*h)//2*2
+        b = int(0.75*h)
+        c = int(0.25*w)//2*2
+        d = int(0.75*w)
+
+        # Define central crop area for bias frames
+        h2, w2 = bias1.shape
+        a2 = int(0.25*h2)//2*2
+        b2 = int(0.75*h2)
+        c2 = int(0.25*w2)//2*2
+        d2 = int(0.75*w2)
+
+        # Crop flat frames
+        flat1_crop = flat1[a:b, c:d]
+        flat2_crop = flat2[a:b, c:d]
+
+        # Crop bias frames
+        bias1_crop = bias1[a2:b2, c2:d2]
+        bias2_crop = bias2[a2:b2, c2:d2]
+
+        self.white_level = np.max(saturated)
+
+        delta_bias = bias1_crop + 30000 - bias2_crop
+        delta_flat = flat1_crop + 30000 - flat2_crop
+
+        # Hot and warm pixels to leave out, if requested
+        bias_mask = self.getPixelMask(bias1)
+        flat_mask = self.getPixelMask(flat1)
+
+        if bias_mask is not None: bias_mask = bias_mask[a2:b2, c2:d2]
+        if flat_mask is not None: flat_mask = flat_mask[a:b, c:d]
+
+        # Compute levels and noise of every colour channel at once, with outliers clipped if requested
+        clip = self.varSigmaClip.get()
+
+        bias1_stats = self.getChannelStatistics(bias1_crop, mask=bias_mask)
+        bias2_stats = self.getChannelStatistics(bias2_crop, mask=bias_mask)
+        flat1_stats = self.getChannelStatistics(flat1_crop, mask=flat_mask)
+        flat2_stats = self.getChannelStatistics(flat2_crop, mask=flat_mask)
+        delta_bias_stats = self.getChannelStatistics(delta_bias, mask=bias_mask, clip=clip)
+        delta_flat_stats = self.getChannelStatistics(delta_flat, mask=flat_mask, clip=clip)
+
+        channels = list(bias1_stats.keys())
+
+        black_level = np.array([0.5*(bias1_stats[ch][2] + bias2_stats[ch][2]) for ch in channels])
+        flat_level_ADU = np.array([0.5*(flat1_stats[ch][2] + flat2_stats[ch][2]) for ch in channels])
+
+        read_noise_ADU = np.array([delta_bias_stats[ch][3] for ch in channels])/np.sqrt(2)
+
+        flat_noise_ADU = np.array([delta_flat_stats[ch][3] for ch in channels])/np.sqrt(2)
+
+        photon_noise_ADU_squared = flat_noise_ADU**2 - read_noise_ADU**2
+        photon_level_ADU = flat_level_ADU - black_level
+
+        gain = photon_level_ADU/photon_noise_ADU_squared
+
+        rn = gain*read_noise_ADU
+
+        # Store the values of each channel
+        self.channelSensorData = {ch: (gain[i], rn[i], black_level[i], flat_level_ADU[i]) \
+                                  for i, ch in enumerate(channels)}
+
+        # Use the green channels for the camera data
+        green = [i for i, ch in enumerate(channels) if ch in ['G1', 'G2']]
+        if len(green) == 0: green = list(range(len(channels)))
+
+        self.gain = np.mean(gain[green])
+
+        self.rn = np.mean(rn[green])
+
+        self.black_level = np.mean(black_level[green])
+
+        self.sat_cap = self.gain*self.white_level
+
+        self.varMessageLabel.set('Sensor data computed.')
+        self.labelMessage.configure(foreground='navy')
+
+        isovals = []
+
+        for label in [self.labelBias1, self.labelBias2, self.labelFlat1, self.labelFlat2,
+                      self.labelLight if useLight else self.labelSaturated]:
+
+            if label.iso is not None:
+                isovals.append(label.iso)
+
+        if len(isovals) > 0 and isovals[1:] == isovals[:-1]:
+            con_iso = isovals[0]
+        else:
+            con_iso = False
+
+        self.showSensorResults(channels, con_iso)
+
+    def computePhotonTransfer(self):
+
+        '''
+        Calculate sensor parameters from the photon transfer curve of any number of bias frames
+        and pairs of flat frames with different exposures, processing one frame at a time.
+        '''
+
+        self.disableWidgets()
+
+        supportedformats = self.supportedformats if self.cont.isDSLR \
+                                                 else [self.supportedformats[1]]
+
+        bias_files = tkinter.filedialog.askopenfilenames(title='Choose bias frames',
+                                                         filetypes=supportedformats,
+                                                         initialdir=self.previousPath)
+
+        if len(bias_files) == 0:
+            self.enableWidgets()
+            return None
+
+        flat_files = tkinter.filedialog.askopenfilenames(title='Choose flat frames (pairs with equal exposures)',
+                                                         filetypes=supportedformats,
+                                                         initialdir=self.previousPath)
+
+        if len(flat_files) == 0:
+            self.enableWidgets()
+            return None
+
+        self.previousPath = '/'.join(flat_files[-1].split('/')[:-1])
+
+        bias_files = [os.sep.join(filepath.split('/')) for filepath in bias_files]
+        flat_files = [os.sep.join(filepath.split('/')) for filepath in flat_files]
+
+        hasCFA = self.cont.isDSLR or self.varCCDType.get() == 'colour'
+        total = len(bias_files) + len(flat_files)
+
+        def showProgress(done):
+
+            '''Show the number of processed frames.'''
+
+            self.varMessageLabel.set('Computing photon transfer curve.. ({:d} of {:d} frames done)' \
+                                     .format(done, total))
+            self.labelMessage.configure(foreground='navy')
+            self.update_idletasks()
+
+        showProgress(0)
+
+        try:
+            sensor, curves, white_level, iso = appt.characterizeSensor(bias_files, flat_files, hasCFA=hasCFA,
+                                                                       pattern=self.CFAPattern,
+                                                                       progress=showProgress)
+        except Exception as error:
+            self.varMessageLabel.set('Could not compute the photon transfer curve: {}'.format(error))
+            self.labelMessage.configure(foreground='crimson')
+            self.enableWidgets()
+            return None
+
+        channels = list(sensor.keys())
+
+        self.channelSensorData = {ch: (sensor[ch][0], sensor[ch][1], sensor[ch][2],
+                                       sensor[ch][2] + np.max(curves[ch][0])) for ch in channels}
+
+        # Use the green channels for the camera data
+        green = [ch for ch in channels if ch in ['G1', 'G2']]
+        if len(green) == 0: green = channels
+
+        self.gain = np.mean([sensor[ch][0] for ch in green])
+        self.rn = np.mean([sensor[ch][1] for ch in green])
+        self.black_level = np.mean([sensor[ch][2] for ch in green])
+        self.sat_cap = np.mean([sensor[ch][3] for ch in green])
+        self.white_level = white_level
+
+        self.varMessageLabel.set('Sensor data computed from {:d} points on the photon transfer curve.' \
+                                 .format(len(curves[channels[0]][0])))
+        self.labelMessage.configure(foreground='navy')
+
+        self.enableWidgets()
+
+        self.showSensorResults(channels, iso if iso is not None else False)
+
+    def sweepSensorISOs(self):
+
+        '''
+        Calculate sensor parameters for every ISO from a folder of bias, flat and saturated frames,
+        with the image type in the file names. The ISOs are processed in parallel, and the results
+        can be saved for all ISOs at once.
+        '''
+
+        if not self.cont.isDSLR:
+            self.varMessageLabel.set('The ISO sweep is only available for DSLRs.')
+            self.labelMessage.configure(foreground='crimson')
+            return None
+
+        self.disableWidgets()
+
+        directory = tkinter.filedialog.askdirectory(initialdir=self.previousPath)
+
+        # Do nothing if no folder was selected
+        if not directory:
+            self.enableWidgets()
+            return None
+
+        self.previousPath = directory
+
+        self.varMessageLabel.set('Reading the ISO of each frame..')
+        self.labelMessage.configure(foreground='navy')
+        self.update_idletasks()
+
+        groups, skipped = appt.isoGroups(os.sep.join(directory.split('/')))
+
+        if len(groups) == 0:
+            self.varMessageLabel.set('No bias, flat or saturated frames with a known ISO found in the folder.')
+            self.labelMessage.configure(foreground='crimson')
+            self.enableWidgets()
+            return None
+
+        self.busy = True
+
+        executor, futures = appt.sweepISOs(groups, hasCFA=True, pattern=self.CFAPattern)
+
+        varState = tk.StringVar() # Set to "done" when all ISOs are processed
+        varState.set('')
+
+        def updateProgress():
+
+            '''Show the number of processed ISOs until all are done.'''
+
+            done = sum(future.done() for future in futures.values())
+
+            self.varMessageLabel.set('Computing sensor data.. ({:d} of {:d} ISOs done)'.format(done, len(futures)))
+            self.labelMessage.configure(foreground='navy')
+
+            if done == len(futures):
+                varState.set('done')
+            else:
+                self.after(200, updateProgress)
+
+        updateProgress()
+        self.wait_variable(varState)
+
+        executor.shutdown(wait=False)
+
+        self.busy = False
+
+        # Use the green channels for the camera data of each ISO
+        results = {}
+
+        for iso in sorted(futures):
+
+            if futures[iso].exception() is not None:
+                skipped.append('ISO {:d}'.format(iso))
+                continue
+
+            sensor, curves, white_level, con_iso = futures[iso].result()
+
+            green = [ch for ch in sensor if ch in ['G1', 'G2']]
+            if len(green) == 0: green = list(sensor.keys())
+
+            gain, rn, black_level, sat_cap = np.mean([sensor[ch] for ch in green], axis=0)
+
+            results[iso] = (gain, rn, sat_cap, black_level, white_level)
+
+        if len(results) == 0:
+            self.varMessageLabel.set('Could not compute sensor data for any ISO.')
+            self.labelMessage.configure(foreground='crimson')
+            self.enableWidgets()
+            return None
+
+        if len(skipped) == 0:
+            self.varMessageLabel.set('Sensor data computed for {:d} ISOs.'.format(len(results)))
+            self.labelMessage.configure(foreground='navy')
+        else:
+            self.varMessageLabel.set('Sensor data computed for {:d} ISOs. Skipped: {}.' \
+                                     .format(len(results), ', '.join(skipped)))
+            self.labelMessage.configure(foreground='crimson')
+
+        self.busy = True
+
+        # Setup window displaying calculated values, with option to save data
+        self.topResults = tk.Toplevel(background=C.DEFAULT_BG)
+        self.topResults.title('Computed sensor data')
+        self.cont.addIcon(self.topResults)
+        apc.setupWindow(self.topResults, 500, 130 + 25*len(results))
+        self.topResults.focus_force()
+
+        ttk.Label(self.topResults, text='Computed sensor data (green)', font=self.cont.smallbold_font,
+                  anchor='center').pack(side='top', pady=(15*C.scsy, 5*C.scsy), expand=True)
+
+        frameResults = ttk.Frame(self.topResults)
+        frameResults.pack(side='top', expand=True)
+
+        headers = ['ISO', 'Gain (e-/ADU)', 'Read noise (e-)', 'Sat. cap. (e-)', 'Black level', 'White level']
+
+        for j, header in enumerate(headers):
+            ttk.Label(frameResults, text=header, anchor='center').grid(row=0, column=j, padx=3*C.scsx)
+
+        for i, iso in enumerate(sorted(results)):
+
+            gain, rn, sat_cap, black_level, white_level = results[iso]
+
+            texts = ['{:d}'.format(iso), '{:.3g}'.format(gain), '{:.3g}'.format(rn),
+                     '{:d}'.format(int(round(sat_cap))), '{:d}'.format(int(round(black_level))),
+                     '{:d}'.format(int(round(white_level)))]
+
+            for j, text in enumerate(texts):
+                ttk.Label(frameResults, text=text, anchor='center').grid(row=i+1, column=j)
+
+        ttk.Button(self.topResults, text='Save sensor data',
+                   command=lambda: self.saveSensorSweep(results))\
+                  .pack(side='top', pady=((5*C.scsy, 20*C.scsy)), expand=True)
+
+        self.wait_window(self.topResults)
+
+        self.busy = False
+        self.enableWidgets()
+
+    def saveSensorSweep(self, results):
+
+        '''
+        Save the calculated sensor values of several ISOs to "cameradata.txt" in a single update,
+        where results holds the gain, read noise, saturation capacity, black level and white
+        level of each ISO. The new file replaces the old one in one step, so it is never
+        left partially written.
+        '''
+
+        filename = 'aplab_data{}cameradata.txt'.format(os.sep)
+
+        # Read camera data file
+        file = open(filename, 'r')
+        old_text = file.read()
+        lines = old_text.split('\n')
+        file.close()
+
+        file = open('aplab_data{}cameradata_user_backup.txt'.format(os.sep), 'w')
+        file.write(old_text)
+        file.close()
+
+        new_lines = [lines[0]]
+
+        for line in lines[1:-1]:
+
+            line = line.split(',')
+
+            # Write the other lines with no changes
+            if line[0] != C.CNAME[self.cont.cnum]:
+                new_lines.append(','.join(line))
+                continue
+
+            # Start from scratch if no data exists for the camera
+            if self.cont.noData:
+                columns = [[], [], [], [], [], []]
+                line[7] = 'NA'
+            else:
+                columns = [line[i].split('-') for i in [2, 3, 4, 5, 6, 11]]
+
+            for iso in sorted(results):
+
+                gain, rn, sat_cap, black_level, white_level = results[iso]
+
+                values = ['{:.3g}*'.format(gain), '{:.3g}*'.format(rn), '{:d}*'.format(int(round(sat_cap))),
+                          '{:d}*'.format(int(round(black_level))), '{:d}*'.format(int(round(white_level))),
+                          str(iso)]
+
+                isovals = columns[5]
+
+                # Overwrite the values of an existing ISO, or insert them in order of ISO
+                if str(iso) in isovals:
+                    idx = isovals.index(str(iso))
+                    for column, value in zip(columns, values): column[idx] = value
+                else:
+                    idx = sorted(isovals + [str(iso)], key=int).index(str(iso))
+                    for column, value in zip(columns, values): column.insert(idx, value)
+
+            new_lines.append(','.join(line[:2] + ['-'.join(column) for column in columns[:5]] \
+                                      + line[7:11] + ['-'.join(columns[5])]))
+
+        new_lines.append(lines[-1])
+
+        # Write to a temporary file first and replace the old file with it
+        try:
+            file = open(filename + '.tmp', 'w')
+            file.write('\n'.join(new_lines))
+            file.close()
+            os.replace(filename + '.tmp', filename)
+        except OSError:
+            self.varMessageLabel.set('Could not write to "cameradata.txt".')
+            self.labelMessage.configure(foreground='crimson')
+            return None
+
+        # Insert calculated values to camera info lists
+
+        idx = self.cont.cnum
+
+        C.GAIN[idx] = apc.itpData('-'.join(columns[0]), 'float')
+        C.RN[idx] = apc.itpData('-'.join(columns[1]), 'float')
+        C.SAT_CAP[idx] = apc.itpData('-'.join(columns[2]), 'int')
+        C.BLACK_LEVEL[idx] = apc.itpData('-'.join(columns[3]), 'int')
+        C.WHITE_LEVEL[idx] = apc.itpData('-'.join(columns[4]), 'int')
+        C.ISO[idx] = np.array(columns[5]).astype(int)
+
+        self.cont.noData = False
+
+        for frame in [self.cont.frames[ImageCalculator], self.cont.frames[ImageSimulator],
+                      self.cont.frames[PlottingTool]]:
+
+            frame.reconfigureNonstaticWidgets()
+            frame.setDefaultValues()
+
+        self.varMessageLabel.set('Sensor information for {:d} ISOs added for {}.'.format(len(results), C.CNAME[idx]))
+        self.labelMessage.configure(foreground='navy')
+
+        self.topResults.destroy()
+
+    def showSensorResults(self, channels, con_iso):
+
+        '''
+        Show the computed sensor data of the given colour channels, with the option to save them.
+        The ISO is asked for when saving unless all the frames have the same ISO.
+        '''
+
+        self.disableWidgets()
+        self.busy = True
+
+        # Setup window displaying calculated values, with option to save data
+        self.topResults = tk.Toplevel(background=C.DEFAULT_BG)
+        self.topResults.title('Computed sensor data')
+        self.cont.addIcon(self.topResults)
+        apc.setupWindow(self.topResults, 300, 220 if len(channels) == 1 else 360)
+        self.topResults.focus_force()
+
+        ttk.Label(self.topResults, text='Computed sensor data' if len(channels) == 1 \
+                                        else 'Computed sensor data (green)',
+                  font=self.cont.smallbold_font,
+                  anchor='center').pack(side='top', pady=(15*C.scsy, 5*C.scsy), expand=True)
+
+        frameResults = ttk.Frame(self.topResults)
+        frameResults.pack(side='top', expand=True)
+
+        ttk.Label(frameResults, text='Gain: ').grid(row=0, column=0, sticky='W')
+        ttk.Label(frameResults, text=('{:.3g}'.format(self.gain)), width=7,
+                  anchor='center').grid(row=0, column=1)
+        ttk.Label(frameResults, text=' e-/ADU').grid(row=0, column=2, sticky='W')
+
+        ttk.Label(frameResults, text='Read noise: ').grid(row=1, column=0, sticky='W')
+        ttk.Label(frameResults, text=('{:.3g}'.format(self.rn)), width=7,
+                  anchor='center').grid(row=1, column=1)
+        ttk.Label(frameResults, text=' e-').grid(row=1, column=2, sticky='W')
+
+        ttk.Label(frameResults, text='Black level: ').grid(row=2, column=0, sticky='W')
+        ttk.Label(frameResults, text=('{:d}'.format(int(round(self.black_level)))), width=7,
+                  anchor='center').grid(row=2, column=1)
+        ttk.Label(frameResults, text=' ADU').grid(row=2, column=2, sticky='W')
+
+        ttk.Label(frameResults, text='White level: ').grid(row=3, column=0, sticky='W')
+        ttk.Label(frameResults, text=('{:d}'.format(int(round(self.white_level)))), width=7,
+                  anchor='center').grid(row=3, column=1)
+        ttk.Label(frameResults, text=' ADU').grid(row=3, column=2, sticky='W')
+
+        ttk.Label(frameResults, text='Saturation capacity: ').grid(row=4, column=0, sticky='W')
+        ttk.Label(frameResults, text=('{:d}'.format(int(round(self.sat_cap)))), width=7,
+                  anchor='center').grid(row=4, column=1)
+        ttk.Label(frameResults, text=' e-').grid(row=4, column=2, sticky='W')
+
+        # Show the values of each colour channel
+        if len(channels) > 1:
+
+            frameChannels = ttk.Frame(self.topResults)
+            frameChannels.pack(side='top', pady=(10*C.scsy, 0), expand=True)
+
+            ttk.Label(frameChannels, text='Gain (e-/ADU)').grid(row=1, column=0, sticky='W')
+            ttk.Label(frameChannels, text='Read noise (e-)').grid(row=2, column=0, sticky='W')
+            ttk.Label(frameChannels, text='Black level (ADU)').grid(row=3, column=0, sticky='W')
+
+            for i, ch in enumerate(channels):
+
+                ch_gain, ch_rn, ch_black, ch_flat = self.channelSensorData[ch]
+
+                ttk.Label(frameChannels, text=ch, width=6, anchor='center').grid(row=0, column=i+1)
+                ttk.Label(frameChannels, text='{:.3g}'.format(ch_gain), width=6,
+                          anchor='center').grid(row=1, column=i+1)
+                ttk.Label(frameChannels, text='{:.3g}'.format(ch_rn), width=6,
+                          anchor='center').grid(row=2, column=i+1)
+                ttk.Label(frameChannels, text='{:d}'.format(int(round(ch_black))), width=6,
+                          anchor='center').grid(row=3, column=i+1)
+
+        ttk.Button(self.topResults, text='Save sensor data',
+                   command=lambda: self.saveSensorResults(con_iso))\
+                  .pack(side='top', pady=((5*C.scsy, 20*C.scsy)), expand=True)
+
+        self.wait_window(self.topResults)
+
+        # Close overlying windows if a lower window is exited
+        try:
+            self.topCamInfo.destroy()
+        except:
+            pass
+
+        self.busy = False
+        self.enableWidgets()
 
-        '''Mark right-clicked label with red, and remove marked labels if right-clicked again.'''
+    def updateFrameButtonText(self, type):
 
-        if self.busy: return None
+        '''Change text of "add frames" button when optionmenu selection changes.'''
 
-        if event.widget.rightselected:
+        if type == 'Bias':
+            self.varAddButtonLabel.set('Add bias frames')
+        elif type == 'Dark':
+            self.varAddButtonLabel.set('Add dark frames')
+        elif type == 'Flat':
+            self.varAddButtonLabel.set('Add flat frames')
+        elif type == 'Light':
+            self.varAddButtonLabel.set('Add light frame')
+        elif type == 'Saturated':
+            self.varAddButtonLabel.set('Add saturated frame')
 
-            activateNew = False
-            activelabel = None
-            count = 0
+    def saveSensorResults(self, con_iso):
+
+        '''Get required camera info from user before saving calculated sensor values.'''
+
+        varISO = tk.IntVar()
+        varMessageLabel = tk.StringVar()
+
+        varISO.set('')
+
+        def executeSensorResultSave():
+
+            '''Save calculated sensor values to "cameradata.txt".'''
+
+            if self.cont.isDSLR:
+
+                if con_iso:
+                    iso = str(con_iso)
+                else:
+                    # Get inputted ISO value for DSLR
+                    try:
+                        iso = str(int(varISO.get()))
+                    except ValueError:
+                        varMessageLabel.set('Invalid ISO input. Must be an integer.')
+                        return None
+
+            # Read camera data file
+            file = open('aplab_data{}cameradata.txt'.format(os.sep), 'r')
+            old_text = file.read()
+            lines = old_text.split('\n')
+            file.close()
+
+            file = open('aplab_data{}cameradata_user_backup.txt'.format(os.sep), 'w')
+            file.write(old_text)
+            file.close()
+
+            file = open('aplab_data{}cameradata.txt'.format(os.sep), 'w')
+
+            file.write(lines[0])
+
+            for line in lines[1:-1]:
+
+                line = line.split(',')
+
+                # Find relevant line in the camera data file
+                if line[0] == C.CNAME[self.cont.cnum]:
+
+                    # If no data exists for the camera
+                    if self.cont.noData:
+
+                        g_idx1 = rn_idx1 = 0
+                        g_idx2 = rn_idx2 = 1
+
+                        # Add the data
+                        file.write('\n{},{},{:.3g}*,{:.3g}*,{:d}*,{:d}*,{:d}*,{},{},{},{}' \
+                                    .format(line[0], line[1], self.gain, self.rn, int(round(self.sat_cap)),
+                                       int(round(self.black_level)), int(round(self.white_level)), 'NA',
+                                       line[8], line[9], line[10]))
+                        if self.cont.isDSLR: file.write(',' + iso)
+
+                        self.cont.noData = False
+
+                    # If data already exists
+                    else:
+
+                        # Read existing values
+                        gainvals = line[2].split('-')
+                        gv_stripped = ['{:.2g}'.format(float(val.split('*')[0])) for val in gainvals]
+                        rnvals = line[3].split('-')
+                        rv_stripped = ['{:.2g}'.format(float(val.split('*')[0])) for val in rnvals]
+                        satcapvals = line[4].split('-')
+                        blvals = line[5].split('-')
+                        wlvals = line[6].split('-')
+
+                        # Find where to add new values, or which old values to overwrite
+
+                        if self.cont.isDSLR:
+
+                            isovals = line[11].split('-')
+
+                            if iso in isovals:
+
+                                g_idx1 = rn_idx1 = isovals.index(iso)
+                                g_idx2 = rn_idx2 = g_idx1 + 1
+
+                            else:
+
+                                g_idx1 = g_idx2 = rn_idx1 = rn_idx2 = sorted(isovals + [iso],
+                                                                             key=int).index(iso)
+
+                        else:
+
+                            if ('{:.2g}'.format(self.rn)) in rv_stripped:
+
+                                rn_idx1 = rv_stripped.index('{:.2g}'.format(self.rn))
+                                rn_idx2 = rn_idx1 + 1
+                            else:
+
+                                rn_idx1 = rn_idx2 = sorted(rv_stripped + ['{:.3g}'.format(self.rn)],
+                                                           key=float).index(('{:.3g}'.format(self.rn)))
+
+                            if ('{:.2g}'.format(self.gain)) in gv_stripped:
+
+                                g_idx1 = gv_stripped.index('{:.2g}'.format(self.gain))
+                                g_idx2 = g_idx1 + 1
+
+                            else:
+
+                                g_idx1 = g_idx2 = sorted(gv_stripped + ['{:.3g}'.format(self.gain)],
+                                                         key=float).index(('{:.3g}'.format(self.gain)))
+
+                        # Add calculated values to camera data file
+                        file.write('\n{},{},{},{},{},{},{},{},{},{},{}' \
+                    .format(line[0], line[1],
+                       '-'.join(gainvals[:g_idx1] + ['{:.3g}*'.format(self.gain)] + gainvals[g_idx2:]),
+                       '-'.join(rnvals[:rn_idx1] + ['{:.3g}*'.format(self.rn)] + rnvals[rn_idx2:]),
+                       '-'.join(satcapvals[:g_idx1] + ['{:d}*'.format(int(round(self.sat_cap)))] + satcapvals[g_idx2:]),
+                       '-'.join(blvals[:g_idx1] + ['{:d}*'.format(int(round(self.black_level)))] + blvals[g_idx2:]),
+                       '-'.join(wlvals[:g_idx1] + ['{:d}*'.format(int(round(self.white_level)))] + wlvals[g_idx2:]),
+                       line[7], line[8], line[9], line[10]))
+
+                        if self.cont.isDSLR: file.write(',{}'.format('-'.join(isovals[:g_idx1] + [iso] \
+                                                                          + isovals[g_idx2:])))
+
+                # Write the other lines with no changes
+                else:
+
+                    file.write('\n' + ','.join(line))
+
+            file.write('\n' + lines[-1])
+            file.close()
+
+            # Insert calculated values to camera info lists
+
+            idx = self.cont.cnum
+
+            if g_idx2 == g_idx1 + 1:
+                C.GAIN[idx][0][g_idx1] = float('{:.3g}'.format(self.gain))
+                C.GAIN[idx][1][g_idx1] = 1
+                C.SAT_CAP[idx][0][g_idx1] = int(round(self.sat_cap))
+                C.SAT_CAP[idx][1][g_idx1] = 1
+                C.BLACK_LEVEL[idx][0][g_idx1] = int(round(self.black_level))
+                C.BLACK_LEVEL[idx][1][g_idx1] = 1
+                C.WHITE_LEVEL[idx][0][g_idx1] = int(round(self.white_level))
+                C.WHITE_LEVEL[idx][1][g_idx1] = 1
+                if self.cont.isDSLR: C.ISO[idx][g_idx1] = int(iso)
+            else:
+                C.GAIN[idx][0] = np.insert(C.GAIN[idx][0], g_idx1, float('{:.3g}'.format(self.gain)))
+                C.GAIN[idx][1] = np.insert(C.GAIN[idx][1], g_idx1, 1)
+                C.SAT_CAP[idx][0] = np.insert(C.SAT_CAP[idx][0], g_idx1, int(round(self.sat_cap)))
+                C.SAT_CAP[idx][1] = np.insert(C.SAT_CAP[idx][1], g_idx1, 1)
+                C.BLACK_LEVEL[idx][0] = np.insert(C.BLACK_LEVEL[idx][0], g_idx1, int(round(self.black_level)))
+                C.BLACK_LEVEL[idx][1] = np.insert(C.BLACK_LEVEL[idx][1], g_idx1, 1)
+                C.WHITE_LEVEL[idx][0] = np.insert(C.WHITE_LEVEL[idx][0], g_idx1, int(round(self.white_level)))
+                C.WHITE_LEVEL[idx][1] = np.insert(C.WHITE_LEVEL[idx][1], g_idx1, 1)
+                if self.cont.isDSLR: C.ISO[idx] = np.insert(C.ISO[idx], g_idx1, int(iso))
+
+            if rn_idx2 == rn_idx1 + 1:
+                C.RN[idx][0][rn_idx1] = float('{:.3g}'.format(self.rn))
+                C.RN[idx][1][rn_idx1] = 1
+            else:
+                C.RN[idx][0] = np.insert(C.RN[idx][0], rn_idx1, float('{:.3g}'.format(self.rn)))
+                C.RN[idx][1] = np.insert(C.RN[idx][1], rn_idx1, 1)
+
+            for frame in [self.cont.frames[ImageCalculator], self.cont.frames[ImageSimulator],
+                          self.cont.frames[PlottingTool]]:
+
+                frame.reconfigureNonstaticWidgets()
+                frame.setDefaultValues()
+
+            self.varMessageLabel.set('Sensor information added for {}.'.format(C.CNAME[idx]))
+            self.labelMessage.configure(foreground='navy')
+            try:
+                self.topCamInfo.destroy()
+            except:
+                pass
+            self.topResults.destroy()
+
+        # Create the window asking for required camera information
+        if self.cont.isDSLR and not con_iso:
+
+            self.topCamInfo = tk.Toplevel(background=C.DEFAULT_BG)
+            self.topCamInfo.title('Save sensor data')
+            self.cont.addIcon(self.topCamInfo)
+            apc.setupWindow(self.topCamInfo, 300, 140)
+            self.topCamInfo.focus_force()
+
+            ttk.Label(self.topCamInfo, text='Input the ISO used for the images:')\
+                     .pack(side='top', pady=(15*C.scsy, 5*C.scsy), expand=True)
+
+            ttk.Entry(self.topCamInfo, textvariable=varISO, font=self.cont.small_font,
+                      background=C.DEFAULT_BG, width=8).pack(side='top', pady=(7*C.scsy, 7*C.scsy),
+                                                           expand=True)
+
+            ttk.Button(self.topCamInfo, text='OK',
+                       command=executeSensorResultSave).pack(side='top',
+                                                                     pady=(0, 6*C.scsy), expand=True)
+            ttk.Label(self.topCamInfo, textvariable=varMessageLabel, font=self.cont.small_font,
+                          background=C.DEFAULT_BG).pack(side='top', pady=(0, 10*C.scsy), expand=True)
+
+        else:
+
+            executeSensorResultSave()
+
+    def createSelectionBoxEvent(self, event):
+
+        '''Create rectangle in canvas when left-clicked.'''
+
+        if self.menuActive: return None
+
+        # Delete existing selection box
+        event.widget.delete(self.selectionBox)
+        event.widget.delete(self.measureLine)
+
+        # Define list to store selection box corner coordinates
+        self.selectionArea = [int(event.widget.canvasx(event.x)),
+                              int(event.widget.canvasy(event.y)), 0, 0]
+
+        # Create new selection box at clicked location
+        self.selectionBox = event.widget.create_rectangle(self.selectionArea[0],
+                                                          self.selectionArea[1],
+                                                          self.selectionArea[0]+1,
+                                                          self.selectionArea[1]+1,
+                                                          outline='red')
+
+    def drawSelectionBoxEvent(self, event):
+
+        '''Redraw selection box to follow mouse movement when held down.'''
+
+        if self.menuActive: return None
+
+        x = event.widget.canvasx(event.x)
+        y = event.widget.canvasy(event.y)
+
+        event.widget.coords(self.selectionBox, self.selectionArea[0], self.selectionArea[1], x, y)
 
-            # Loop through all labels
-            for label in self.labelList:
+        self.setFOV(self.selectionArea[0], x, self.selectionArea[1], y, True)
+        self.showSelectionStatistics(self.selectionArea[0], x, self.selectionArea[1], y)
 
-                if label.rightselected:
+    def evaluateSelectionBoxEvent(self, event):
 
-                    # Remove info for labels that have been right-clicked
+        '''Modify selection box when mouse is released.'''
 
-                    if label is self.labelBias1 or label is self.labelBias2:
+        if self.menuActive:
+            self.menuActive = False
+            return None
 
-                        if self.displayed_bias == 1:
+        # Coordinates where mouse was released
+        corner2_x = int(event.widget.canvasx(event.x))
+        corner2_y = int(event.widget.canvasy(event.y))
 
-                            self.forgetAttributes(self.labelBias1)
-                            os.remove('aplab_temp' + os.sep + self.labelNames[self.labelBias1] + '.npy')
-                            os.remove('aplab_temp' + os.sep + self.labelNames[self.labelBias1] + '.png')
+        # Exchange index of coordinates to keep smallest values in the beginning of the list
+        if self.selectionArea[0] > corner2_x:
+            temp = corner2_x
+            corner2_x = self.selectionArea[0]
+            self.selectionArea[0] = temp
 
-                            self.labelBias1.pack_forget()
-                            self.varBias1Label.set('')
-                            self.frameBias.pack_forget()
-                            self.labelBiasH.pack_forget()
+        if self.selectionArea[1] > corner2_y:
+            temp = corner2_y
+            corner2_y = self.selectionArea[1]
+            self.selectionArea[1] = temp
 
-                            self.displayed_bias = 0
+        self.selectionArea[2] = corner2_x
+        self.selectionArea[3] = corner2_y
 
-                        elif self.displayed_bias == 2:
+        # Change out of bounds coordinates
+        if self.selectionArea[0] < 0: self.selectionArea[0] = 0
+        if self.selectionArea[1] < 0: self.selectionArea[1] = 0
+        if self.selectionArea[2] > self.imageSize[0]: self.selectionArea[2] = self.imageSize[0]
+        if self.selectionArea[3] > self.imageSize[1]: self.selectionArea[3] = self.imageSize[1]
 
-                            # Shift info from label 2 to label 1 if label 2 is removed
+        # Redraw selection bow with new coordinates
+        event.widget.coords(self.selectionBox, self.selectionArea[0], self.selectionArea[1],
+                            self.selectionArea[2], self.selectionArea[3])
 
-                            if label is self.labelBias1:
-                                self.labelBias1.stretched_img[:, :] = self.labelBias2.stretched_img
-                                self.labelBias2.stretched_img = None
-                                self.labelBias1.exposure = self.labelBias2.exposure
-                                self.labelBias1.iso = self.labelBias2.iso
-                                self.varBias1Label.set(self.varBias2Label.get())
-                                os.remove('aplab_temp' + os.sep + self.labelNames[self.labelBias1] + '.npy')
-                                os.rename('aplab_temp' + os.sep + self.labelNames[self.labelBias2] + '.npy',
-                                          'aplab_temp' + os.sep + self.labelNames[self.labelBias1] + '.npy')
+        # Remove selection box if the selected area is too small
+        if self.selectionArea[2] - self.selectionArea[0] <= 1 \
+           or self.selectionArea[3] - self.selectionArea[1] <= 1:
+            event.widget.delete(self.selectionBox)
+            self.localSelection = False
+            self.setFOV(0, self.imageSize[0], 0, self.imageSize[1], False)
+            self.varMessageLabel.set('')
+        else:
+            self.localSelection = True
+            self.setFOV(self.selectionArea[0], self.selectionArea[2],
+                        self.selectionArea[1], self.selectionArea[3], True)
+            self.showSelectionStatistics(self.selectionArea[0], self.selectionArea[2],
+                                         self.selectionArea[1], self.selectionArea[3])
 
-                                os.remove('aplab_temp' + os.sep + self.labelNames[self.labelBias1] + '.png')
-                                os.rename('aplab_temp' + os.sep + self.labelNames[self.labelBias2] + '.png',
-                                          self.labelNames[self.labelBias1] + '.png')
-                                if self.labelBias2.leftselected:
-                                    self.showImage(self.labelBias1)
+    def showSelectionStatistics(self, x1, x2, y1, y2):
 
-                            self.forgetAttributes(self.labelBias2)
+        '''Show the statistics of the selection box in the message label.'''
 
-                            self.labelBias2.pack_forget()
-                            self.varBias2Label.set('')
-                            self.varBiasHLabel.set('Bias frame')
+        stats = self.getSelectedLabel().regionStats.getStatistics(x1, x2, y1, y2)
 
-                            self.displayed_bias = 1
+        if stats is None:
+            self.varMessageLabel.set('')
+            return None
 
-                    elif label is self.labelDark1 or label is self.labelDark2:
+        sample_val, mean_val, std_val, min_val, max_val = stats
 
-                        if self.displayed_dark == 1:
+        self.varMessageLabel.set('Selection: {:d} pixels, mean: {:.1f} ADU, standard deviation: {:.2f} ADU, '\
+                                 .format(sample_val, mean_val, std_val) \
+                                 + 'min: {:g} ADU, max: {:g} ADU'.format(min_val, max_val))
+        self.labelMessage.configure(foreground='navy')
 
-                            self.forgetAttributes(self.labelDark1)
-                            os.remove('aplab_temp' + os.sep + self.labelNames[self.labelDark1] + '.npy')
-                            os.remove('aplab_temp' + os.sep + self.labelNames[self.labelDark1] + '.png')
+    def setFOV(self, x1, x2, y1, y2, isSelection):
 
-                            self.labelDark1.pack_forget()
-                            self.varDark1Label.set('')
-                            self.frameDark.pack_forget()
-                            self.labelDarkH.pack_forget()
+        '''Calculate the field of view of the image or selection box.'''
 
-                            self.displayed_dark = 0
+        # Display nothing if the frame is not a light frame
+        if self.getSelectedLabel() is not self.labelLight:
+            self.varFOV.set('')
+            return None
 
-                        elif self.displayed_dark == 2:
+        dx = self.cont.ISVal*np.abs(x1 - x2)
+        dy = self.cont.ISVal*np.abs(y1 - y2)
 
-                            if label is self.labelDark1:
-                                self.labelDark1.stretched_img[:, :] = self.labelDark2.stretched_img
-                                self.labelDark2.stretched_img = None
-                                self.labelDark1.exposure = self.labelDark2.exposure
-                                self.labelDark1.iso = self.labelDark2.iso
-                                self.varDark1Label.set(self.varDark2Label.get())
-                                os.remove('aplab_temp' + os.sep + self.labelNames[self.labelDark1] + '.npy')
-                                os.rename('aplab_temp' + os.sep + self.labelNames[self.labelDark2] + '.npy',
-                                          'aplab_temp' + os.sep + self.labelNames[self.labelDark1] + '.npy')
+        deg_x = dx/3600.0
+        deg_y = dy/3600.0
 
-                                os.remove('aplab_temp' + os.sep + self.labelNames[self.labelDark1] + '.png')
-                                os.rename('aplab_temp' + os.sep + self.labelNames[self.labelDark2] + '.png',
-                                          'aplab_temp' + os.sep + self.labelNames[self.labelDark1] + '.png')
-                                if self.labelDark2.leftselected:
-                                    self.showImage(self.labelDark1)
+        type = ('Selection' if isSelection else 'Image')
 
-                            self.forgetAttributes(self.labelDark2)
+        # Set the FOV in the active angle unit
+        if self.cont.dmsAngleUnit.get():
 
-                            self.labelDark2.pack_forget()
-                            self.varDark2Label.set('')
-                            self.varDarkHLabel.set('Dark frame')
+            deg_xi = int(deg_x)
+            deg_yi = int(deg_y)
 
-                            self.displayed_dark = 1
+            min_x = (deg_x - deg_xi)*60
+            min_y = (deg_y - deg_yi)*60
+            min_xi = int(min_x)
+            min_yi = int(min_y)
 
-                    elif label is self.labelFlat1 or label is self.labelFlat2:
+            sec_x = (min_x - min_xi)*60
+            sec_y = (min_y - min_yi)*60
 
-                        if self.displayed_flat == 1:
+            self.varFOV.set(u'{} FOV: {:d}\u00B0 {:d}\' {:.1f}\'\' x {:d}\u00B0 {:d}\' {:.1f}\'\'' \
+                            .format(type, deg_xi, min_xi, sec_x, deg_yi, min_yi, sec_y))
 
-                            self.forgetAttributes(self.labelFlat1)
-                            os.remove('aplab_temp' + os.sep + self.labelNames[self.labelFlat1] + '.npy')
-                            os.remove('aplab_temp' + os.sep + self.labelNames[self.labelFlat1] + '.png')
+        else:
 
-                            self.labelFlat1.pack_forget()
-                            self.varFlat1Label.set('')
-                            self.frameFlat.pack_forget()
-                            self.labelFlatH.pack_forget()
+            self.varFOV.set(u'{} FOV: {:.3g}\u00B0 x {:.3g}\u00B0'.format(type, deg_x, deg_y))
 
-                            self.displayed_flat = 0
+    def setAngle(self, x1, x2, y1, y2):
 
-                        elif self.displayed_flat == 2:
+        '''Calculate the angle of the measuring line.'''
 
-                            if label is self.labelFlat1:
-                                self.labelFlat1.stretched_img[:, :] = self.labelFlat2.stretched_img
-                                self.labelFlat2.stretched_img = None
-                                self.labelFlat1.exposure = self.labelFlat2.exposure
-                                self.labelFlat1.iso = self.labelFlat2.iso
-                                self.varFlat1Label.set(self.varFlat2Label.get())
-                                os.remove('aplab_temp' + os.sep + self.labelNames[self.labelFlat1] + '.npy')
-                                os.rename('aplab_temp' + os.sep + self.labelNames[self.labelFlat2] + '.npy',
-                                          'aplab_temp' + os.sep + self.labelNames[self.labelFlat1] + '.npy')
+        # Display nothing if the frame is not a light frame
+        if self.getSelectedLabel() is not self.labelLight:
+            self.varFOV.set('')
+            return None
 
-                                os.remove('aplab_temp' + os.sep + self.labelNames[self.labelFlat1] + '.png')
-                                os.rename('aplab_temp' + os.sep + self.labelNames[self.labelFlat2] + '.png',
-                                          'aplab_temp' + os.sep + self.labelNames[self.labelFlat1] + '.png')
-                                if self.labelFlat2.leftselected:
-                                    self.showImage(self.labelFlat1)
+        dx = self.cont.ISVal*np.abs(x1 - x2)
+        dy = self.cont.ISVal*np.abs(y1 - y2)
 
-                            self.forgetAttributes(self.labelFlat2)
+        # Compensate for any resizing
+        dx /= self.zoom
+        dy /= self.zoom
 
-                            self.labelFlat2.pack_forget()
-                            self.varFlat2Label.set('')
-                            self.varFlatHLabel.set('Flat frame')
+        deg_r = np.sqrt(dx**2 + dy**2)/3600.0
 
-                            self.displayed_flat = 1
+        # Set the angle in the active angle unit
+        if self.cont.dmsAngleUnit.get():
 
-                    elif label is self.labelLight:
+            deg_ri = int(deg_r)
 
-                        self.forgetAttributes(self.labelLight)
-                        os.remove('aplab_temp' + os.sep + self.labelNames[self.labelLight] + '.npy')
-                        os.remove('aplab_temp' + os.sep + self.labelNames[self.labelLight] + '.png')
+            min_r = (deg_r - deg_ri)*60
+            min_ri = int(min_r)
 
-                        self.labelLight.pack_forget()
-                        self.varLightLabel.set('')
-                        self.labelLightH.pack_forget()
-                        self.displayed_light = 0
-                        self.varFOV.set('')
+            sec_r = (min_r - min_ri)*60
 
-                    elif label is self.labelSaturated:
+            self.varFOV.set(u'Angle: {:d}\u00B0 {:d}\' {:.1f}\'\''.format(deg_ri, min_ri, sec_r))
 
-                        self.forgetAttributes(self.labelSaturated)
-                        os.remove('aplab_temp' + os.sep + self.labelNames[self.labelSaturated] + '.npy')
-                        os.remove('aplab_temp' + os.sep + self.labelNames[self.labelSaturated] + '.png')
+        else:
 
-                        self.labelSaturated.pack_forget()
-                        self.varSaturatedLabel.set('')
-                        self.labelSaturatedH.pack_forget()
-                        self.displayed_saturated = 0
+            self.varFOV.set(u'Angle: {:.3g}\u00B0'.format(deg_r))
 
-                    label.configure(style='file.TLabel')
-                    label.rightselected = False
+    def showRCMenuEvent(self, event):
 
-                    # Store left-clicked label if it exists
-                    if label.leftselected:
-                        activateNew = True
-                        activelabel = label
+        '''Show menu at pointer location when canvas is right-clicked.'''
 
-                    count += 1
+        if C.is_win:
+            self.menuRC.post(event.x_root, event.y_root)
+        else:
+            self.menuRC.tk_popup(event.x_root, event.y_root)
 
-            # Move selection if the left-clicked label was removed
-            if activateNew:
+        self.menuActive = True
 
-                if self.displayed_dark == 1 and (activelabel is self.labelDark1 \
-                                                 or activelabel is self.labelDark2):
-                    self.showImage(self.labelDark1)
-                elif self.displayed_flat == 1 and (activelabel is self.labelFlat1 \
-                                                   or activelabel is self.labelFlat2):
-                    self.showImage(self.labelFlat1)
-                elif self.displayed_bias >= 1:
-                    self.showImage(self.labelBias1)
-                elif self.displayed_dark >= 1:
-                    self.showImage(self.labelDark1)
-                elif self.displayed_flat >= 1:
-                    self.showImage(self.labelFlat1)
-                elif self.displayed_light == 1:
-                    self.showImage(self.labelLight)
-                elif self.displayed_saturated == 0:
-                    self.clearFiles()
-            else:
-                self.getSelectedLabel().configure(style='leftselectedfile.TLabel')
+    def getPixelMask(self, img):
 
-            self.varMessageLabel.set('Frame removed.' if count == 1 else 'Frames removed.')
-            self.labelMessage.configure(foreground='navy')
+        '''
+        Return the mask of hot and warm pixels to leave out of statistics of the given frame,
+        or None if pixel maps are not in use or were made for frames of another size.
+        '''
 
-        # Change label background to red if it isn't already right-clicked
-        else:
-            if event.widget.leftselected:
-                event.widget.configure(style='leftrightselectedfile.TLabel')
-            else:
-                event.widget.configure(style='rightselectedfile.TLabel')
-            event.widget.rightselected = True
+        if self.pixelMaps is None or not self.varExcludeBad.get():
+            return None
 
-    def computeSensorData(self):
+        mask = self.pixelMaps.mask()
 
-        '''Calculate sensor parameters from added files.'''
+        return mask if mask.shape == img.shape else None
 
-        # If not all required files have been added
-        if not (self.displayed_bias == 2 and \
-                self.displayed_flat == 2 and \
-                self.displayed_saturated == 1):
+    def getChannelStatistics(self, img, region=None, combineGreen=False, mask=None, includeAll=False,
+                             clip=False, hasCFA=None, cancel=None):
 
-            # Ask user to use light frame instead of saturated frame if added
-            if self.displayed_bias == 2 and \
-               self.displayed_flat == 2 and \
-               self.displayed_light == 1:
+        '''
+        Return the number of pixels, mean, median, standard deviation, minimum and maximum of
+        each colour channel in the given region (x1, x2, y1, y2) of the image, in a dictionary
+        with the channel names as keys. Frames without a known CFA pattern give the statistics
+        of all pixels under the key "All". The two green channels can be combined into "G", and
+        the statistics of all pixels can be included under "All" for every frame. Pixels where
+        the given mask (with the same shape as the image) is true are left out. With clipping, the
+        number of pixels, mean and standard deviation are those of the pixels that are left after
+        iterative sigma clipping, so that stars, hot pixels and cosmic rays do not inflate the noise.
+        Whether the frame has a CFA is decided from the camera type unless given, which lets the
+        statistics be computed outside the main thread. There, the computation can be stopped by
+        setting the given cancel event, which raises CancelledError between blocks of pixels (or
+        between channels for frames that are not 8- or 16-bit).
+        '''
 
-                text='A frame containing saturated pixels is required\nto compute sensor data. ' \
-                      + 'Does the added\nlight frame contain saturated pixels?'
+        if region is not None:
+            # Start the region at a CFA block so that the pattern is unchanged
+            x1, x2, y1, y2 = region
+            img = img[(y1 - y1 % 2):y2, (x1 - x1 % 2):x2]
 
-                if not self.showWarning('Note', text, 'Yes', 'No', lambda: None):
-                    self.varMessageLabel.set('Cancelled. Please add a saturated ' \
-                                             + 'frame to compute sensor data.')
-                    self.labelMessage.configure(foreground='crimson')
-                    self.menuActive = False
-                    return False
+            if mask is not None:
+                mask = mask[(y1 - y1 % 2):y2, (x1 - x1 % 2):x2]
 
-                # Use light frame as saturated frame
-                saturated = np.load('aplab_temp' + os.sep + self.labelNames[self.labelLight] + '.npy')
-                useLight = True
+        if hasCFA is None:
+            hasCFA = self.CFAPattern is not None and (self.cont.isDSLR or self.varCCDType.get() == 'colour')
 
-            # Show message if required files haven't been added
-            else:
-                self.varMessageLabel.set('Two bias frames, two flat frames and ' \
-                             + 'one saturated (or light) frame is required to compute sensor data.')
-                self.labelMessage.configure(foreground='crimson')
-                return None
-        else:
+        hasCFA = hasCFA and img.shape[0] > 1 and img.shape[1] > 1
 
-            saturated = np.load('aplab_temp' + os.sep + self.labelNames[self.labelSaturated] + '.npy')
-            useLight = False
+        channels = apfr.cfaChannels(self.CFAPattern) if hasCFA else ['All']
 
-        # Get raw image data
-        bias1 = np.load('aplab_temp' + os.sep + self.labelNames[self.labelBias1] + '.npy')
-        bias2 = np.load('aplab_temp' + os.sep + self.labelNames[self.labelBias2] + '.npy')
-        flat1 = np.load('aplab_temp' + os.sep + self.labelNames[self.labelFlat1] + '.npy')
-        flat2 = np.load('aplab_temp' + os.sep + self.labelNames[self.labelFlat2] + '.npy')
+        stats = {}
 
-        # Define central crop area for flat frames
-        h, w = flat1.shape
-        a = int(0.25*h)
-        b = int(0.75*h)
-        c = int(0.25*w)
-        d = int(0.75*w)
+        if aphs.hasHistogram(img):
 
-        # Define central crop area for bias frames
-        h2, w2 = bias1.shape
-        a2 = int(0.25*h2)
-        b2 = int(0.75*h2)
-        c2 = int(0.25*w2)
-        d2 = int(0.75*w2)
+            # Count the pixels of all four CFA positions in one pass
+            hists, offset = aphs.mosaicHistograms(img, exclude=mask, cancel=cancel)
 
-        # Crop flat frames
-        flat1_crop = flat1[a:b, c:d]
-        flat2_crop = flat2[a:b, c:d]
+            if hasCFA:
+                groups = {ch: hists[i] for i, ch in enumerate(channels)}
+            else:
+                groups = {}
 
-        # Crop bias frames
-        bias1_crop = bias1[a2:b2, c2:d2]
-        bias2_crop = bias2[a2:b2, c2:d2]
+            if not hasCFA or includeAll:
+                groups['All'] = hists.sum(axis=0)
 
-        self.white_level = np.max(saturated)
+            if hasCFA and combineGreen:
+                groups['G'] = groups.pop('G1') + groups.pop('G2')
 
-        self.black_level = 0.5*(np.median(bias1_crop) + np.median(bias2_crop))
-        flat_level_ADU = 0.5*(np.median(flat1_crop) + np.median(flat2_crop))
+            for ch in ['R', 'G', 'G1', 'G2', 'B', 'All']:
+                if ch in groups:
+                    n, mean, std, minimum, maximum = aphs.histogramMoments(groups[ch], offset)
+                    if clip: n, mean, std = aprs.histogramSigmaClip(groups[ch], offset)
+                    stats[ch] = (n, mean, aphs.histogramMedian(groups[ch], offset), std, minimum, maximum)
 
-        delta_bias = bias1_crop + 30000 - bias2_crop
-        delta_flat = flat1_crop + 30000 - flat2_crop
+        else:
 
-        read_noise_ADU = np.std(delta_bias)/np.sqrt(2)
+            groups = apfr.cfaPlanes(img, self.CFAPattern) if hasCFA else {}
 
-        flat_noise_ADU = np.std(delta_flat)/np.sqrt(2)
+            if not hasCFA or includeAll:
+                groups['All'] = img
 
-        photon_noise_ADU_squared = flat_noise_ADU**2 - read_noise_ADU**2
-        photon_level_ADU = flat_level_ADU - self.black_level
+            # Keep only the pixels outside the mask
+            if mask is not None:
+                masks = apfr.cfaPlanes(mask, self.CFAPattern) if hasCFA else {}
+                masks['All'] = mask
+                groups = {ch: groups[ch][~masks[ch]] for ch in groups}
 
-        self.gain = photon_level_ADU/photon_noise_ADU_squared
+            if hasCFA and combineGreen:
+                groups['G'] = np.concatenate([groups.pop('G1').ravel(), groups.pop('G2').ravel()])
 
-        self.rn = self.gain*read_noise_ADU
+            for ch in ['R', 'G', 'G1', 'G2', 'B', 'All']:
+                if cancel is not None and cancel.is_set():
+                    raise concurrent.futures.CancelledError()
+                if ch in groups:
+                    plane = groups[ch]
+                    n, mean, std = aprs.sigmaClip(plane) if clip else (plane.size, np.mean(plane), np.std(plane))
+                    stats[ch] = (n, mean, np.median(plane), std, np.min(plane), np.max(plane))
 
-        self.sat_cap = self.gain*self.white_level
+        return stats
 
-        self.varMessageLabel.set('Sensor data computed.')
-        self.labelMessage.configure(foreground='navy')
+    def getSampledStatistics(self, img, region, mask=None, clip=False, hasCFA=False):
 
-        isovals = []
+        '''
+        Return approximate statistics of each colour channel and of all pixels in the given region
+        of the image, from a stratified random sample of its pixels, in the same way as
+        "getChannelStatistics". Each channel has the number of sampled pixels and the mean,
+        median and standard deviation with the half-width of their 95 % confidence intervals.
+        '''
 
-        for label in [self.labelBias1, self.labelBias2, self.labelFlat1, self.labelFlat2,
-                      self.labelLight if useLight else self.labelSaturated]:
+        x1, x2, y1, y2 = region
 
-            if label.iso is not None:
-                isovals.append(label.iso)
+        # Start the region at a CFA block so that the pattern is unchanged
+        x1 -= x1 % 2
+        y1 -= y1 % 2
 
-        if len(isovals) > 0 and isovals[1:] == isovals[:-1]:
-            con_iso = isovals[0]
-        else:
-            con_iso = False
+        ys, xs = aps.samplePositions((y2 - y1, x2 - x1))
+        values = img[y1:y2, x1:x2][ys, xs]
 
-        self.disableWidgets()
-        self.busy = True
+        # Leave out hot and warm pixels
+        if mask is not None:
+            kept = ~mask[y1:y2, x1:x2][ys, xs]
+            ys, xs, values = ys[kept], xs[kept], values[kept]
 
-        # Setup window displaying calculated values, with option to save data
-        self.topResults = tk.Toplevel(background=C.DEFAULT_BG)
-        self.topResults.title('Computed sensor data')
-        self.cont.addIcon(self.topResults)
-        apc.setupWindow(self.topResults, 300, 220)
-        self.topResults.focus_force()
+        stats = {}
 
-        ttk.Label(self.topResults, text='Computed sensor data', font=self.cont.smallbold_font,
-                  anchor='center').pack(side='top', pady=(15*C.scsy, 5*C.scsy), expand=True)
+        if hasCFA and y2 - y1 > 1 and x2 - x1 > 1:
 
-        frameResults = ttk.Frame(self.topResults)
-        frameResults.pack(side='top', expand=True)
+            positions = 2*(ys % 2) + xs % 2
 
-        ttk.Label(frameResults, text='Gain: ').grid(row=0, column=0, sticky='W')
-        ttk.Label(frameResults, text=('{:.3g}'.format(self.gain)), width=7,
-                  anchor='center').grid(row=0, column=1)
-        ttk.Label(frameResults, text=' e-/ADU').grid(row=0, column=2, sticky='W')
+            for i, ch in enumerate(apfr.cfaChannels(self.CFAPattern)):
+                stats[ch] = aps.approximateStatistics(values[positions == i], clip=clip)
 
-        ttk.Label(frameResults, text='Read noise: ').grid(row=1, column=0, sticky='W')
-        ttk.Label(frameResults, text=('{:.3g}'.format(self.rn)), width=7,
-                  anchor='center').grid(row=1, column=1)
-        ttk.Label(frameResults, text=' e-').grid(row=1, column=2, sticky='W')
+        stats['All'] = aps.approximateStatistics(values, clip=clip)
 
-        ttk.Label(frameResults, text='Black level: ').grid(row=2, column=0, sticky='W')
-        ttk.Label(frameResults, text=('{:d}'.format(int(round(self.black_level)))), width=7,
-                  anchor='center').grid(row=2, column=1)
-        ttk.Label(frameResults, text=' ADU').grid(row=2, column=2, sticky='W')
+        return stats
 
-        ttk.Label(frameResults, text='White level: ').grid(row=3, column=0, sticky='W')
-        ttk.Label(frameResults, text=('{:d}'.format(int(round(self.white_level)))), width=7,
-                  anchor='center').grid(row=3, column=1)
-        ttk.Label(frameResults, text=' ADU').grid(row=3, column=2, sticky='W')
+    def getStatistics(self):
 
-        ttk.Label(frameResults, text='Saturation capacity: ').grid(row=4, column=0, sticky='W')
-        ttk.Label(frameResults, text=('{:d}'.format(int(round(self.sat_cap)))), width=7,
-                  anchor='center').grid(row=4, column=1)
-        ttk.Label(frameResults, text=' e-').grid(row=4, column=2, sticky='W')
+        '''Show topwindow with statistics of selected area or entire image.'''
 
-        ttk.Button(self.topResults, text='Save sensor data',
-                   command=lambda: self.saveSensorResults(con_iso))\
-                  .pack(side='top', pady=((5*C.scsy, 20*C.scsy)), expand=True)
+        label = self.getSelectedLabel()
 
-        self.wait_window(self.topResults)
+        # Get raw image data
+        img = self.frameStore.get(self.labelNames[label])
 
-        # Close overlying windows if a lower window is exited
-        try:
-            self.topCamInfo.destroy()
-        except:
-            pass
+        # Crop image if a selection box has been drawn
+        if self.localSelection:
+            region = self.selectionArea[0], self.selectionArea[2], \
+                     self.selectionArea[1], self.selectionArea[3]
+        else:
+            region = 0, img.shape[1], 0, img.shape[0]
 
-        self.busy = False
-        self.enableWidgets()
+        mask = self.getPixelMask(img)
+        clip = self.varSigmaClip.get()
 
-    def updateFrameButtonText(self, type):
+        hasCFA = self.CFAPattern is not None and (self.cont.isDSLR or self.varCCDType.get() == 'colour')
 
-        '''Change text of "add frames" button when optionmenu selection changes.'''
+        # Sample large regions when approximate statistics are requested
+        approximate = self.varApproxStats.get() \
+                      and (region[1] - region[0])*(region[3] - region[2]) > 4*aps.SAMPLE_SIZE
 
-        if type == 'Bias':
-            self.varAddButtonLabel.set('Add bias frames')
-        elif type == 'Dark':
-            self.varAddButtonLabel.set('Add dark frames')
-        elif type == 'Flat':
-            self.varAddButtonLabel.set('Add flat frames')
-        elif type == 'Light':
-            self.varAddButtonLabel.set('Add light frame')
-        elif type == 'Saturated':
-            self.varAddButtonLabel.set('Add saturated frame')
+        def formatExact(stats):
 
-    def saveSensorResults(self, con_iso):
+            '''Return the displayed values of the number, mean, median, standard deviation, maximum and minimum.'''
 
-        '''Get required camera info from user before saving calculated sensor values.'''
+            n, mean, median, std, minimum, maximum = stats
 
-        varISO = tk.IntVar()
-        varMessageLabel = tk.StringVar()
+            return ['{:d}'.format(n), '{:.1f}'.format(mean), '{:g}'.format(median),
+                    '{:.2f}'.format(std), '{:d}'.format(int(maximum)), '{:d}'.format(int(minimum))]
 
-        varISO.set('')
+        if approximate:
 
-        def executeSensorResultSave():
+            # Values with their 95 % confidence intervals, while the exact values are computed
+            channel_values = {ch: ['{:d}'.format(n), '{:.1f}±{:.1f}'.format(*mean), '{:g}±{:.2g}'.format(*median),
+                                   '{:.2f}±{:.2f}'.format(*std), '..', '..']
+                              for ch, (n, mean, median, std) \
+                              in self.getSampledStatistics(img, region, mask=mask, clip=clip, hasCFA=hasCFA).items()}
 
-            '''Save calculated sensor values to "cameradata.txt".'''
+            # Stopped when the window is closed, so that it does not go on for a result nobody sees
+            cancel = threading.Event()
 
-            if self.cont.isDSLR:
+            executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+            future = executor.submit(self.getChannelStatistics, img, region, mask=mask, includeAll=True,
+                                     clip=clip, hasCFA=hasCFA, cancel=cancel)
 
-                if con_iso:
-                    iso = str(con_iso)
-                else:
-                    # Get inputted ISO value for DSLR
-                    try:
-                        iso = str(int(varISO.get()))
-                    except ValueError:
-                        varMessageLabel.set('Invalid ISO input. Must be an integer.')
-                        return None
+        else:
 
-            # Read camera data file
-            file = open('aplab_data{}cameradata.txt'.format(os.sep), 'r')
-            old_text = file.read()
-            lines = old_text.split('\n')
-            file.close()
+            # Calculate values for each colour channel, leaving out hot and warm pixels if requested
+            channel_values = {ch: formatExact(stats) for ch, stats \
+                              in self.getChannelStatistics(img, region, mask=mask,
+                                                           includeAll=(mask is not None or clip),
+                                                           clip=clip, hasCFA=hasCFA).items()}
 
-            file = open('aplab_data{}cameradata_user_backup.txt'.format(os.sep), 'w')
-            file.write(old_text)
-            file.close()
+            # Use the cached statistics of all pixels when possible
+            if mask is None and not clip:
+                sample_val, mean_val, std_val, min_val, max_val = label.regionStats.getStatistics(*region)
+                median_val = self.histStats.median(self.labelNames[label], img,
+                                                   region if self.localSelection else None)
+                channel_values['All'] = formatExact((sample_val, mean_val, median_val, std_val, min_val, max_val))
 
-            file = open('aplab_data{}cameradata.txt'.format(os.sep), 'w')
+        channels = [ch for ch in channel_values if ch != 'All']
+        width = 14 if approximate else 7
 
-            file.write(lines[0])
+        self.disableWidgets()
+        self.busy = True
 
-            for line in lines[1:-1]:
+        # Setup window displaying the calculated information
+        topStatistics = tk.Toplevel(background=C.DEFAULT_BG)
+        topStatistics.title('Statistics')
+        self.cont.addIcon(topStatistics)
+        if approximate:
+            apc.setupWindow(topStatistics, *((360, 250) if len(channels) == 0 else (900, 270)))
+        else:
+            apc.setupWindow(topStatistics, *((300, 230) if len(channels) == 0 else (560, 250)))
+        topStatistics.focus_force()
 
-                line = line.split(',')
+        self.menuRC.entryconfigure(10, state='disabled')
 
-                # Find relevant line in the camera data file
-                if line[0] == C.CNAME[self.cont.cnum]:
+        varTitle = tk.StringVar()
+        title = ('Statistics of selected image region' if self.localSelection else 'Statistics of the entire image') \
+                + (' (sigma-clipped)' if clip else '')
+        varTitle.set(title + (' (approximate)' if approximate else ''))
 
-                    # If no data exists for the camera
-                    if self.cont.noData:
+        ttk.Label(topStatistics, textvariable=varTitle, font=self.cont.smallbold_font,
+                  anchor='center').pack(side='top', pady=(20*C.scsy, 10*C.scsy), expand=True)
 
-                        g_idx1 = rn_idx1 = 0
-                        g_idx2 = rn_idx2 = 1
+        frameStatistics = ttk.Frame(topStatistics)
+        frameStatistics.pack(side='top', pady=(0, 6*C.scsy), expand=True)
 
-                        # Add the data
-                        file.write('\n{},{},{:.3g}*,{:.3g}*,{:d}*,{:d}*,{:d}*,{},{},{},{}' \
-                                    .format(line[0], line[1], self.gain, self.rn, int(round(self.sat_cap)),
-                                       int(round(self.black_level)), int(round(self.white_level)), 'NA',
-                                       line[8], line[9], line[10]))
-                        if self.cont.isDSLR: file.write(',' + iso)
+        rows = [('Sample size: ', ' pixels'), ('Mean value: ', ' ADU'), ('Median value: ', ' ADU'),
+                ('Standard deviation: ', ' ADU'), ('Maximum value: ', ' ADU'), ('Minimum value: ', ' ADU')]
 
-                        self.cont.noData = False
+        # Add a header for the colour channels
+        first = 0
 
-                    # If data already exists
-                    else:
+        if len(channels) > 0:
 
-                        # Read existing values
-                        gainvals = line[2].split('-')
-                        gv_stripped = ['{:.2g}'.format(float(val.split('*')[0])) for val in gainvals]
-                        rnvals = line[3].split('-')
-                        rv_stripped = ['{:.2g}'.format(float(val.split('*')[0])) for val in rnvals]
-                        satcapvals = line[4].split('-')
-                        blvals = line[5].split('-')
-                        wlvals = line[6].split('-')
+            first = 1
 
-                        # Find where to add new values, or which old values to overwrite
+            for i, ch in enumerate(['All'] + channels):
+                ttk.Label(frameStatistics, text=ch, width=width, anchor='center').grid(row=0, column=i+1)
 
-                        if self.cont.isDSLR:
+        # Add a column of values for all pixels and for each colour channel
+        varValues = {}
 
-                            isovals = line[11].split('-')
+        for i, ch in enumerate(['All'] + channels):
 
-                            if iso in isovals:
+            varValues[ch] = [tk.StringVar() for j in range(len(rows))]
 
-                                g_idx1 = rn_idx1 = isovals.index(iso)
-                                g_idx2 = rn_idx2 = g_idx1 + 1
+            for j, value in enumerate(channel_values[ch]):
+                varValues[ch][j].set(value)
+                ttk.Label(frameStatistics, textvariable=varValues[ch][j], width=width,
+                          anchor='center').grid(row=first+j, column=i+1)
 
-                            else:
+        for j, (name, unit) in enumerate(rows):
+            ttk.Label(frameStatistics, text=name).grid(row=first+j, column=0, sticky='W')
+            ttk.Label(frameStatistics, text=unit).grid(row=first+j, column=len(channels)+2, sticky='W')
 
-                                g_idx1 = g_idx2 = rn_idx1 = rn_idx2 = sorted(isovals + [iso],
-                                                                             key=int).index(iso)
+        ttk.Button(topStatistics, text='Close', command=lambda: topStatistics.destroy())\
+                  .pack(side='top', pady=(0, 15*C.scsy), expand=True)
 
-                        else:
+        def updateValues():
 
-                            if ('{:.2g}'.format(self.rn)) in rv_stripped:
+            '''Replace the approximate values with the exact ones when they have been computed.'''
 
-                                rn_idx1 = rv_stripped.index('{:.2g}'.format(self.rn))
-                                rn_idx2 = rn_idx1 + 1
-                            else:
+            if not topStatistics.winfo_exists():
+                return None
 
-                                rn_idx1 = rn_idx2 = sorted(rv_stripped + ['{:.3g}'.format(self.rn)],
-                                                           key=float).index(('{:.3g}'.format(self.rn)))
+            if not future.done():
+                self.after(200, updateValues)
+                return None
 
-                            if ('{:.2g}'.format(self.gain)) in gv_stripped:
+            try:
+                exact = future.result()
+            except MemoryError:
+                varTitle.set(title + ' (approximate, too little memory for exact values)')
+                return None
 
-                                g_idx1 = gv_stripped.index('{:.2g}'.format(self.gain))
-                                g_idx2 = g_idx1 + 1
+            for ch in varValues:
+                for var, value in zip(varValues[ch], formatExact(exact[ch])):
+                    var.set(value)
 
-                            else:
+            varTitle.set(title)
 
-                                g_idx1 = g_idx2 = sorted(gv_stripped + ['{:.3g}'.format(self.gain)],
-                                                         key=float).index(('{:.3g}'.format(self.gain)))
+        if approximate:
+            updateValues()
 
-                        # Add calculated values to camera data file
-                        file.write('\n{},{},{},{},{},{},{},{},{},{},{}' \
-                    .format(line[0], line[1],
-                       '-'.join(gainvals[:g_idx1] + ['{:.3g}*'.format(self.gain)] + gainvals[g_idx2:]),
-                       '-'.join(rnvals[:rn_idx1] + ['{:.3g}*'.format(self.rn)] + rnvals[rn_idx2:]),
-                       '-'.join(satcapvals[:g_idx1] + ['{:d}*'.format(int(round(self.sat_cap)))] + satcapvals[g_idx2:]),
-                       '-'.join(blvals[:g_idx1] + ['{:d}*'.format(int(round(self.black_level)))] + blvals[g_idx2:]),
-                       '-'.join(wlvals[:g_idx1] + ['{:d}*'.format(int(round(self.white_level)))] + wlvals[g_idx2:]),
-                       line[7], line[8], line[9], line[10]))
+        self.wait_window(topStatistics)
 
-                        if self.cont.isDSLR: file.write(',{}'.format('-'.join(isovals[:g_idx1] + [iso] \
-                                                                          + isovals[g_idx2:])))
+        if approximate:
+            cancel.set()
+            executor.shutdown(wait=False)
 
-                # Write the other lines with no changes
-                else:
+        try:
+            self.menuRC.entryconfigure(10, state='normal')
+        except:
+            pass
 
-                    file.write('\n' + ','.join(line))
+        self.enableWidgets()
+        self.busy = False
 
-            file.write('\n' + lines[-1])
-            file.close()
+        self.menuActive = False
 
-            # Insert calculated values to camera info lists
+    def showGridStatistics(self):
 
-            idx = self.cont.cnum
+        '''
+        Divide the selected frame into a grid of blocks, and show a chosen statistic of every
+        block on top of the image. Frames with a CFA use the pixels of the first green channel.
+        '''
 
-            if g_idx2 == g_idx1 + 1:
-                C.GAIN[idx][0][g_idx1] = float('{:.3g}'.format(self.gain))
-                C.GAIN[idx][1][g_idx1] = 1
-                C.SAT_CAP[idx][0][g_idx1] = int(round(self.sat_cap))
-                C.SAT_CAP[idx][1][g_idx1] = 1
-                C.BLACK_LEVEL[idx][0][g_idx1] = int(round(self.black_level))
-                C.BLACK_LEVEL[idx][1][g_idx1] = 1
-                C.WHITE_LEVEL[idx][0][g_idx1] = int(round(self.white_level))
-                C.WHITE_LEVEL[idx][1][g_idx1] = 1
-                if self.cont.isDSLR: C.ISO[idx][g_idx1] = int(iso)
-            else:
-                C.GAIN[idx][0] = np.insert(C.GAIN[idx][0], g_idx1, float('{:.3g}'.format(self.gain)))
-                C.GAIN[idx][1] = np.insert(C.GAIN[idx][1], g_idx1, 1)
-                C.SAT_CAP[idx][0] = np.insert(C.SAT_CAP[idx][0], g_idx1, int(round(self.sat_cap)))
-                C.SAT_CAP[idx][1] = np.insert(C.SAT_CAP[idx][1], g_idx1, 1)
-                C.BLACK_LEVEL[idx][0] = np.insert(C.BLACK_LEVEL[idx][0], g_idx1, int(round(self.black_level)))
-                C.BLACK_LEVEL[idx][1] = np.insert(C.BLACK_LEVEL[idx][1], g_idx1, 1)
-                C.WHITE_LEVEL[idx][0] = np.insert(C.WHITE_LEVEL[idx][0], g_idx1, int(round(self.white_level)))
-                C.WHITE_LEVEL[idx][1] = np.insert(C.WHITE_LEVEL[idx][1], g_idx1, 1)
-                if self.cont.isDSLR: C.ISO[idx] = np.insert(C.ISO[idx], g_idx1, int(iso))
+        label = self.getSelectedLabel()
 
-            if rn_idx2 == rn_idx1 + 1:
-                C.RN[idx][0][rn_idx1] = float('{:.3g}'.format(self.rn))
-                C.RN[idx][1][rn_idx1] = 1
-            else:
-                C.RN[idx][0] = np.insert(C.RN[idx][0], rn_idx1, float('{:.3g}'.format(self.rn)))
-                C.RN[idx][1] = np.insert(C.RN[idx][1], rn_idx1, 1)
+        varNX = tk.StringVar()
+        varNY = tk.StringVar()
+        varQuantity = tk.StringVar()
+        varGridMessage = tk.StringVar()
 
-            for frame in [self.cont.frames[ImageCalculator], self.cont.frames[ImageSimulator],
-                          self.cont.frames[PlottingTool]]:
+        varNX.set('8')
+        varNY.set('6')
+        varQuantity.set('Median')
 
-                frame.reconfigureNonstaticWidgets()
-                frame.setDefaultValues()
+        grid_size = []
+
+        def ok():
+
+            '''Check the number of blocks and close the window.'''
 
-            self.varMessageLabel.set('Sensor information added for {}.'.format(C.CNAME[idx]))
-            self.labelMessage.configure(foreground='navy')
             try:
-                self.topCamInfo.destroy()
-            except:
-                pass
-            self.topResults.destroy()
+                nx = int(varNX.get())
+                ny = int(varNY.get())
+            except ValueError:
+                varGridMessage.set('Invalid number of blocks.')
+                return None
 
-        # Create the window asking for required camera information
-        if self.cont.isDSLR and not con_iso:
+            if nx < 1 or ny < 1:
+                varGridMessage.set('Invalid number of blocks.')
+                return None
 
-            self.topCamInfo = tk.Toplevel(background=C.DEFAULT_BG)
-            self.topCamInfo.title('Save sensor data')
-            self.cont.addIcon(self.topCamInfo)
-            apc.setupWindow(self.topCamInfo, 300, 140)
-            self.topCamInfo.focus_force()
+            grid_size.extend([nx, ny])
+            topGrid.destroy()
 
-            ttk.Label(self.topCamInfo, text='Input the ISO used for the images:')\
-                     .pack(side='top', pady=(15*C.scsy, 5*C.scsy), expand=True)
+        self.disableWidgets()
+        self.busy = True
 
-            ttk.Entry(self.topCamInfo, textvariable=varISO, font=self.cont.small_font,
-                      background=C.DEFAULT_BG, width=8).pack(side='top', pady=(7*C.scsy, 7*C.scsy),
-                                                           expand=True)
+        # Setup window for choosing the grid and the statistic to show
+        topGrid = tk.Toplevel(background=C.DEFAULT_BG)
+        topGrid.title('Grid statistics')
+        self.cont.addIcon(topGrid)
+        apc.setupWindow(topGrid, 280, 190)
+        topGrid.focus_force()
+
+        frameInput = ttk.Frame(topGrid)
+        frameInput.pack(side='top', pady=(15*C.scsy, 5*C.scsy), expand=True)
+
+        ttk.Label(frameInput, text='Blocks horizontally: ').grid(row=0, column=0, sticky='W')
+        ttk.Entry(frameInput, textvariable=varNX, font=self.cont.small_font,
+                  background=C.DEFAULT_BG, width=6).grid(row=0, column=1)
+        ttk.Label(frameInput, text='Blocks vertically: ').grid(row=1, column=0, sticky='W')
+        ttk.Entry(frameInput, textvariable=varNY, font=self.cont.small_font,
+                  background=C.DEFAULT_BG, width=6).grid(row=1, column=1)
+        ttk.Label(frameInput, text='Show: ').grid(row=2, column=0, sticky='W')
+        ttk.OptionMenu(frameInput, varQuantity, None, *apgs.GRID_QUANTITIES).grid(row=2, column=1)
 
-            ttk.Button(self.topCamInfo, text='OK',
-                       command=executeSensorResultSave).pack(side='top',
-                                                                     pady=(0, 6*C.scsy), expand=True)
-            ttk.Label(self.topCamInfo, textvariable=varMessageLabel, font=self.cont.small_font,
-                          background=C.DEFAULT_BG).pack(side='top', pady=(0, 10*C.scsy), expand=True)
+        frameButtons = ttk.Frame(topGrid)
+        frameButtons.pack(side='top', pady=(5*C.scsy, 0), expand=True)
 
-        else:
+        ttk.Button(frameButtons, text='Show', command=ok).grid(row=0, column=0, padx=(0, 5*C.scsx))
+        ttk.Button(frameButtons, text='Cancel', command=lambda: topGrid.destroy()).grid(row=0, column=1)
 
-            executeSensorResultSave()
+        ttk.Label(topGrid, textvariable=varGridMessage, font=self.cont.small_font,
+                  background=C.DEFAULT_BG).pack(side='top', pady=(0, 10*C.scsy), expand=True)
 
-    def createSelectionBoxEvent(self, event):
+        self.wait_window(topGrid)
 
-        '''Create rectangle in canvas when left-clicked.'''
+        self.busy = False
+        self.enableWidgets()
+        self.menuActive = False
 
-        if self.menuActive: return None
+        if len(grid_size) == 0:
+            self.varMessageLabel.set('Cancelled.')
+            self.labelMessage.configure(foreground='crimson')
+            return None
 
-        # Delete existing selection box
-        event.widget.delete(self.selectionBox)
-        event.widget.delete(self.measureLine)
+        nx, ny = grid_size
 
-        # Define list to store selection box corner coordinates
-        self.selectionArea = [int(event.widget.canvasx(event.x)),
-                              int(event.widget.canvasy(event.y)), 0, 0]
+        img = self.frameStore.get(self.labelNames[label])
+        mask = self.getPixelMask(img)
 
-        # Create new selection box at clicked location
-        self.selectionBox = event.widget.create_rectangle(self.selectionArea[0],
-                                                          self.selectionArea[1],
-                                                          self.selectionArea[0]+1,
-                                                          self.selectionArea[1]+1,
-                                                          outline='red')
+        hasCFA = self.CFAPattern is not None and (self.cont.isDSLR or self.varCCDType.get() == 'colour')
 
-    def drawSelectionBoxEvent(self, event):
+        # Use a single colour channel, so that the statistics are not mixed
+        if hasCFA:
+            img = apfr.cfaPlanes(img, self.CFAPattern)['G1']
+            if mask is not None: mask = apfr.cfaPlanes(mask, self.CFAPattern)['G1']
 
-        '''Redraw selection box to follow mouse movement when held down.'''
+        self.varMessageLabel.set('Computing grid statistics..')
+        self.labelMessage.configure(foreground='navy')
+        self.update_idletasks()
 
-        if self.menuActive: return None
+        try:
+            grid = apgs.gridStatistics(img, nx, ny, mask=mask)
+        except ValueError as error:
+            self.varMessageLabel.set(str(error))
+            self.labelMessage.configure(foreground='crimson')
+            return None
 
-        x = event.widget.canvasx(event.x)
-        y = event.widget.canvasy(event.y)
+        # Block size in pixels of the full frame
+        bh, bw = apgs.blockShape(img.shape, nx, ny)
+        scale = 2 if hasCFA else 1
 
-        event.widget.coords(self.selectionBox, self.selectionArea[0], self.selectionArea[1], x, y)
+        label.gridStats = (grid[varQuantity.get()], scale*bh, scale*bw)
 
-        self.setFOV(self.selectionArea[0], x, self.selectionArea[1], y, True)
+        self.drawGridOverlay(label)
 
-    def evaluateSelectionBoxEvent(self, event):
+        medians = grid['Median']
 
-        '''Modify selection box when mouse is released.'''
+        self.varMessageLabel.set('Block medians range from {:.1f} to {:.1f} ADU ({:.1f} % of their mean).' \
+                                 .format(np.min(medians), np.max(medians),
+                                         100*(np.max(medians) - np.min(medians))/np.mean(medians)))
+        self.labelMessage.configure(foreground='navy')
 
-        if self.menuActive:
-            self.menuActive = False
-            return None
+    def hideGridStatistics(self):
 
-        # Coordinates where mouse was released
-        corner2_x = int(event.widget.canvasx(event.x))
-        corner2_y = int(event.widget.canvasy(event.y))
+        '''Remove the grid statistics shown on top of the selected frame.'''
 
-        # Exchange index of coordinates to keep smallest values in the beginning of the list
-        if self.selectionArea[0] > corner2_x:
-            temp = corner2_x
-            corner2_x = self.selectionArea[0]
-            self.selectionArea[0] = temp
+        self.getSelectedLabel().gridStats = None
+        self.canvasDisplay.delete('grid')
 
-        if self.selectionArea[1] > corner2_y:
-            temp = corner2_y
-            corner2_y = self.selectionArea[1]
-            self.selectionArea[1] = temp
+        self.menuActive = False
 
-        self.selectionArea[2] = corner2_x
-        self.selectionArea[3] = corner2_y
+    def drawGridOverlay(self, label):
 
-        # Change out of bounds coordinates
-        if self.selectionArea[0] < 0: self.selectionArea[0] = 0
-        if self.selectionArea[1] < 0: self.selectionArea[1] = 0
-        if self.selectionArea[2] > self.imageSize[0]: self.selectionArea[2] = self.imageSize[0]
-        if self.selectionArea[3] > self.imageSize[1]: self.selectionArea[3] = self.imageSize[1]
+        '''Draw the blocks and values of the grid statistics of the given label, if any, on the canvas.'''
 
-        # Redraw selection bow with new coordinates
-        event.widget.coords(self.selectionBox, self.selectionArea[0], self.selectionArea[1],
-                            self.selectionArea[2], self.selectionArea[3])
+        self.canvasDisplay.delete('grid')
 
-        # Remove selection box if the selected area is too small
-        if self.selectionArea[2] - self.selectionArea[0] <= 1 \
-           or self.selectionArea[3] - self.selectionArea[1] <= 1:
-            event.widget.delete(self.selectionBox)
-            self.localSelection = False
-            self.setFOV(0, self.imageSize[0], 0, self.imageSize[1], False)
-        else:
-            self.localSelection = True
-            self.setFOV(self.selectionArea[0], self.selectionArea[2],
-                        self.selectionArea[1], self.selectionArea[3], True)
+        if label is None or label.gridStats is None: return None
 
-    def setFOV(self, x1, x2, y1, y2, isSelection):
+        values, bh, bw = label.gridStats
 
-        '''Calculate the field of view of the image or selection box.'''
+        # Canvas position of the upper left corner of the image
+        if self.showResized:
+            x0 = 0.5*(self.scrollbarCanvHor.winfo_width() - 17.0 - self.imageSize[0])
+            y0 = 0.5*(self.scrollbarCanvVer.winfo_height() - self.imageSize[1])
+        else:
+            x0 = 0
+            y0 = 0
 
-        # Display nothing if the frame is not a light frame
-        if self.getSelectedLabel() is not self.labelLight:
-            self.varFOV.set('')
-            return None
+        for j in range(values.shape[0]):
+            for i in range(values.shape[1]):
 
-        dx = self.cont.ISVal*np.abs(x1 - x2)
-        dy = self.cont.ISVal*np.abs(y1 - y2)
+                x1 = x0 + i*bw*self.zoom
+                y1 = y0 + j*bh*self.zoom
+                x2 = x1 + bw*self.zoom
+                y2 = y1 + bh*self.zoom
 
-        # Compensate for that every other pixel is removed in a CFA splitted image
-        if self.labelLight.isSplitted:
-            dx *= 2.0
-            dy *= 2.0
+                self.canvasDisplay.create_rectangle(x1, y1, x2, y2, outline='orange', tags='grid')
+                self.canvasDisplay.create_text(0.5*(x1 + x2), 0.5*(y1 + y2), text='{:.4g}'.format(values[j, i]),
+                                               fill='orange', font=self.cont.small_font, tags='grid')
 
-        deg_x = dx/3600.0
-        deg_y = dy/3600.0
+    def fitBackgroundModel(self):
 
-        type = ('Selection' if isSelection else 'Image')
+        '''
+        Fit a smooth surface to the background of the selected light or flat frame, and show the
+        strength and direction of the gradient, and for flat frames the vignetting falloff.
+        '''
 
-        # Set the FOV in the active angle unit
-        if self.cont.dmsAngleUnit.get():
+        label = self.getSelectedLabel()
 
-            deg_xi = int(deg_x)
-            deg_yi = int(deg_y)
+        self.menuActive = False
 
-            min_x = (deg_x - deg_xi)*60
-            min_y = (deg_y - deg_yi)*60
-            min_xi = int(min_x)
-            min_yi = int(min_y)
+        if not label in [self.labelLight, self.labelFlat1, self.labelFlat2]:
+            self.varMessageLabel.set('Only available for light and flat frames.')
+            self.labelMessage.configure(foreground='crimson')
+            return None
 
-            sec_x = (min_x - min_xi)*60
-            sec_y = (min_y - min_yi)*60
+        img = self.frameStore.get(self.labelNames[label])
+        mask = self.getPixelMask(img)
 
-            self.varFOV.set(u'{} FOV: {:d}\u00B0 {:d}\' {:.1f}\'\' x {:d}\u00B0 {:d}\' {:.1f}\'\'' \
-                            .format(type, deg_xi, min_xi, sec_x, deg_yi, min_yi, sec_y))
+        hasCFA = self.CFAPattern is not None and (self.cont.isDSLR or self.varCCDType.get() == 'colour')
 
-        else:
+        # Use a single colour channel, so that the channels are not mixed
+        if hasCFA:
+            img = apfr.cfaPlanes(img, self.CFAPattern)['G1']
+            if mask is not None: mask = apfr.cfaPlanes(mask, self.CFAPattern)['G1']
 
-            self.varFOV.set(u'{} FOV: {:.3g}\u00B0 x {:.3g}\u00B0'.format(type, deg_x, deg_y))
+        # Use the black level of the ISO of the frame, or of the ISO/gain selected in the Image Calculator
+        isovals = list(C.ISO[self.cont.cnum])
+        idx = isovals.index(label.iso) if (self.cont.isDSLR and label.iso in isovals) \
+                                       else self.cont.frames[ImageCalculator].gain_idx
 
-    def setAngle(self, x1, x2, y1, y2):
+        black_level = C.BLACK_LEVEL[self.cont.cnum][0][idx]
 
-        '''Calculate the angle of the measuring line.'''
+        self.varMessageLabel.set('Fitting background model..')
+        self.labelMessage.configure(foreground='navy')
+        self.update_idletasks()
 
-        # Display nothing if the frame is not a light frame
-        if self.getSelectedLabel() is not self.labelLight:
-            self.varFOV.set('')
+        try:
+            model = apbm.BackgroundModel(img, mask=mask, offset=black_level)
+        except (ValueError, np.linalg.LinAlgError) as error:
+            self.varMessageLabel.set('Could not fit the background: {}'.format(error))
+            self.labelMessage.configure(foreground='crimson')
             return None
 
-        dx = self.cont.ISVal*np.abs(x1 - x2)
-        dy = self.cont.ISVal*np.abs(y1 - y2)
+        mean, gradient, direction = model.gradient()
 
-        # Compensate for that every other pixel is removed in a CFA splitted image
-        if self.labelLight.isSplitted:
-            dx *= 2.0
-            dy *= 2.0
+        rows = [('Blocks used: ', '{:d} of {:d}'.format(int(np.sum(model.used)), model.used.size), ''),
+                ('Mean background level: ', '{:.1f}'.format(mean), ' ADU'),
+                ('Variation across frame: ', '{:.2f}'.format(gradient), ' %'),
+                ('Gradient direction: ', '{:.0f}'.format(direction), ' degrees')]
 
-        # Compensate for any resizing
-        if self.showResized:
-            dx *= float(self.photo_img.width())/self.imageSize[0]
-            dy *= float(self.photo_img.height())/self.imageSize[1]
+        if label is not self.labelLight:
+            rows.append(('Corner falloff: ', '{:.2f}'.format(model.vignetting()), ' %'))
 
-        deg_r = np.sqrt(dx**2 + dy**2)/3600.0
+        self.varMessageLabel.set('Background model fitted.')
+        self.labelMessage.configure(foreground='navy')
 
-        # Set the angle in the active angle unit
-        if self.cont.dmsAngleUnit.get():
+        self.disableWidgets()
+        self.busy = True
 
-            deg_ri = int(deg_r)
+        # Setup window displaying the results
+        topModel = tk.Toplevel(background=C.DEFAULT_BG)
+        topModel.title('Background model')
+        self.cont.addIcon(topModel)
+        apc.setupWindow(topModel, 340, 240)
+        topModel.focus_force()
 
-            min_r = (deg_r - deg_ri)*60
-            min_ri = int(min_r)
+        ttk.Label(topModel, text='Background of the {} frame'.format('light' if label is self.labelLight else 'flat'),
+                  font=self.cont.smallbold_font, anchor='center').pack(side='top', pady=(15*C.scsy, 5*C.scsy),
+                                                                      expand=True)
 
-            sec_r = (min_r - min_ri)*60
+        frameResults = ttk.Frame(topModel)
+        frameResults.pack(side='top', expand=True)
 
-            self.varFOV.set(u'Angle: {:d}\u00B0 {:d}\' {:.1f}\'\''.format(deg_ri, min_ri, sec_r))
+        for j, (name, value, unit) in enumerate(rows):
+            ttk.Label(frameResults, text=name).grid(row=j, column=0, sticky='W')
+            ttk.Label(frameResults, text=value, width=11, anchor='center').grid(row=j, column=1)
+            ttk.Label(frameResults, text=unit).grid(row=j, column=2, sticky='W')
 
-        else:
+        ttk.Label(topModel, text='The direction is where the background\nincreases, counterclockwise from the right.',
+                  font=self.cont.small_font, anchor='center').pack(side='top', pady=(5*C.scsy, 0), expand=True)
 
-            self.varFOV.set(u'Angle: {:.3g}\u00B0'.format(deg_r))
+        ttk.Button(topModel, text='Close', command=lambda: topModel.destroy())\
+                  .pack(side='top', pady=(5*C.scsy, 15*C.scsy), expand=True)
 
-    def showRCMenuEvent(self, event):
+        self.wait_window(topModel)
 
-        '''Show menu at pointer location when canvas is right-clicked.'''
+        self.busy = False
+        self.enableWidgets()
 
-        if C.is_win:
-            self.menuRC.post(event.x_root, event.y_root)
-        else:
-            self.menuRC.tk_popup(event.x_root, event.y_root)
+    def analysePatternNoise(self):
 
-        self.menuActive = True
+        '''
+        Show the row and column profiles and the power spectrum of the selected bias or dark frame,
+        with the split of its noise into random and pattern noise and the strongest banding.
+        '''
 
-    def getStatistics(self):
+        label = self.getSelectedLabel()
 
-        '''Show topwindow with statistics of selected area or entire image.'''
+        self.menuActive = False
 
-        # Get raw image data
-        img = np.load('aplab_temp' + os.sep + self.labelNames[self.getSelectedLabel()] + '.npy')
+        if not label in [self.labelBias1, self.labelBias2, self.labelDark1, self.labelDark2]:
+            self.varMessageLabel.set('Only available for bias and dark frames.')
+            self.labelMessage.configure(foreground='crimson')
+            return None
 
-        # Crop image if a selection box has been drawn
-        if self.localSelection:
-            img_crop = img[self.selectionArea[1]:self.selectionArea[3],
-                           self.selectionArea[0]:self.selectionArea[2]]
-        else:
-            img_crop = img
+        self.varMessageLabel.set('Analysing pattern noise..')
+        self.labelMessage.configure(foreground='navy')
+        self.update_idletasks()
 
-        # Calculate values in (cropped) image
-        sample_val = img_crop.shape[0]*img_crop.shape[1]
         try:
-            mean_val = np.mean(img_crop)
-            median_val = np.median(img_crop)
-            std_val = np.std(img_crop)
-            max_val = np.max(img_crop)
-            min_val = np.min(img_crop)
-        except MemoryError:
-            self.varMessageLabel.set('Not enough memory available. Please select a limited region ' \
-                                     + 'of the image before computing statistics.')
+            noise = appn.PatternNoise(self.frameStore.get(self.labelNames[label]))
+        except (ValueError, MemoryError) as error:
+            self.varMessageLabel.set('Could not analyse the pattern noise: {}'.format(error))
             self.labelMessage.configure(foreground='crimson')
             return None
 
+        self.varMessageLabel.set('Pattern noise analysed.')
+        self.labelMessage.configure(foreground='navy')
+
         self.disableWidgets()
         self.busy = True
 
-        # Setup window displaying the calculated information
-        topStatistics = tk.Toplevel(background=C.DEFAULT_BG)
-        topStatistics.title('Statistics')
-        self.cont.addIcon(topStatistics)
-        apc.setupWindow(topStatistics, 300, 230)
-        topStatistics.focus_force()
+        # Setup figure with the profiles and the power spectrum
+        f = matplotlib.figure.Figure(figsize=(6.5*C.scsx, 2.6*C.scsx), dpi=100, facecolor=C.DEFAULT_BG,
+                                     tight_layout={'pad' : 0.6})
 
-        self.menuRC.entryconfigure(8, state='disabled')
+        axRows = f.add_subplot(131)
+        axRows.plot(noise.row_means - np.mean(noise.row_means), color='navy', linewidth=0.5)
+        axRows.set_title('Row means', fontsize=8)
+        axRows.set_xlabel('Row', fontsize=8)
+        axRows.set_ylabel('ADU', fontsize=8)
 
-        ttk.Label(topStatistics, text='Statistics of selected image region' \
-                                      if self.localSelection else 'Statistics of the entire image',
-                  font=self.cont.smallbold_font,
-                  anchor='center').pack(side='top', pady=(20*C.scsy, 10*C.scsy), expand=True)
+        axColumns = f.add_subplot(132)
+        axColumns.plot(noise.column_means - np.mean(noise.column_means), color='navy', linewidth=0.5)
+        axColumns.set_title('Column means', fontsize=8)
+        axColumns.set_xlabel('Column', fontsize=8)
 
-        frameStatistics = ttk.Frame(topStatistics)
-        frameStatistics.pack(side='top', pady=(0, 6*C.scsy), expand=True)
+        # Put the zero vertical frequency in the middle
+        axSpectrum = f.add_subplot(133)
+        spectrum = np.fft.fftshift(noise.spectrum, axes=0)
+        axSpectrum.imshow(np.log10(spectrum + 1e-12*np.max(spectrum)), cmap='gray', aspect='auto',
+                          extent=[0, 0.5, 0.5, -0.5])
+        axSpectrum.set_title('Power spectrum (log)', fontsize=8)
+        axSpectrum.set_xlabel('Horizontal frequency', fontsize=8)
+        axSpectrum.set_ylabel('Vertical frequency', fontsize=8)
 
-        ttk.Label(frameStatistics, text='Sample size: ').grid(row=0, column=0, sticky='W')
-        ttk.Label(frameStatistics, text=('{:d}'.format(sample_val)), width=7,
-                  anchor='center').grid(row=0, column=1)
-        ttk.Label(frameStatistics, text=' pixels').grid(row=0, column=2, sticky='W')
+        for ax in [axRows, axColumns, axSpectrum]:
+            ax.tick_params(axis='both', which='major', labelsize=7)
 
-        ttk.Label(frameStatistics, text='Mean value: ').grid(row=1, column=0, sticky='W')
-        ttk.Label(frameStatistics, text=('{:.1f}'.format(mean_val)), width=7,
-                  anchor='center').grid(row=1, column=1)
-        ttk.Label(frameStatistics, text=' ADU').grid(row=1, column=2, sticky='W')
+        def formatBanding(banding):
 
-        ttk.Label(frameStatistics, text='Median value: ').grid(row=2, column=0, sticky='W')
-        ttk.Label(frameStatistics, text=('{:g}'.format(median_val)), width=7,
-                  anchor='center').grid(row=2, column=1)
-        ttk.Label(frameStatistics, text=' ADU').grid(row=2, column=2, sticky='W')
+            '''Return the periods and amplitudes of the strongest banding as text.'''
 
-        ttk.Label(frameStatistics, text='Standard deviation: ').grid(row=3, column=0, sticky='W')
-        ttk.Label(frameStatistics, text=('{:.2f}'.format(std_val)), width=7,
-                  anchor='center').grid(row=3, column=1)
-        ttk.Label(frameStatistics, text=' ADU').grid(row=3, column=2, sticky='W')
+            return ', '.join('{:.1f} px ({:.2f} ADU)'.format(1/frequency, amplitude)
+                             for frequency, amplitude in banding) or 'None'
 
-        ttk.Label(frameStatistics, text='Maximum value: ').grid(row=4, column=0, sticky='W')
-        ttk.Label(frameStatistics, text=('{:d}'.format(int(max_val))), width=7,
-                  anchor='center').grid(row=4, column=1)
-        ttk.Label(frameStatistics, text=' ADU').grid(row=4, column=2, sticky='W')
+        rows = [('Total noise: ', '{:.3f} ADU'.format(noise.total)),
+                ('Random noise: ', '{:.3f} ADU'.format(noise.random)),
+                ('Row pattern noise: ', '{:.3f} ADU'.format(noise.row)),
+                ('Column pattern noise: ', '{:.3f} ADU'.format(noise.column)),
+                ('Pattern share of variance: ', '{:.1f} %'.format(100*noise.patternFraction())),
+                ('Row banding periods: ', formatBanding(noise.row_banding)),
+                ('Column banding periods: ', formatBanding(noise.column_banding))]
 
-        ttk.Label(frameStatistics, text='Minimum value: ').grid(row=5, column=0, sticky='W')
-        ttk.Label(frameStatistics, text=('{:d}'.format(int(min_val))), width=7,
-                  anchor='center').grid(row=5, column=1)
-        ttk.Label(frameStatistics, text=' ADU').grid(row=5, column=2, sticky='W')
+        # Setup window
+        topPattern = tk.Toplevel(background=C.DEFAULT_BG)
+        topPattern.title('Pattern noise')
+        self.cont.addIcon(topPattern)
+        apc.setupWindow(topPattern, 700, 520)
+        topPattern.focus_force()
 
-        ttk.Button(topStatistics, text='Close', command=lambda: topStatistics.destroy())\
-                  .pack(side='top', pady=(0, 15*C.scsy), expand=True)
+        frameCanvas = ttk.Frame(topPattern)
+        frameCanvas.pack(side='top', pady=(15*C.scsy, 0), expand=True)
 
-        self.wait_window(topStatistics)
+        canvasPattern = matplotlib.backends.backend_tkagg.FigureCanvasTkAgg(f, frameCanvas)
+        canvasPattern._tkcanvas.config(highlightthickness=0)
+        canvasPattern.get_tk_widget().pack(side='top')
 
-        try:
-            self.menuRC.entryconfigure(8, state='normal')
-        except:
-            pass
+        frameResults = ttk.Frame(topPattern)
+        frameResults.pack(side='top', pady=(5*C.scsy, 0), expand=True)
 
-        self.enableWidgets()
-        self.busy = False
+        for j, (name, value) in enumerate(rows):
+            ttk.Label(frameResults, text=name).grid(row=j, column=0, sticky='W')
+            ttk.Label(frameResults, text=value).grid(row=j, column=1, sticky='W')
 
-        self.menuActive = False
+        ttk.Button(topPattern, text='Close', command=lambda: topPattern.destroy())\
+                  .pack(side='top', pady=(5*C.scsy, 15*C.scsy), expand=True)
+
+        self.wait_window(topPattern)
+
+        self.busy = False
+        self.enableWidgets()
 
     def transferData(self):
 
@@ -2519,7 +4224,7 @@ class ImageAnalyser(ttk.Frame):
             # Get selected image region from user
 
             self.disableWidgets()
-            self.menuRC.entryconfigure(9, state='disabled')
+            self.menuRC.entryconfigure(11, state='disabled')
             self.busy = True
 
             def ok_light():
@@ -2527,15 +4232,19 @@ class ImageAnalyser(ttk.Frame):
                 self.cancelled = False
                 topAskRegion.destroy()
 
+            hasCFA = self.CFAPattern is not None and (self.cont.isDSLR or self.varCCDType.get() == 'colour')
+
             topAskRegion = tk.Toplevel(background=C.DEFAULT_BG)
             topAskRegion.title('Choose selected region')
             self.cont.addIcon(topAskRegion)
-            apc.setupWindow(topAskRegion, 300, 145)
+            apc.setupWindow(topAskRegion, 300, 145 if not hasCFA else 180)
             topAskRegion.focus_force()
 
             self.cancelled = True
             varBGRegion = tk.IntVar()
             varBGRegion.set(1)
+            varChannel = tk.StringVar()
+            varChannel.set('G')
 
             ttk.Label(topAskRegion,
                       text='Choose which region of the image\nyou have selected.').pack(side='top', pady=(10*C.scsy, 5*C.scsy),
@@ -2548,13 +4257,24 @@ class ImageAnalyser(ttk.Frame):
             ttk.Radiobutton(frameRadio, text='Target', variable=varBGRegion,
                             value=0).grid(row=0, column=1)
 
+            # Let the user choose which colour channel to use
+            if hasCFA:
+                frameChannel = ttk.Frame(topAskRegion)
+                frameChannel.pack(side='top', expand=True, pady=(0, 10*C.scsy))
+                ttk.Radiobutton(frameChannel, text='Green', variable=varChannel,
+                                value='G').grid(row=0, column=0)
+                ttk.Radiobutton(frameChannel, text='Red', variable=varChannel,
+                                value='R').grid(row=0, column=1)
+                ttk.Radiobutton(frameChannel, text='Blue', variable=varChannel,
+                                value='B').grid(row=0, column=2)
+
             ttk.Button(topAskRegion, text='OK', command=ok_light).pack(side='top', expand=True,
                                                                        pady=(0, 10*C.scsy))
 
             self.wait_window(topAskRegion)
 
             self.enableWidgets()
-            self.menuRC.entryconfigure(9, state='normal')
+            self.menuRC.entryconfigure(11, state='normal')
             self.busy = False
 
             # Cancel if topwindow was exited
@@ -2566,24 +4286,37 @@ class ImageAnalyser(ttk.Frame):
 
             calframe = self.cont.frames[ImageCalculator]
 
-            # Get raw data of selected area
-            img_crop = np.load('aplab_temp' + os.sep + self.labelNames[label] + '.npy')[self.selectionArea[1]:self.selectionArea[3],
-                                                                                        self.selectionArea[0]:self.selectionArea[2]]
+            # Get raw data and selected area
+            img = self.frameStore.get(self.labelNames[label])
+            region = self.selectionArea[0], self.selectionArea[2], self.selectionArea[1], self.selectionArea[3]
+
+            mask = self.getPixelMask(img)
+            clip = self.varSigmaClip.get()
+
+            # Use the pixels of the chosen colour channel, leaving out hot and warm pixels if requested
+            if hasCFA or mask is not None or clip:
+                n, mean, median, std, minimum, maximum = \
+                                self.getChannelStatistics(img, region, combineGreen=True, mask=mask,
+                                                          includeAll=True,
+                                                          clip=clip)[varChannel.get() if hasCFA else 'All']
+            else:
+                median = self.histStats.median(self.labelNames[label], img, region)
+                std = label.regionStats.getStatistics(*region)[2]
 
             # Calculate required values and transfer to corresponding widgets
             if varBGRegion.get():
 
                 if self.cont.isDSLR:
 
-                    bg_noise = np.std(img_crop)
+                    bg_noise = std
                     calframe.varBGN.set('{:.3g}'.format(bg_noise))
 
-                bg_level = np.median(img_crop)
+                bg_level = median
                 calframe.varBGL.set('{:g}'.format(bg_level))
 
             else:
 
-                target_level = np.median(img_crop)
+                target_level = median
                 calframe.varTarget.set('{:g}'.format(target_level))
 
             isostr = ''
@@ -2616,7 +4349,7 @@ class ImageAnalyser(ttk.Frame):
                     # Ask if user will still proceed
 
                     self.disableWidgets()
-                    self.menuRC.entryconfigure(9, state='disabled')
+                    self.menuRC.entryconfigure(11, state='disabled')
                     self.busy = True
 
                     topWarning = tk.Toplevel(background=C.DEFAULT_BG)
@@ -2644,7 +4377,7 @@ class ImageAnalyser(ttk.Frame):
                     self.wait_window(topWarning)
 
                     self.enableWidgets()
-                    self.menuRC.entryconfigure(9, state='normal')
+                    self.menuRC.entryconfigure(11, state='normal')
                     self.busy = False
 
                     # Cancel if topwindow is exited
@@ -2654,33 +4387,32 @@ class ImageAnalyser(ttk.Frame):
                         self.menuActive = False
                         return None
 
-                    # Get raw image data
-                    img = np.load('aplab_temp' + os.sep + self.labelNames[label] + '.npy')
-
-                    # Crop image if a selection box has been drawn
+                    # Use selection box if it has been drawn
                     if self.localSelection:
-                        img_crop = img[self.selectionArea[1]:self.selectionArea[3],
-                                       self.selectionArea[0]:self.selectionArea[2]]
+                        region = self.selectionArea[0], self.selectionArea[2], \
+                                 self.selectionArea[1], self.selectionArea[3]
                     else:
-                        img_crop = img
+                        region = 0, label.regionStats.width, 0, label.regionStats.height
+
+                    img = self.frameStore.get(self.labelNames[label])
+                    mask = self.getPixelMask(img)
+                    clip = self.varSigmaClip.get()
 
                     # Calculate dark frame noise
-                    try:
-                        dark_val = np.std(img_crop)
-                    except MemoryError:
-                        h, w = img_crop.shape
-                        a = int(0.25*h)
-                        b = int(0.75*h)
-                        c = int(0.25*w)
-                        d = int(0.75*w)
-                        dark_val = np.std(img_crop[a:b, c:d])
+                    if mask is None and not clip:
+                        dark_val = label.regionStats.getStatistics(*region)[2]
+                    else:
+                        dark_val = self.getChannelStatistics(img, region, mask=mask, includeAll=True,
+                                                             clip=clip)['All'][3]
 
                 # If two dark frames have been added
                 else:
 
                     # Get raw data of images
-                    img1 = np.load('aplab_temp' + os.sep + self.labelNames[self.labelDark1] + '.npy')
-                    img2 = np.load('aplab_temp' + os.sep + self.labelNames[self.labelDark2] + '.npy')
+                    img1 = self.frameStore.get(self.labelNames[self.labelDark1])
+                    img2 = self.frameStore.get(self.labelNames[self.labelDark2])
+
+                    mask = self.getPixelMask(img1)
 
                     # Crop images if a selection box has been drawn
                     if self.localSelection:
@@ -2688,14 +4420,20 @@ class ImageAnalyser(ttk.Frame):
                                          self.selectionArea[0]:self.selectionArea[2]]
                         img2_crop = img2[self.selectionArea[1]:self.selectionArea[3],
                                          self.selectionArea[0]:self.selectionArea[2]]
+                        if mask is not None:
+                            mask = mask[self.selectionArea[1]:self.selectionArea[3],
+                                        self.selectionArea[0]:self.selectionArea[2]]
                     else:
                         img1_crop = img1
                         img2_crop = img2
 
-                    # Calculate dark frame noise
+                    # Calculate dark frame noise, leaving out hot and warm pixels if requested
                     delta_dark = img1_crop + 30000 - img2_crop
                     try:
-                        dark_val = np.std(delta_dark)/np.sqrt(2)
+                        if self.varSigmaClip.get():
+                            dark_val = aprs.sigmaClip(delta_dark if mask is None else delta_dark[~mask])[2]/np.sqrt(2)
+                        else:
+                            dark_val = np.std(delta_dark if mask is None else delta_dark[~mask])/np.sqrt(2)
                     except MemoryError:
                         h, w = delta_dark.shape
                         a = int(0.25*h)
@@ -2710,52 +4448,45 @@ class ImageAnalyser(ttk.Frame):
                 if self.displayed_dark == 1:
 
                     # Get raw image data
-                    img = np.load('aplab_temp' + os.sep + self.labelNames[label] + '.npy')
+                    img = self.frameStore.get(self.labelNames[label])
 
-                    # Crop image if a selection box has been drawn
+                    # Use selection box if it has been drawn
                     if self.localSelection:
-                        img_crop = img[self.selectionArea[1]:self.selectionArea[3],
-                                       self.selectionArea[0]:self.selectionArea[2]]
+                        region = self.selectionArea[0], self.selectionArea[2], \
+                                 self.selectionArea[1], self.selectionArea[3]
                     else:
-                        img_crop = img
+                        region = None
+
+                    mask = self.getPixelMask(img)
 
                     # Calculate dark frame level
-                    try:
-                        dark_val = np.median(img_crop)
-                    except MemoryError:
-                        h, w = img_crop.shape
-                        a = int(0.25*h)
-                        b = int(0.75*h)
-                        c = int(0.25*w)
-                        d = int(0.75*w)
-                        dark_val = np.median(img_crop[a:b, c:d])
+                    if mask is None:
+                        dark_val = self.histStats.median(self.labelNames[label], img, region)
+                    else:
+                        dark_val = self.getChannelStatistics(img, region, mask=mask, includeAll=True)['All'][2]
 
                 else:
 
                     # Get raw data of images
-                    img1 = np.load('aplab_temp' + os.sep + self.labelNames[self.labelDark1] + '.npy')
-                    img2 = np.load('aplab_temp' + os.sep + self.labelNames[self.labelDark2] + '.npy')
+                    img1 = self.frameStore.get(self.labelNames[self.labelDark1])
+                    img2 = self.frameStore.get(self.labelNames[self.labelDark2])
 
-                    # Crop images if a selection box has been drawn
+                    # Use selection box if it has been drawn
                     if self.localSelection:
-                        img1_crop = img1[self.selectionArea[1]:self.selectionArea[3],
-                                         self.selectionArea[0]:self.selectionArea[2]]
-                        img2_crop = img2[self.selectionArea[1]:self.selectionArea[3],
-                                         self.selectionArea[0]:self.selectionArea[2]]
+                        region = self.selectionArea[0], self.selectionArea[2], \
+                                 self.selectionArea[1], self.selectionArea[3]
                     else:
-                        img1_crop = img1
-                        img2_crop = img2
+                        region = None
 
-                    # Calculate dark frame noise
-                    try:
-                        dark_val = 0.5*(np.median(img1_crop) + np.median(img2_crop))
-                    except MemoryError:
-                        h, w = img1_crop.shape
-                        a = int(0.25*h)
-                        b = int(0.75*h)
-                        c = int(0.25*w)
-                        d = int(0.75*w)
-                        dark_val = 0.5*(np.median(img1_crop[a:b, c:d]) + np.median(img2_crop[a:b, c:d]))
+                    mask = self.getPixelMask(img1)
+
+                    # Calculate dark frame level
+                    if mask is None:
+                        dark_val = 0.5*(self.histStats.median(self.labelNames[self.labelDark1], img1, region)
+                                        + self.histStats.median(self.labelNames[self.labelDark2], img2, region))
+                    else:
+                        dark_val = 0.5*(self.getChannelStatistics(img1, region, mask=mask, includeAll=True)['All'][2]
+                                        + self.getChannelStatistics(img2, region, mask=mask, includeAll=True)['All'][2])
 
             # Transfer data to dark input widget and set checkbutton state
             calframe = self.cont.frames[ImageCalculator]
@@ -2828,6 +4559,8 @@ class ImageAnalyser(ttk.Frame):
         event.widget.origin_x = event.x
         event.widget.origin_y = event.y
 
+        self.scheduleRender()
+
     def createMeasureEvent(self, event):
 
         '''Create line in canvas when right-clicked.'''
@@ -2881,8 +4614,7 @@ class ImageAnalyser(ttk.Frame):
         if np.abs(self.measurePoints[2] - self.measurePoints[0]) <= 1 \
            and np.abs(self.measurePoints[3] - self.measurePoints[1]) <= 1:
             event.widget.delete(self.measureLine)
-            self.setFOV(0, self.photo_img.width(),
-                        0, self.photo_img.height(), False)
+            self.setFOV(0, self.fullSize[0], 0, self.fullSize[1], False)
         else:
             self.setAngle(self.measurePoints[0], self.measurePoints[2],
                           self.measurePoints[1], self.measurePoints[3])
@@ -2897,8 +4629,7 @@ class ImageAnalyser(ttk.Frame):
 
                 if np.abs(self.measurePoints[2] - self.measurePoints[0]) <= 1 \
                    and np.abs(self.measurePoints[3] - self.measurePoints[1]) <= 1:
-                    self.setFOV(0, self.photo_img.width(),
-                                0, self.photo_img.height(), False)
+                    self.setFOV(0, self.fullSize[0], 0, self.fullSize[1], False)
                 else:
                     self.setAngle(self.measurePoints[0], self.measurePoints[2],
                                   self.measurePoints[1], self.measurePoints[3])
@@ -2909,8 +4640,7 @@ class ImageAnalyser(ttk.Frame):
                     self.setFOV(self.selectionArea[0], self.selectionArea[2],
                                 self.selectionArea[1], self.selectionArea[3], True)
                 else:
-                    self.setFOV(0, self.photo_img.width(),
-                                0, self.photo_img.height(), False)
+                    self.setFOV(0, self.fullSize[0], 0, self.fullSize[1], False)
 
     def useSelectMode(self):
 
@@ -3016,11 +4746,11 @@ class ImageAnalyser(ttk.Frame):
         self.varM = tk.StringVar()
         label = self.getSelectedLabel()
 
-        self.orig_stretched = label.stretched_img
+        self.orig_lut = label.lut
 
         self.varM.set(0.5)
 
-        self.menuRC.entryconfigure(7, state='disabled')
+        self.menuRC.entryconfigure(9, state='disabled')
         self.canvasDisplay.delete(self.selectionBox)
         self.localSelection = False
 
@@ -3036,7 +4766,7 @@ class ImageAnalyser(ttk.Frame):
         self.ax.set_ylim([0, 1])
 
         # Compute histogram
-        hist, bin_edges = np.histogram(label.stretched_img.flatten(), bins=257)
+        hist, bin_edges = apc.histogramLUT(label.hist, label.lut, 257)
 
         self.x = np.linspace(bin_edges[0], bin_edges[-2], 200)
 
@@ -3054,8 +4784,9 @@ class ImageAnalyser(ttk.Frame):
         topHist.focus_force()
 
         def apply():
-            self.orig_stretched = label.stretched_img
-            self.updateDisplayedImage(label, fromHist=True)
+            self.orig_lut = label.lut
+            label.stretched_img = apc.applyLUT(self.getLinearImage(label), label.lut)
+            self.updateDisplayedImage(label)
             self.showImage(label)
 
         frameCanvas = ttk.Frame(topHist)
@@ -3086,11 +4817,13 @@ class ImageAnalyser(ttk.Frame):
         frameButtons2.pack(side='top', pady=8*C.scsy)
 
         ttk.Button(frameButtons2, text='Autostretch',
-                   command=lambda: self.applyAutoStretch(label)).pack(side='left', padx=(40*C.scsx, 0))
+                   command=lambda: self.applyAutoStretch(label)).pack(side='left', padx=(10*C.scsx, 0))
         ttk.Button(frameButtons2, text='Stretch histogram',
-                   command=lambda: self.stretchHist(label)).pack(side='left', padx=10*C.scsx, expand=True)
+                   command=lambda: self.stretchHist(label)).pack(side='left', padx=(10*C.scsx, 0))
+        ttk.Button(frameButtons2, text='Arcsinh stretch',
+                   command=lambda: self.arcsinhStretchHist(label)).pack(side='left', padx=10*C.scsx)
         ttk.Button(frameButtons2, text='Reset to linear',
-                   command=lambda: self.resetToLinear(label)).pack(side='right', padx=(0, 40*C.scsx))
+                   command=lambda: self.resetToLinear(label)).pack(side='right', padx=(0, 10*C.scsx))
 
         frameButtons3 = ttk.Frame(topHist)
         frameButtons3.pack(side='top', pady=(0, 20*C.scsy))
@@ -3103,8 +4836,8 @@ class ImageAnalyser(ttk.Frame):
         self.wait_window(topHist)
 
         try:
-            label.stretched_img = self.orig_stretched
-            self.menuRC.entryconfigure(7, state='normal')
+            label.lut = self.orig_lut
+            self.menuRC.entryconfigure(9, state='normal')
         except:
             pass
         self.enableWidgets()
@@ -3114,7 +4847,7 @@ class ImageAnalyser(ttk.Frame):
 
     def closeHist(self, toplevel, label):
 
-        self.orig_stretched = label.stretched_img
+        self.orig_lut = label.lut
         toplevel.destroy()
 
     def updateHistStretch(self, m):
@@ -3130,44 +4863,57 @@ class ImageAnalyser(ttk.Frame):
 
         '''Redraw the histogram with clipped black point.'''
 
-        img = label.stretched_img
-        label.stretched_img = apc.clipLevel(img, np.min(img), 65535)
+        black_point = np.min(label.lut[label.hist > 0])
+        label.lut = apc.composeLUTs(label.lut, apc.clipLevelLUT(black_point, 65535))
         self.updateHist(label)
 
     def clipWhitePoint(self, label):
 
         '''Redraw the histogram with clipped white point.'''
 
-        img = label.stretched_img
-        label.stretched_img = apc.clipLevel(img, 0, np.max(img))
+        white_point = np.max(label.lut[label.hist > 0])
+        label.lut = apc.composeLUTs(label.lut, apc.clipLevelLUT(0, white_point))
         self.updateHist(label)
 
     def stretchHist(self, label):
 
         '''Redraw a stretched version of the histogram.'''
 
-        label.stretched_img = apc.stretch(label.stretched_img, float(self.varM.get()))
+        label.lut = apc.composeLUTs(label.lut, apc.stretchLUT(float(self.varM.get())))
+        self.updateHist(label)
+
+    def arcsinhStretchHist(self, label):
+
+        '''
+        Redraw an arcsinh-stretched version of the histogram, with the strength that brings the
+        selected midtones level to 50 %.
+        '''
+
+        label.lut = apc.composeLUTs(label.lut, apc.arcsinhLUT(apc.arcsinhBeta(float(self.varM.get()))))
         self.updateHist(label)
 
     def applyAutoStretch(self, label):
 
         '''Redraw an auto-stretched version of the histogram.'''
 
-        label.stretched_img = apc.autostretch(np.load('aplab_temp' + os.sep + self.labelNames[label] + '.npy'))
+        label.lut = apc.autostretchLUT(label.hist)
         self.updateHist(label)
 
     def resetToLinear(self, label):
 
         '''Show the histogram of the linear image.'''
 
-        label.stretched_img = np.load('aplab_temp' + os.sep + self.labelNames[label] + '.npy')
+        label.lut = apc.linearLUT()
         self.updateHist(label)
 
     def updateHist(self, label):
 
-        '''Compute a new histogram of the stretched image and update the plot.'''
+        '''
+        Compute a new histogram of the stretched image from the histogram
+        of the linear image and the stretch lookup table, and update the plot.
+        '''
 
-        hist, bin_edges = np.histogram(label.stretched_img.flatten(), bins=257)
+        hist, bin_edges = apc.histogramLUT(label.hist, label.lut, 257)
 
         self.ax.set_xlim([bin_edges[0], bin_edges[-2]])
         self.line1.set_data(bin_edges[:-1], hist/(1.05*np.max(hist)))
@@ -3176,29 +4922,32 @@ class ImageAnalyser(ttk.Frame):
         self.updateHistStretch(0.5)
         self.histcanvas.draw()
 
-    def updateDisplayedImage(self, label, fromHist=False):
+    def getLinearImage(self, label):
 
-        '''Create a photo image from the raw image of the label.'''
+        '''Return the raw data of the label as a 16-bit image that can be stretched with lookup tables.'''
 
-        # Save data as temporary image
-        im = Image.fromarray((255.0/65535.0*label.stretched_img).astype(np.uint8)).save('aplab_temp' + os.sep + self.labelNames[label] + '.png')
+        img = self.frameStore.get(self.labelNames[label])
 
-        plt.close('all')
+        if apc.isLUTImage(img):
+            return img
 
-        # Create resized version of image if necessary
-        if fromHist: self.loadImage(label)
+        # Rescale other data types linearly to the 16-bit range
+        if np.min(img) < np.max(img):
+            return apc.clipLevel(img, np.min(img), np.max(img))
+        else:
+            return np.zeros(img.shape, dtype='uint16')
 
-    def deleteTemp(self, exit):
+    def updateDisplayedImage(self, label):
 
-        for file in self.labelNames.values():
+        '''Create the image pyramid used for displaying the stretched image of the label.'''
 
-            try:
-                os.remove('aplab_temp' + os.sep + file + '.npy')
-            except OSError:
-                pass
-            try:
-                os.remove('aplab_temp' + os.sep + file + '.png')
-            except OSError:
-                pass
+        label.pyramid = DisplayPyramid((255.0/65535.0*label.stretched_img).astype(np.uint8))
+
+        plt.close('all')
+
+    def deleteTemp(self, exit):
+
+        self.frameStore.clear()
+        self.histStats.clear()
 
         #if exit: self.cont.destroy()
@@ -2,13 +2,16 @@
 
 import tkinter as tk
 import tkinter.ttk as ttk
+import tkinter.filedialog
 import os
 import atexit
 import numpy as np
 import matplotlib
-import matplotlib.pyplot as plt
+import matplotlib.image
+import astropy.io.fits as pyfits
 from PIL import Image, ImageTk
 import aplab_common as apc
+import aplab_sim_engine as apse
 from aplab_common import C
 
 class ImageSimulator(ttk.Frame):
@@ -102,7 +105,22 @@ class ImageSimulator(ttk.Frame):
         self.im_resolution_label = 'medium'
         self.im_resolutions = {'small': (256, 256), 'medium': (512, 512), 'large': (1024, 1024)}
         self.im_display_size = self.im_resolutions[self.im_resolution_label]
-        self.img_orig = matplotlib.image.imread('aplab_data{}sim_orig_image_{}.png'.format(os.sep, self.im_resolution_label))
+        
+        # Target map, bulge profiles and signal buffer of the last simulated resolution
+        self.sim_assets = None
+        self.sim_assets_key = None
+        
+        # Last simulated stack, its FITS header, its version reduced to the canvas size, and its
+        # displayed versions, made when first shown
+        self.stack_img = None
+        self.stack_header = None
+        self.display_img = None
+        self.photoim = None
+        self.photoim_str = None
+        
+        # Stacks at the full resolution of the sensor are written to this memory-mapped file
+        self.sim_stack_path = os.path.join('aplab_temp', 'sim_stack.npy')
+        atexit.register(self.deleteSimStack)
         
         # Set default attribute values
         
@@ -771,117 +789,174 @@ class ImageSimulator(ttk.Frame):
         black_level = C.BLACK_LEVEL[self.cont.cnum][0][self.gain_idx]
         white_level = C.WHITE_LEVEL[self.cont.cnum][0][self.gain_idx]
 
-        self.img_orig = matplotlib.image.imread('aplab_data{}sim_orig_image_{}.png'.format(os.sep, self.im_resolution_label))
-
-        im_size = self.im_resolutions[self.im_resolution_label] # Image dimensions
-
-        stack_img = np.zeros(im_size, dtype='float32')
-
-        target_map = self.img_orig.astype('float32')
-
-        i_grid, j_grid = np.meshgrid(np.arange(im_size[0]), np.arange(im_size[1]))
-
-        bulge_size = 0.04*(im_size[0] + im_size[1])
-        bulge_map = np.exp(-((i_grid - im_size[0]/2)**2 + (j_grid - im_size[1]/2)**2)/bulge_size**2)
+        target_map, bulge_x, bulge_y, target_signal_e = self.getSimAssets()
+        
+        # Mean electrons of the dark, sky and target signal in each subframe. The target signal is
+        # written into the buffer of the resolution, in blocks of rows.
+        dark_signal_e = self.df*self.exposure
+        background_signal_e = self.sf*self.exposure
         
-        # Generate sky, target and dark images from Poisson distributions
-        no_signal = np.zeros(im_size)
-        bias_offset_adu = (black_level*np.ones(im_size)).astype('int32')
-        dark_signal_e = self.df*self.exposure*np.ones(im_size)
-        background_signal_e = self.sf*self.exposure*np.ones(im_size)
-        target_signal_e = self.tf*self.exposure*target_map + (self.lf - self.tf)*self.exposure*bulge_map
+        np.multiply(target_map, self.tf*self.exposure, out=target_signal_e)
+        
+        for i in range(0, target_signal_e.shape[0], apse.TILE_ROWS):
+            target_signal_e[i:i+apse.TILE_ROWS] += (self.lf - self.tf)*self.exposure \
+                                                   *np.outer(bulge_y[i:i+apse.TILE_ROWS], bulge_x)
 
-        # Generate bias image with correct amount of Gaussian read noise
-        if self.show_bias_offset and self.show_bias_noise:
-            get_bias = lambda: np.random.normal(black_level, rn, im_size).astype('int32')
-        elif self.show_bias_offset:
-            get_bias = lambda: bias_offset_adu
-        elif self.show_bias_noise:
-            get_bias = lambda:  np.random.normal(0, rn, im_size).astype('int32')
-        else:
-            get_bias = lambda: no_signal
-
-        if self.show_dark_signal and self.show_dark_noise:
-            get_dark = lambda: np.random.poisson(dark_signal_e, im_size)
-        elif self.show_dark_signal:
-            get_dark = lambda: dark_signal_e
-        elif self.show_dark_noise:
-            get_dark = lambda: np.random.poisson(dark_signal_e, im_size) - dark_signal_e
-        else:
-            get_dark = lambda: no_signal
-
-        if self.show_background_signal and self.show_background_noise:
-            get_background = lambda: np.random.poisson(background_signal_e, im_size)
-        elif self.show_background_signal:
-            get_background = lambda: background_signal_e
-        elif self.show_background_noise:
-            get_background = lambda: np.random.poisson(background_signal_e, im_size) - background_signal_e
-        else:
-            get_background = lambda: no_signal
-
-        if self.show_target_signal and self.show_target_noise:
-            get_target = lambda: np.random.poisson(target_signal_e, im_size)
-        elif self.show_target_signal:
-            get_target = lambda: target_signal_e
-        elif self.show_target_noise:
-            get_target = lambda: np.random.poisson(target_signal_e, im_size) - target_signal_e
-        else:
-            get_target = lambda: 0
+        simulation = apse.StackSimulation(target_signal_e.shape, gain, rn, black_level, white_level,
+                                          [(dark_signal_e, self.show_dark_signal, self.show_dark_noise),
+                                           (background_signal_e, self.show_background_signal,
+                                            self.show_background_noise),
+                                           (target_signal_e, self.show_target_signal, self.show_target_noise)],
+                                          bias_offset=self.show_bias_offset, bias_noise=self.show_bias_noise)
 
-        if self.subs > 1:
-            def update_stack_text(i):
-                self.varMessageLabel.set('Stacking frame {:d} of {:d}..'.format(i, self.subs))
+        exact = self.varSimMode.get() == 'Exact'
+        sensor = self.im_resolution_label == 'sensor'
+
+        if (exact and self.subs > 1) or sensor:
+            def update_stack_text(done, total):
+                self.varMessageLabel.set('Stacking {:d} frames.. ({:d} of {:d} tiles done)'.format(self.subs, done, total))
                 self.labelMessage.configure(foreground='navy')
                 self.labelMessage.update_idletasks()
         else:
-            update_stack_text = lambda i: None
+            update_stack_text = None
+
+        # Release the previous stack, so that its file can be written again
+        self.stack_img = None
+        self.display_img = None
+        self.photoim = None
+        self.photoim_str = None
+
+        # Write a stack at the resolution of the sensor to a file instead of keeping it in memory
+        if sensor:
+            if not os.path.isdir('aplab_temp'): os.makedirs('aplab_temp')
+            out = np.lib.format.open_memmap(self.sim_stack_path, mode='w+', dtype='float32',
+                                            shape=target_signal_e.shape)
+        else:
+            out = None
 
-        for i in range(self.subs):
+        # Simulate every subframe, or draw the stack directly from the distribution of the sum of the
+        # subframes, in tiles on all cores
+        self.stack_img = simulation.simulate(self.subs, exact=exact, progress=update_stack_text, out=out)
 
-            update_stack_text(i+1)
+        self.stack_header = pyfits.Header()
+        self.stack_header['NCOMBINE'] = (self.subs, 'Number of stacked frames')
+        self.stack_header['EXPTIME'] = (self.exposure, 'Exposure time of each frame [s]')
+        self.stack_header['GAIN'] = (gain, 'Gain [e-/ADU]')
+        self.stack_header['DATAMAX'] = (white_level, 'White level [ADU]')
 
-            img = get_bias() + ((get_dark() + get_background() + get_target())/gain).astype('int32')
+        self.im_display_size = (int(self.canvasSim.winfo_width()), int(self.canvasSim.winfo_height()))
+        self.display_img = self.getDisplayStack()
+        
+        # Show the relevant version in the canvas
+        self.updateStretch()
+        
+        self.varMessageLabel.set('Image simulated.')
+        self.labelMessage.configure(foreground='navy')
 
-            # Truncate invalid pixel values
-            img[img < 0] = 0
-            img[img > white_level] = white_level
+    def getSimSize(self):
+    
+        '''Return the width and height of the simulated image at the selected resolution.'''
+    
+        if self.im_resolution_label == 'sensor':
+            return C.RES_X[self.cont.cnum][0], C.RES_Y[self.cont.cnum][0]
+            
+        return self.im_resolutions[self.im_resolution_label]
 
-            stack_img[:, :] += img.astype('float32')/white_level
+    def getSimAssets(self):
+    
+        '''
+        Return the target map of the demonstration image at the selected resolution, the
+        horizontal and vertical profiles of the bulge and a buffer for the target signal, as
+        float32 arrays. They are only read and computed again when the resolution has changed
+        since the last call. At the resolution of the sensor, the middle of the large version
+        of the image is resized to fill the sensor.
+        '''
+    
+        im_size = self.getSimSize() # Image dimensions
+    
+        if self.sim_assets_key != (self.im_resolution_label, im_size):
+        
+            # Free the maps of the previous resolution first
+            self.sim_assets = None
+            
+            if self.im_resolution_label == 'sensor':
+            
+                im = Image.fromarray(matplotlib.image.imread('aplab_data{}sim_orig_image_large.png'.format(os.sep)))
+                
+                # Crop the image to the aspect ratio of the sensor
+                w, h = im.size
+                crop_w = min(w, h*im_size[0]/im_size[1])
+                crop_h = min(h, w*im_size[1]/im_size[0])
+                
+                target_map = np.asarray(im.resize(im_size, Image.BILINEAR,
+                                                  box=((w - crop_w)/2, (h - crop_h)/2,
+                                                       (w + crop_w)/2, (h + crop_h)/2)), dtype='float32')
+                
+            else:
+                
+                target_map = matplotlib.image.imread('aplab_data{}sim_orig_image_{}.png'.format(os.sep,
+                                                     self.im_resolution_label)).astype('float32')
+            
+            # The Gaussian bulge is the product of a horizontal and a vertical profile
+            bulge_size = 0.04*(im_size[0] + im_size[1])
+            bulge_x = np.exp(-((np.arange(im_size[0]) - im_size[0]/2)/bulge_size)**2).astype('float32')
+            bulge_y = np.exp(-((np.arange(im_size[1]) - im_size[1]/2)/bulge_size)**2).astype('float32')
+            
+            self.sim_assets = (target_map, bulge_x, bulge_y, np.empty(target_map.shape, dtype='float32'))
+            self.sim_assets_key = (self.im_resolution_label, im_size)
+            
+        return self.sim_assets
 
-        # Take mean of images to get a stacked image
-        stack_img[:, :] /= float(self.subs)
+    def saveSimStack(self):
+    
+        '''Save the last simulated stack in ADU as a FITS file chosen by the user.'''
+    
+        if self.stack_img is None: return None
         
-        # Save linear and non-linear version of the simulated image
-        plt.imsave('aplab_temp{}sim.jpg'.format(os.sep), stack_img, cmap=plt.get_cmap('gray'), vmin = 0.0, vmax = 1.0)
-        plt.imsave('aplab_temp{}sim_str.jpg'.format(os.sep), apc.autostretch(stack_img), cmap=plt.get_cmap('gray'), vmin=0, vmax=65535)
+        filepath = tkinter.filedialog.asksaveasfilename(parent=self.topCanvas, defaultextension='.fits',
+                                                        filetypes=[('FITS files', '*.fits')])
         
-        # Open as PIL images
-        im = Image.open('aplab_temp{}sim.jpg'.format(os.sep))
-        im_str = Image.open('aplab_temp{}sim_str.jpg'.format(os.sep))
-
-        self.im_display_size = (int(self.canvasSim.winfo_width()), int(self.canvasSim.winfo_height()))
+        if not filepath: return None
         
-        # Resize images to fit canvas
-        im_res = im.resize((self.im_display_size[0], self.im_display_size[1]), Image.ANTIALIAS)
-        im_res_str = im_str.resize((self.im_display_size[0], self.im_display_size[1]), Image.ANTIALIAS)
+        self.varMessageLabel.set('Saving simulated image..')
+        self.labelMessage.configure(foreground='navy')
+        self.labelMessage.update_idletasks()
         
-        # Convert to PhotoImage
-        self.photoim = ImageTk.PhotoImage(im_res)
-        self.photoim_str = ImageTk.PhotoImage(im_res_str)
+        path = os.sep.join(filepath.split('/'))
+        height, width = self.stack_img.shape
         
-        # Show relevant version in canvas
-        if self.varStretch.get():
+        header = pyfits.Header([('SIMPLE', True), ('BITPIX', -32), ('NAXIS', 2), ('NAXIS1', width), ('NAXIS2', height)])
+        header.extend(self.stack_header)
         
-            self.canvasSim.create_image(0, 0, image=self.photoim_str, anchor='nw')
-            self.canvasSim.image = self.photoim_str
+        try:
+            if os.path.exists(path): os.remove(path)
             
-        else:
+            # Write the stack scaled to ADU one tile of rows at a time, without a full-size copy in memory
+            stream = pyfits.StreamingHDU(path, header)
+            
+            try:
+                for i in range(0, height, apse.TILE_ROWS):
+                    stream.write(self.stack_img[i:i+apse.TILE_ROWS]*np.float32(self.stack_header['DATAMAX']))
+            finally:
+                stream.close()
+        except OSError:
+            self.varMessageLabel.set('Could not save the simulated image.')
+            self.labelMessage.configure(foreground='crimson')
+            return None
+            
+        self.varMessageLabel.set('Simulated image saved as "{}".'.format(filepath.split('/')[-1]))
+        self.labelMessage.configure(foreground='navy')
         
-            self.canvasSim.create_image(0, 0, image=self.photoim, anchor='nw')
-            self.canvasSim.image = self.photoim
+    def deleteSimStack(self):
+    
+        '''Remove the memory-mapped file of the last stack simulated at the resolution of the sensor.'''
+    
+        self.stack_img = None
         
-        self.varMessageLabel.set('Image simulated.')
-        self.labelMessage.configure(foreground='navy')
+        try:
+            if os.path.exists(self.sim_stack_path): os.remove(self.sim_stack_path)
+        except OSError:
+            pass
 
     def activateTooltips(self):
     
@@ -1014,19 +1089,21 @@ class ImageSimulator(ttk.Frame):
 
             self.bias_options = ['Offset + read noise', 'Offset', 'Read noise', 'None']
             self.signal_options = ['Signal + noise', 'Signal', 'Noise', 'None']
-            self.resolution_options = ['Small', 'Medium', 'Large']
+            self.resolution_options = ['Small', 'Medium', 'Large', 'Sensor']
 
             self.varSimBias = tk.StringVar()
             self.varSimDark = tk.StringVar()
             self.varSimBackground = tk.StringVar()
             self.varSimTarget = tk.StringVar()
             self.varSimResolution = tk.StringVar()
+            self.varSimMode = tk.StringVar()
 
             self.varSimBias.set(self.bias_options[0])
             self.varSimDark.set(self.signal_options[0])
             self.varSimBackground.set(self.signal_options[0])
             self.varSimTarget.set(self.signal_options[0])
             self.varSimResolution.set(self.im_resolution_label[0].upper() + self.im_resolution_label[1:])
+            self.varSimMode.set('Fast')
 
             self.show_bias_offset = True
             self.show_bias_noise = True
@@ -1083,10 +1160,17 @@ class ImageSimulator(ttk.Frame):
             labelTarget.grid(row=4, column=0, sticky='W')
             optionTarget.grid(row=4, column=1, sticky='W')
 
+            labelMode = ttk.Label(self.frameView, text='Stacking:')
+            optionMode = ttk.OptionMenu(self.frameView, self.varSimMode, None, 'Fast', 'Exact')
+
             labelResolution.grid(row=5, column=0, sticky='W', pady=10*C.scsy)
             optionResolution.grid(row=5, column=1, sticky='W', pady=10*C.scsy)
 
-            ttk.Button(self.frameView, text='Update', command=self.updateSim).grid(row=6, column=0, columnspan=2, pady=10*C.scsy)
+            labelMode.grid(row=6, column=0, sticky='W')
+            optionMode.grid(row=6, column=1, sticky='W')
+
+            ttk.Button(self.frameView, text='Update', command=self.updateSim).grid(row=7, column=0, columnspan=2, pady=10*C.scsy)
+            ttk.Button(self.frameView, text='Save as FITS', command=self.saveSimStack).grid(row=8, column=0, columnspan=2)
 
             self.frameView.pack(side='right', expand=True, padx=10*C.scsx)
                 
@@ -1119,16 +1203,63 @@ class ImageSimulator(ttk.Frame):
 
     def updateStretch(self):
         
-        # Redraw the simulated image as stretched or unstretched depending on checkbutton state
+        if self.display_img is None: return
+        
+        # Redraw the simulated image as stretched or unstretched depending on checkbutton state,
+        # making the stretched version the first time it is shown
         if self.varStretch.get():
+        
+            if self.photoim_str is None:
+                self.photoim_str = self.getDisplayImage(apc.autostretch(self.display_img), 65535.0)
     
             self.canvasSim.create_image(0, 0, image=self.photoim_str, anchor='nw')
             self.canvasSim.image = self.photoim_str
             
         else:
         
+            if self.photoim is None:
+                self.photoim = self.getDisplayImage(self.display_img, 1.0)
+        
             self.canvasSim.create_image(0, 0, image=self.photoim, anchor='nw')
             self.canvasSim.image = self.photoim
+            
+    def getDisplayStack(self):
+    
+        '''
+        Return the last simulated stack reduced to about the size of the canvas by averaging
+        square blocks of pixels, one tile of rows at a time. The displayed versions and the
+        autostretch are computed from this small image, so a stack at the resolution of the
+        sensor is never converted or stretched at full size.
+        '''
+    
+        h, w = self.stack_img.shape
+        factor = max(min(h//self.im_display_size[1], w//self.im_display_size[0]), 1)
+        
+        # Rows of the stack averaged at a time, a whole number of blocks high
+        rows = factor*max(apse.TILE_ROWS//factor, 1)
+        
+        display_img = np.empty((h//factor, w//factor), dtype='float32')
+        
+        for i in range(0, (h//factor)*factor, rows):
+        
+            tile = self.stack_img[i:min(i + rows, (h//factor)*factor), :(w//factor)*factor]
+            
+            display_img[i//factor:(i + tile.shape[0])//factor] = \
+                tile.reshape(tile.shape[0]//factor, factor, w//factor, factor).mean(axis=(1, 3))
+            
+        return display_img
+            
+    def getDisplayImage(self, img, white):
+    
+        '''
+        Return a PhotoImage of the image resized to fit the canvas, with values from zero (black)
+        to the given white value converted directly to 8-bit.
+        '''
+    
+        img_8 = (np.clip(img*(255.0/white), 0, 255) + 0.5).astype('uint8')
+        
+        return ImageTk.PhotoImage(Image.fromarray(img_8).resize((self.im_display_size[0], self.im_display_size[1]),
+                                                                 Image.ANTIALIAS))
     
     def updateSimBias(self, selected_value):
  
@@ -1200,10 +1331,13 @@ class ImageSimulator(ttk.Frame):
     
         if self.noInvalidInput:
 
-            f = np.min([float(self.topCanvas.winfo_width() - self.frameView.winfo_width() - 60*C.scsx)/self.im_display_size[0],
-                        float(self.topCanvas.winfo_height() - self.frameStretch.winfo_height() - 20*C.scsy)/self.im_display_size[1]])
+            # Fit the canvas to the window with the aspect ratio of the simulated image
+            im_size = self.getSimSize()
+
+            f = np.min([float(self.topCanvas.winfo_width() - self.frameView.winfo_width() - 60*C.scsx)/im_size[0],
+                        float(self.topCanvas.winfo_height() - self.frameStretch.winfo_height() - 20*C.scsy)/im_size[1]])
 
-            self.canvasSim.configure(width=int(f*self.im_display_size[0]), height=int(f*self.im_display_size[1]))
+            self.canvasSim.configure(width=int(f*im_size[0]), height=int(f*im_size[1]))
 
             self.simulateImage()
 
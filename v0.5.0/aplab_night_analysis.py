@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import argparse
+import concurrent.futures
+import numpy as np
+import aplab_frame_reader as apfr
+import aplab_histogram_stats as aphs
+import aplab_robust_stats as aprs
+
+# File extensions of the raw, TIFF and FITS frames that the Image Analyser can read
+FRAME_EXTENSIONS = ['3fr', 'r3d', 'arw', 'bay', 'cap', 'cr2', 'crw', 'dcr', 'dcs', 'dng', 'drf', 'eip',
+                    'erf', 'fff', 'iiq', 'k25', 'kdc', 'mdc', 'mef', 'mos', 'mrw', 'nef', 'nrw', 'orf',
+                    'pef', 'ptx', 'pxn', 'raf', 'raw', 'rw2', 'rwl', 'sr2', 'srf', 'srw', 'x3f',
+                    'tif', 'tiff', 'fit', 'fits']
+
+CLIP_SIGMA = 5.0    # Pixels further from the median than this many robust standard deviations are excluded
+
+TABLE_COLUMNS = ['File', 'Exposure [s]', 'ISO', 'Background level [ADU]',
+                 'Background noise [ADU]', 'Sky flux [e-/s]']
+
+def frameFiles(directory):
+
+    '''Return the paths of the supported image files in the given directory, sorted by name.'''
+
+    names = sorted(name for name in os.listdir(directory)
+                   if name.split('.')[-1].lower() in FRAME_EXTENSIONS)
+
+    return [os.path.join(directory, name) for name in names]
+
+def frameExposure(isExif, metadata):
+
+    '''Return the exposure time in seconds stored in the metadata of a frame, or None if missing.'''
+
+    try:
+        if isExif:
+            exposure_str = str(metadata['EXIF ExposureTime'])
+        else:
+            try:
+                exposure_str = str(metadata['EXPTIME'])
+            except KeyError:
+                exposure_str = str(metadata['EXPOSURE'])
+
+        # Quoted exposure times may be fractions
+        if '/' in exposure_str:
+            fraction_parts = exposure_str.split('/')
+            return float(fraction_parts[0])/float(fraction_parts[1])
+
+        return float(exposure_str)
+
+    except (KeyError, ValueError, ZeroDivisionError):
+        return None
+
+def frameISO(metadata):
+
+    '''Return the ISO stored in the metadata of a frame, or None if missing.'''
+
+    try:
+        return int(str(metadata['EXIF ISOSpeedRatings']))
+    except (KeyError, ValueError):
+        return None
+
+def backgroundStatistics(img, pattern=None, channel='G'):
+
+    '''
+    Return the median and the noise of the pixel values of the given colour channel ("R", "G" or
+    "B") of a frame with the given CFA pattern, or of all pixels if there is no pattern. The
+    noise is the standard deviation of the pixels close to the median (within CLIP_SIGMA times
+    the scaled median absolute deviation), so stars and hot pixels are left out.
+    '''
+
+    hasCFA = pattern is not None and img.shape[0] > 1 and img.shape[1] > 1
+
+    if aphs.hasHistogram(img):
+
+        # Count the pixels of all four CFA positions in one pass
+        hists, offset = aphs.mosaicHistograms(img)
+
+        if hasCFA:
+            channels = apfr.cfaChannels(pattern)
+            hist = sum(hists[i] for i in range(4) if channels[i].startswith(channel))
+        else:
+            hist = hists.sum(axis=0)
+
+        median = aphs.histogramMedian(hist, offset)
+        limit = CLIP_SIGMA*aprs.MAD_TO_STD*max(aphs.histogramMAD(hist, offset), 0.5)
+
+        # Histogram bins of the values close to the median
+        lo = max(int(np.ceil(median - limit)) - offset, 0)
+        hi = max(int(np.floor(median + limit)) - offset + 1, lo)
+
+        return median, aphs.histogramMoments(hist[lo:hi], offset + lo)[2]
+
+    if hasCFA:
+        planes = apfr.cfaPlanes(img, pattern)
+        pixels = np.concatenate([planes[ch].ravel() for ch in planes if ch.startswith(channel)])
+    else:
+        pixels = np.asarray(img).ravel()
+
+    median = np.median(pixels)
+    limit = CLIP_SIGMA*aprs.madStd(pixels, median)
+
+    return float(median), float(np.std(pixels[np.abs(pixels - median) <= limit]))
+
+def analyseFrame(filepath, hasCFA=False, pattern=None, channel='G'):
+
+    '''
+    Decode a light frame and return its exposure time, ISO, background level and background
+    noise. Raw frames of colour cameras use their own CFA pattern if none is given.
+    '''
+
+    img, metadata, isExif, found_pattern = apfr.readFrame(filepath, getPattern=(hasCFA and pattern is None))
+
+    if len(img.shape) != 2:
+        raise ValueError('Frame "{}" is not a single-channel image.'.format(filepath))
+
+    if hasCFA and pattern is None:
+        pattern = found_pattern
+
+    bg_level, bg_noise = backgroundStatistics(img, pattern if hasCFA else None, channel)
+
+    return frameExposure(isExif, metadata), frameISO(metadata), bg_level, bg_noise
+
+def analyseFrames(filepaths, hasCFA=False, pattern=None, channel='G', max_workers=None):
+
+    '''
+    Start analysing the given frames concurrently in separate processes. Returns the executor
+    and one future per frame, each giving the result of "analyseFrame".
+    '''
+
+    executor = concurrent.futures.ProcessPoolExecutor(max_workers=min(max(len(filepaths), 1),
+                                                                      max_workers or os.cpu_count() or 1))
+
+    futures = [executor.submit(analyseFrame, filepath, hasCFA, pattern, channel) for filepath in filepaths]
+
+    return executor, futures
+
+def skyFlux(bg_level, black_level, gain, exposure):
+
+    '''
+    Return the electron flux from the skyglow given the background level, in the same way as
+    the Image Calculator does without a dark frame, or None if the exposure time is unknown.
+    '''
+
+    if exposure is None or exposure <= 0 or gain is None or black_level is None:
+        return None
+
+    return (bg_level - black_level)*gain/exposure
+
+def writeTable(filename, rows):
+
+    '''
+    Write one tab-separated line per frame with the values of TABLE_COLUMNS, where rows
+    hold the file name, exposure, ISO, background level, noise and sky flux of each frame.
+    Missing values are written as "-".
+    '''
+
+    formats = ['{}', '{:.4g}', '{:d}', '{:.6g}', '{:.4g}', '{:.4g}']
+
+    file = open(filename, 'w')
+
+    file.write('\t'.join(TABLE_COLUMNS) + '\n')
+
+    for row in rows:
+        file.write('\t'.join('-' if value is None else form.format(value)
+                             for form, value in zip(formats, row)) + '\n')
+
+    file.close()
+
+def main(args=None):
+
+    '''Analyse all the light frames in a directory from the command line.'''
+
+    parser = argparse.ArgumentParser(description='Measure the sky background of every light frame in a directory.')
+    parser.add_argument('directory', help='directory with the light frames')
+    parser.add_argument('--output', default=None,
+                        help='file to write the table to (default: night_analysis.txt in the directory)')
+    parser.add_argument('--colour', action='store_true', help='frames are from a colour (CFA) sensor')
+    parser.add_argument('--pattern', default=None, choices=apfr.CFA_PATTERNS,
+                        help='CFA pattern of non-raw colour frames')
+    parser.add_argument('--channel', default='G', choices=['R', 'G', 'B'], help='colour channel to measure')
+    parser.add_argument('--gain', type=float, default=None, help='gain [e-/ADU], needed for the sky flux')
+    parser.add_argument('--black-level', type=float, default=None,
+                        help='black level [ADU], needed for the sky flux')
+    parser.add_argument('--workers', type=int, default=None, help='number of worker processes')
+
+    args = parser.parse_args(args)
+
+    filepaths = frameFiles(args.directory)
+
+    if len(filepaths) == 0:
+        print('No supported image files found in "{}".'.format(args.directory))
+        return 1
+
+    executor, futures = analyseFrames(filepaths, args.colour, args.pattern, args.channel, args.workers)
+
+    rows = []
+
+    for i, future in enumerate(futures):
+
+        name = os.path.basename(filepaths[i])
+
+        try:
+            exposure, iso, bg_level, bg_noise = future.result()
+        except Exception as error:
+            print('Could not analyse "{}": {}'.format(name, error))
+            continue
+
+        rows.append((name, exposure, iso, bg_level, bg_noise,
+                     skyFlux(bg_level, args.black_level, args.gain, exposure)))
+
+        print('{:d} of {:d} done'.format(i + 1, len(futures)), end='\r')
+
+    print()
+
+    executor.shutdown()
+
+    output = args.output or os.path.join(args.directory, 'night_analysis.txt')
+    writeTable(output, rows)
+
+    print('Results for {:d} frames written to "{}".'.format(len(rows), output))
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import aplab_histogram_stats as aphs
+
+PATTERN_TILE = 256 # Side length of the square tiles whose power spectra are averaged
+BANDING_PEAKS = 3  # Number of strongest banding frequencies reported for rows and for columns
+MIN_CYCLES = 4     # Variations with fewer cycles than this across the frame count as gradients, not banding
+
+def profiles(img):
+
+    '''Return the mean of every row and of every column of the image, computed in blocks of rows.'''
+
+    h, w = img.shape
+    rows = max(aphs.BLOCK_SIZE//max(w, 1), 1)
+
+    row_means = np.empty(h)
+    column_sums = np.zeros(w)
+
+    for i in range(0, h, rows):
+
+        block = img[i:i+rows].astype(np.float64)
+
+        row_means[i:i+rows] = np.mean(block, axis=1)
+        column_sums += np.sum(block, axis=0)
+
+    return row_means, column_sums/h
+
+def residualVariance(img, row_means, column_means):
+
+    '''
+    Return the variance of the image and the variance left when the row and column means are
+    taken out of it, computed in blocks of rows.
+    '''
+
+    h, w = img.shape
+    rows = max(aphs.BLOCK_SIZE//max(w, 1), 1)
+
+    grand_mean = np.mean(row_means)
+
+    total = 0.0
+    residual = 0.0
+
+    for i in range(0, h, rows):
+
+        block = img[i:i+rows].astype(np.float64) - grand_mean
+
+        total += np.sum(block**2)
+
+        block -= (row_means[i:i+rows] - grand_mean)[:, np.newaxis] + (column_means - grand_mean)[np.newaxis, :]
+
+        residual += np.sum(block**2)
+
+    return total/(h*w), residual/(h*w)
+
+def bandingFrequencies(profile, peaks=BANDING_PEAKS):
+
+    '''
+    Return the frequencies (cycles per pixel) and amplitudes (ADU) of the strongest periodic
+    variations of a row or column profile, strongest first. Only local maxima of the spectrum
+    with at least MIN_CYCLES cycles across the profile are included.
+    '''
+
+    n = len(profile)
+
+    # Amplitude of the sinusoid at every frequency
+    amplitudes = 2*np.abs(np.fft.rfft(profile - np.mean(profile)))/n
+    frequencies = np.fft.rfftfreq(n)
+
+    k = np.arange(MIN_CYCLES, len(amplitudes) - 1)
+    k = k[(amplitudes[k] >= amplitudes[k - 1]) & (amplitudes[k] >= amplitudes[k + 1])]
+    k = k[np.argsort(amplitudes[k])[::-1][:peaks]]
+
+    return [(frequencies[i], amplitudes[i]) for i in k]
+
+def powerSpectrum(img, tile=PATTERN_TILE):
+
+    '''
+    Return the power spectrum of the image averaged over all full square tiles of the given
+    size, in ADU^2 per frequency, scaled so that the two-sided spectrum of a tile sums to its
+    variance. The spectrum has the vertical frequencies along the first axis and the
+    non-negative horizontal frequencies along the second. One row of tiles is transformed at a
+    time, so the memory use does not grow with the size of the image.
+    '''
+
+    h, w = img.shape
+    tile = min(tile, h, w)
+
+    ny = h//tile
+    nx = w//tile
+
+    spectrum = np.zeros((tile, tile//2 + 1))
+
+    for j in range(ny):
+
+        # Stack the tiles of the row along the first axis
+        tiles = img[j*tile:(j+1)*tile, :nx*tile].astype(np.float64).reshape(tile, nx, tile).transpose(1, 0, 2)
+        tiles -= np.mean(tiles, axis=(1, 2), keepdims=True)
+
+        spectrum += np.sum(np.abs(np.fft.rfft2(tiles))**2, axis=0)
+
+    return spectrum/(nx*ny*tile**4)
+
+class PatternNoise:
+
+    def __init__(self, img, tile=PATTERN_TILE):
+
+        '''
+        Analyse the spatial noise of a bias or dark frame. The row and column means give the
+        horizontal and vertical pattern noise (banding) and their strongest frequencies, and
+        what is left when they are taken out is the random noise. The power spectrum averaged
+        over tiles shows any other periodic patterns. All noise values are standard deviations
+        in ADU.
+        '''
+
+        if len(img.shape) != 2:
+            raise ValueError('The frame is not a single-channel image.')
+
+        h, w = img.shape
+
+        self.row_means, self.column_means = profiles(img)
+
+        total, residual = residualVariance(img, self.row_means, self.column_means)
+
+        self.total = np.sqrt(total)
+        self.random = np.sqrt(residual)
+
+        # The random noise adds to the spread of the means, which is corrected for
+        self.row = np.sqrt(max(np.var(self.row_means) - residual/w, 0))
+        self.column = np.sqrt(max(np.var(self.column_means) - residual/h, 0))
+
+        self.row_banding = bandingFrequencies(self.row_means)
+        self.column_banding = bandingFrequencies(self.column_means)
+
+        self.spectrum = powerSpectrum(img, tile)
+
+    def patternFraction(self):
+
+        '''Return the fraction of the total noise variance that comes from row and column patterns.'''
+
+        return (self.row**2 + self.column**2)/self.total**2 if self.total > 0 else 0.0
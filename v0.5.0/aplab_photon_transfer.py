@@ -0,0 +1,336 @@
+# -*- coding: utf-8 -*-
+
+import os
+import concurrent.futures
+import numpy as np
+import aplab_frame_reader as apfr
+import aplab_histogram_stats as aphs
+import aplab_night_analysis as apna
+
+FIT_FRACTION = 0.8 # Only points below this fraction of the full well signal are used to fit the gain
+
+class RunningStatistics:
+
+    def __init__(self, shape=()):
+
+        '''
+        Initialize running mean and variance (Welford's method), either of every element
+        of arrays with the given shape, or of a single quantity when the shape is empty.
+        '''
+
+        self.count = 0
+        self.mean = np.zeros(shape)
+        self.m2 = np.zeros(shape) # Sum of squared deviations from the mean
+
+    def add(self, values):
+
+        '''Add one new sample of every element.'''
+
+        values = np.asarray(values, dtype=np.float64)
+
+        self.count += 1
+
+        delta = values - self.mean
+        self.mean += delta/self.count
+        self.m2 += delta*(values - self.mean)
+
+    def addBatch(self, values):
+
+        '''Add all the given values as samples of the single quantity.'''
+
+        values = np.asarray(values, dtype=np.float64)
+
+        n = values.size
+
+        if n == 0: return None
+
+        mean = np.mean(values)
+        m2 = np.sum((values - mean)**2)
+
+        # Combine with the previous samples (Chan's method)
+        total = self.count + n
+        delta = mean - self.mean
+
+        self.mean = self.mean + delta*n/total
+        self.m2 = self.m2 + m2 + delta**2*self.count*n/total
+        self.count = total
+
+    def variance(self, ddof=0):
+
+        '''Return the variance of the added samples.'''
+
+        if self.count <= ddof: return np.nan*self.m2
+
+        return self.m2/(self.count - ddof)
+
+def centralCrop(img):
+
+    '''Return the central half of the image in each direction, starting at a CFA block.'''
+
+    h, w = img.shape
+
+    return img[int(0.25*h)//2*2:int(0.75*h), int(0.25*w)//2*2:int(0.75*w)]
+
+def channelPlanes(img, pattern=None):
+
+    '''Return the pixels of each colour channel, or of all pixels under "All" if there is no pattern.'''
+
+    return apfr.cfaPlanes(img, pattern) if pattern is not None else {'All': img}
+
+def readFrame(filepath, hasCFA=False, pattern=None):
+
+    '''Decode a frame, and return it with its ISO and CFA pattern.'''
+
+    img, metadata, isExif, found_pattern = apfr.readFrame(filepath, getPattern=(hasCFA and pattern is None))
+
+    if len(img.shape) != 2:
+        raise ValueError('Frame "{}" is not a single-channel image.'.format(filepath))
+
+    return img, apna.frameISO(metadata), (pattern or found_pattern) if hasCFA else None
+
+def biasStatistics(filepaths, hasCFA=False, pattern=None, progress=None):
+
+    '''
+    Return the black level and read noise (in ADU) of each colour channel, from the running mean
+    and temporal variance of every pixel in the central crop of the given bias frames. Only one
+    frame is held in memory at a time. Also returns the ISOs and the CFA pattern of the frames.
+    '''
+
+    stats = None
+    isovals = []
+
+    for i, filepath in enumerate(filepaths):
+
+        img, iso, pattern = readFrame(filepath, hasCFA, pattern)
+        isovals.append(iso)
+
+        planes = channelPlanes(centralCrop(img), pattern)
+
+        if stats is None:
+            stats = {ch: RunningStatistics(planes[ch].shape) for ch in planes}
+
+        for ch in planes:
+            stats[ch].add(planes[ch])
+
+        if progress is not None: progress(i + 1)
+
+    # The read noise is the typical temporal noise of a pixel, so fixed patterns are excluded
+    return {ch: (np.mean(stats[ch].mean), np.sqrt(np.mean(stats[ch].variance(ddof=1)))) for ch in stats}, \
+           isovals, pattern
+
+def flatPairStatistics(img1, img2, pattern=None):
+
+    '''
+    Return the mean level and the noise variance of a single frame (half the variance of the
+    difference, which removes fixed patterns) of each colour channel in the central crop of two
+    flat frames with the same exposure. The pixels are processed in blocks of rows.
+    '''
+
+    planes1 = channelPlanes(centralCrop(img1), pattern)
+    planes2 = channelPlanes(centralCrop(img2), pattern)
+
+    stats = {}
+
+    for ch in planes1:
+
+        level = RunningStatistics()
+        difference = RunningStatistics()
+
+        rows = max(aphs.BLOCK_SIZE//max(planes1[ch].shape[1], 1), 1)
+
+        for i in range(0, planes1[ch].shape[0], rows):
+
+            block1 = planes1[ch][i:i+rows].astype(np.float64)
+            block2 = planes2[ch][i:i+rows].astype(np.float64)
+
+            level.addBatch(0.5*(block1 + block2))
+            difference.addBatch(block1 - block2)
+
+        stats[ch] = (level.mean, 0.5*difference.variance())
+
+    return stats
+
+def pairFlats(filepaths, exposures):
+
+    '''
+    Return pairs of flat frames with the same exposure time, taken in the given order. Frames with
+    an unknown exposure time are paired with each other, and unpaired frames are left out.
+    '''
+
+    groups = {}
+
+    for filepath, exposure in zip(filepaths, exposures):
+        groups.setdefault(None if exposure is None else float('{:.4g}'.format(exposure)), []).append(filepath)
+
+    pairs = []
+
+    for group in groups.values():
+        pairs += [(group[i], group[i+1]) for i in range(0, len(group) - 1, 2)]
+
+    return pairs
+
+def fitPhotonTransfer(signals, variances, read_noise):
+
+    '''
+    Fit the photon transfer curve of one colour channel, where signals are the flat levels above
+    the black level and variances the noise variances of the flats (both in ADU). Below full
+    well the shot noise variance grows linearly with the signal, with the inverse gain as the
+    slope. Returns the gain (e-/ADU) and the signal where the variance peaks, which marks full
+    well, or None if the curve does not turn over.
+    '''
+
+    order = np.argsort(signals)
+    signals = np.asarray(signals, dtype=np.float64)[order]
+    variances = np.asarray(variances, dtype=np.float64)[order]
+
+    # The variance drops when pixels start saturating
+    knee = int(np.argmax(variances))
+    turnover = knee < len(signals) - 1
+
+    if turnover:
+        linear = signals <= FIT_FRACTION*signals[knee]
+        linear[0] = True
+    else:
+        linear = np.ones(len(signals), dtype=bool)
+
+    shot_variances = variances[linear] - read_noise**2
+
+    # Least squares fit of the line through the origin
+    gain = np.sum(signals[linear]**2)/np.sum(signals[linear]*shot_variances)
+
+    return gain, (signals[knee] if turnover else None)
+
+def characterizeSensor(bias_files, flat_files, saturated_files=(), hasCFA=False, pattern=None, progress=None):
+
+    '''
+    Compute sensor parameters from a photon transfer curve. The bias frames give the black
+    level and read noise, and every pair of flat frames with the same exposure gives a point
+    on the curve. The white level is the highest value in the saturated frames, or in the flat
+    frames if none are given. Frames are decoded one at a time, so any number can be used.
+    Calls progress with the number of processed frames if given.
+
+    Returns the gain (e-/ADU), read noise (e-), black level (ADU) and saturation capacity (e-)
+    of each colour channel, the curve (signals and variances in ADU) of each channel, the
+    white level, and the ISO of the frames if they all have the same one.
+    '''
+
+    if len(bias_files) < 2:
+        raise ValueError('At least two bias frames are required.')
+
+    bias, isovals, pattern = biasStatistics(bias_files, hasCFA, pattern, progress)
+
+    # Pair the flat frames by exposure time, read from the metadata alone
+    exposures = []
+
+    for filepath in flat_files:
+        metadata, isExif = apfr.readMetadata(filepath)
+        exposures.append(apna.frameExposure(isExif, metadata))
+
+    pairs = pairFlats(flat_files, exposures)
+
+    if len(pairs) == 0:
+        raise ValueError('At least two flat frames are required.')
+
+    curves = {ch: ([], []) for ch in bias}
+    white_level = -np.inf
+
+    for i, (file1, file2) in enumerate(pairs):
+
+        img1, iso1, pattern = readFrame(file1, hasCFA, pattern)
+        img2, iso2, pattern = readFrame(file2, hasCFA, pattern)
+        isovals += [iso1, iso2]
+
+        if len(saturated_files) == 0:
+            white_level = max(white_level, np.max(img1), np.max(img2))
+
+        stats = flatPairStatistics(img1, img2, pattern)
+
+        if set(stats) != set(curves):
+            raise ValueError('The flat frames "{}" and "{}" do not have the same colour channels as the bias frames.' \
+                             .format(file1, file2))
+
+        for ch, (level, variance) in stats.items():
+            curves[ch][0].append(level - bias[ch][0])
+            curves[ch][1].append(variance)
+
+        if progress is not None: progress(len(bias_files) + 2*(i + 1))
+
+    for i, filepath in enumerate(saturated_files):
+
+        img, iso, pattern = readFrame(filepath, hasCFA, pattern)
+        isovals.append(iso)
+
+        white_level = max(white_level, np.max(img))
+
+        if progress is not None: progress(len(bias_files) + 2*len(pairs) + i + 1)
+
+    sensor = {}
+
+    for ch in bias:
+
+        black_level, read_noise_ADU = bias[ch]
+
+        gain, full_well_ADU = fitPhotonTransfer(curves[ch][0], curves[ch][1], read_noise_ADU)
+
+        # Without a turnover, the saturation capacity is found from the white level as in the Image Analyser
+        sat_cap = gain*(full_well_ADU if full_well_ADU is not None else white_level)
+
+        sensor[ch] = (gain, gain*read_noise_ADU, black_level, sat_cap)
+
+    iso = isovals[0] if len(set(isovals)) == 1 else None
+
+    return sensor, {ch: (np.array(curves[ch][0]), np.array(curves[ch][1])) for ch in curves}, \
+           float(white_level), iso
+
+def frameType(filename):
+
+    '''
+    Return the image type ("Bias", "Flat" or "Saturated") indicated by the file name,
+    in the same way as when adding multiple frames, or None if there is none.
+    '''
+
+    for type in ['Bias', 'Flat', 'Saturated']:
+        if type.lower()[:3] in filename.lower():
+            return type
+
+    return None
+
+def isoGroups(directory):
+
+    '''
+    Sort the bias, flat and saturated frames in a directory by the ISO in their metadata.
+    Returns a dictionary with the bias, flat and saturated file lists of each ISO, and
+    the names of the files with no recognized image type or ISO.
+    '''
+
+    groups = {}
+    skipped = []
+
+    for filepath in apna.frameFiles(directory):
+
+        type = frameType(os.path.basename(filepath))
+        iso = apna.frameISO(apfr.readMetadata(filepath)[0]) if type is not None else None
+
+        if iso is None:
+            skipped.append(os.path.basename(filepath))
+            continue
+
+        groups.setdefault(iso, {'Bias': [], 'Flat': [], 'Saturated': []})[type].append(filepath)
+
+    return {iso: (groups[iso]['Bias'], groups[iso]['Flat'], groups[iso]['Saturated']) for iso in groups}, skipped
+
+def sweepISOs(groups, hasCFA=False, pattern=None, max_workers=None):
+
+    '''
+    Start characterizing the sensor at every ISO concurrently in separate processes, from the
+    bias, flat and saturated files of each ISO. Returns the executor and a dictionary with
+    the future of each ISO, giving the result of "characterizeSensor".
+    '''
+
+    executor = concurrent.futures.ProcessPoolExecutor(max_workers=min(max(len(groups), 1),
+                                                                      max_workers or os.cpu_count() or 1))
+
+    futures = {iso: executor.submit(characterizeSensor, *groups[iso], hasCFA=hasCFA, pattern=pattern)
+               for iso in groups}
+
+    return executor, futures
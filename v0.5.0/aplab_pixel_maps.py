@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import astropy.io.fits as pyfits
+import aplab_frame_reader as apfr
+import aplab_night_analysis as apna
+import aplab_robust_stats as aprs
+from aplab_photon_transfer import RunningStatistics
+
+HOT_SIGMA = 25.0  # Pixels with a dark signal this many robust standard deviations above the median are hot
+WARM_SIGMA = 5.0  # Pixels with a dark signal or read noise this many above the median are warm
+GLOW_BLOCK = 64   # Size of the blocks whose medians make up the amp glow map
+LOCAL_BLOCK = 16  # Size of the blocks whose medians give the local dark level that pixels are compared to
+
+def pixelStatistics(filepaths, progress=None, offset=0):
+
+    '''
+    Return the running mean and variance of every pixel over the given frames, and their
+    mean exposure time (None if unknown). Only one frame is held in memory at a time,
+    along with two numbers per pixel. Calls progress with the number of processed frames.
+    '''
+
+    stats = None
+    exposures = []
+
+    for i, filepath in enumerate(filepaths):
+
+        img, metadata, isExif, pattern = apfr.readFrame(filepath)
+
+        if len(img.shape) != 2:
+            raise ValueError('Frame "{}" is not a single-channel image.'.format(filepath))
+
+        if stats is None:
+            stats = RunningStatistics(img.shape)
+        elif img.shape != stats.mean.shape:
+            raise ValueError('The frames do not all have the same size.')
+
+        stats.add(img)
+        exposures.append(apna.frameExposure(isExif, metadata))
+
+        if progress is not None: progress(offset + i + 1)
+
+    exposure = np.mean(exposures) if None not in exposures else None
+
+    return stats, exposure
+
+def robustLevel(values):
+
+    '''Return the median and the standard deviation estimated from the median absolute deviation.'''
+
+    values = values[np.isfinite(values)]
+    median = np.median(values)
+
+    return median, aprs.madStd(values, median)
+
+def blockMedians(img, mask=None, block=GLOW_BLOCK):
+
+    '''
+    Return the median of each block of the image, leaving out masked pixels. Blocks at the lower
+    and right edges may be partial.
+    '''
+
+    h, w = img.shape
+    ny = -(-h//block)
+    nx = -(-w//block)
+
+    padded = np.full((ny*block, nx*block), np.nan, dtype=np.float32)
+    padded[:h, :w] = img
+
+    if mask is not None:
+        padded[:h, :w][mask] = np.nan
+
+    return np.nanmedian(padded.reshape(ny, block, nx, block), axis=(1, 3))
+
+def expandBlocks(blocks, shape, block=GLOW_BLOCK):
+
+    '''Return an image of the given shape where every pixel has the value of its block.'''
+
+    return np.kron(blocks, np.ones((block, block), dtype=np.float32))[:shape[0], :shape[1]]
+
+class PixelMaps:
+
+    def __init__(self, bias_files, dark_files, progress=None):
+
+        '''
+        Build per-pixel maps of the read noise (standard deviation of the bias frames) and of
+        the dark signal (mean dark frame minus mean bias frame), both in ADU, using running
+        statistics so that any number of frames can be used. Hot and warm pixel masks and an
+        amp glow map are derived from them. Calls progress with the number of processed frames.
+        '''
+
+        if len(bias_files) < 2:
+            raise ValueError('At least two bias frames are required.')
+
+        bias, bias_exposure = pixelStatistics(bias_files, progress)
+
+        self.bias = bias.mean.astype(np.float32)
+        self.read_noise = np.sqrt(bias.variance(ddof=1)).astype(np.float32)
+
+        del bias
+
+        if len(dark_files) > 0:
+
+            dark, self.exposure = pixelStatistics(dark_files, progress, offset=len(bias_files))
+
+            if dark.mean.shape != self.bias.shape:
+                raise ValueError('The dark frames do not have the same size as the bias frames.')
+
+            self.dark = (dark.mean - self.bias).astype(np.float32)
+
+            del dark
+
+        else:
+
+            self.dark = None
+            self.exposure = None
+
+        self.findBadPixels()
+        self.findAmpGlow()
+
+    def findBadPixels(self):
+
+        '''
+        Mark pixels whose dark signal lies far above the typical value as hot or warm, and pixels
+        with unusually high read noise as warm.
+        '''
+
+        rn_median, rn_sigma = robustLevel(self.read_noise)
+
+        self.warm = self.read_noise > rn_median + WARM_SIGMA*max(rn_sigma, 0.5)
+        self.hot = np.zeros(self.read_noise.shape, dtype=bool)
+
+        if self.dark is not None:
+
+            # Compare with the local level, so that amp glow is not taken for warm pixels
+            excess = self.dark - expandBlocks(blockMedians(self.dark, block=LOCAL_BLOCK), self.dark.shape,
+                                              block=LOCAL_BLOCK)
+
+            # The spread of the dark signal of normal pixels is dominated by their noise
+            dark_sigma = max(robustLevel(excess)[1], 0.5)
+
+            self.hot = excess > HOT_SIGMA*dark_sigma
+            self.warm |= excess > WARM_SIGMA*dark_sigma
+
+        self.warm &= ~self.hot
+
+    def findAmpGlow(self):
+
+        '''
+        Map the large-scale excess of the dark signal above its median, from the medians of blocks
+        of pixels without hot or warm pixels. The map has one value per block.
+        '''
+
+        if self.dark is None:
+            self.amp_glow = None
+            return None
+
+        self.amp_glow = blockMedians(self.dark, self.hot | self.warm)
+        self.amp_glow -= np.nanmedian(self.amp_glow)
+
+    def mask(self):
+
+        '''Return the mask of all hot and warm pixels.'''
+
+        return self.hot | self.warm
+
+    def ampGlowImage(self):
+
+        '''Return the amp glow map expanded to the size of the frames.'''
+
+        return expandBlocks(self.amp_glow, self.dark.shape)
+
+    def save(self, filepath):
+
+        '''Save all the maps as image extensions of a FITS file.'''
+
+        hdus = [pyfits.PrimaryHDU(),
+                pyfits.ImageHDU(self.bias, name='BIAS'),
+                pyfits.ImageHDU(self.read_noise, name='READNOISE'),
+                pyfits.ImageHDU(self.hot.astype(np.uint8), name='HOTMASK'),
+                pyfits.ImageHDU(self.warm.astype(np.uint8), name='WARMMASK')]
+
+        if self.dark is not None:
+            hdus.append(pyfits.ImageHDU(self.dark, name='DARK'))
+            hdus.append(pyfits.ImageHDU(self.ampGlowImage(), name='AMPGLOW'))
+
+            if self.exposure is not None:
+                hdus[0].header['EXPTIME'] = (self.exposure, 'Exposure time of the dark frames [s]')
+
+        pyfits.HDUList(hdus).writeto(filepath, overwrite=True)
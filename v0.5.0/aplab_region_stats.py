@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+class RegionStatistics:
+
+    def __init__(self, img, tile_size=64):
+
+        '''
+        Initialize index of the given image for fast statistics of rectangular regions. Sums and
+        sums of squares come from integral images, and extreme values from per-tile extremes.
+        '''
+
+        self.img = img
+        self.height, self.width = img.shape
+        self.tile_size = tile_size
+
+        # Integer data gives exact sums, which keeps the standard deviation accurate
+        self.isInteger = np.issubdtype(img.dtype, np.integer)
+        dtype = np.int64 if self.isInteger else np.float64
+
+        # Integral images, padded with a leading row and column of zeros
+        self.sum = np.zeros((self.height + 1, self.width + 1), dtype=dtype)
+        self.sum_sq = np.zeros((self.height + 1, self.width + 1), dtype=dtype)
+
+        np.cumsum(np.cumsum(img, axis=0, dtype=dtype), axis=1, out=self.sum[1:, 1:])
+        np.cumsum(np.cumsum(np.square(img, dtype=dtype), axis=0), axis=1, out=self.sum_sq[1:, 1:])
+
+        # Extreme values of each tile, with partial tiles at the lower and right edges
+        ny = -(-self.height//tile_size)
+        nx = -(-self.width//tile_size)
+        padded = np.pad(img, ((0, ny*tile_size - self.height), (0, nx*tile_size - self.width)), mode='edge')
+        tiles = padded.reshape(ny, tile_size, nx, tile_size)
+
+        self.tile_min = tiles.min(axis=(1, 3))
+        self.tile_max = tiles.max(axis=(1, 3))
+
+    def clip(self, x1, x2, y1, y2):
+
+        '''Return the region limited to the image, with the smallest coordinates first.'''
+
+        x1, x2 = sorted([int(x1), int(x2)])
+        y1, y2 = sorted([int(y1), int(y2)])
+
+        return (min(max(x1, 0), self.width), min(max(x2, 0), self.width),
+                min(max(y1, 0), self.height), min(max(y2, 0), self.height))
+
+    def regionSum(self, table, x1, x2, y1, y2):
+
+        '''Return the sum over the region of the data tabulated in the given integral image.'''
+
+        return table[y2, x2] - table[y1, x2] - table[y2, x1] + table[y1, x1]
+
+    def getStatistics(self, x1, x2, y1, y2):
+
+        '''
+        Return the number of pixels and the mean, standard deviation, minimum and maximum
+        value in the given region, or None if the region contains no pixels.
+        '''
+
+        x1, x2, y1, y2 = self.clip(x1, x2, y1, y2)
+
+        n = (x2 - x1)*(y2 - y1)
+
+        if n == 0: return None
+
+        s = self.regionSum(self.sum, x1, x2, y1, y2)
+        s_sq = self.regionSum(self.sum_sq, x1, x2, y1, y2)
+
+        if self.isInteger:
+            # Use Python integers to avoid overflow and cancellation
+            s = int(s)
+            var = (n*int(s_sq) - s*s)/float(n*n)
+        else:
+            var = max(s_sq/n - (s/n)**2, 0.0)
+
+        min_val, max_val = self.getExtremes(x1, x2, y1, y2)
+
+        return n, s/float(n), np.sqrt(var), min_val, max_val
+
+    def getExtremes(self, x1, x2, y1, y2):
+
+        '''
+        Return the minimum and maximum value in the given (clipped) region. Tiles fully
+        inside the region are looked up, so only the edges of the region are scanned.
+        '''
+
+        t = self.tile_size
+
+        # Range of tiles fully inside the region
+        tx1 = -(-x1//t)
+        ty1 = -(-y1//t)
+        tx2 = (self.tile_min.shape[1] if x2 == self.width else x2//t)
+        ty2 = (self.tile_min.shape[0] if y2 == self.height else y2//t)
+
+        if tx2 <= tx1 or ty2 <= ty1:
+            crop = self.img[y1:y2, x1:x2]
+            return np.min(crop), np.max(crop)
+
+        # Inner edges of the tiled part, limited to the region
+        ix1 = tx1*t
+        iy1 = ty1*t
+        ix2 = min(tx2*t, x2)
+        iy2 = min(ty2*t, y2)
+
+        parts = [(self.tile_min[ty1:ty2, tx1:tx2], self.tile_max[ty1:ty2, tx1:tx2]),
+                 self.img[y1:iy1, x1:x2], self.img[iy2:y2, x1:x2],
+                 self.img[iy1:iy2, x1:ix1], self.img[iy1:iy2, ix2:x2]]
+
+        mins = [np.min(parts[0][0])]
+        maxs = [np.max(parts[0][1])]
+
+        for part in parts[1:]:
+            if part.size > 0:
+                mins.append(np.min(part))
+                maxs.append(np.max(part))
+
+        return min(mins), max(maxs)
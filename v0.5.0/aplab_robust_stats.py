@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import aplab_histogram_stats as aphs
+
+MAD_TO_STD = 1.4826 # Ratio of standard deviation to median absolute deviation for normal noise
+
+CLIP_SIGMA = 3.0      # Values further from the centre than this many standard deviations are clipped
+CLIP_ITERATIONS = 10  # Largest number of clipping iterations
+
+def blocks(values):
+
+    '''Yield the values in blocks of about BLOCK_SIZE elements, as rows of an image or parts of a 1D array.'''
+
+    if values.ndim == 1:
+        step = aphs.BLOCK_SIZE
+    else:
+        values = values.reshape(values.shape[0], -1)
+        step = max(aphs.BLOCK_SIZE//max(values.shape[1], 1), 1)
+
+    for i in range(0, values.shape[0], step):
+        yield values[i:i+step]
+
+def madStd(values, median=None, axis=None):
+
+    '''
+    Return the standard deviation estimated from the median absolute deviation of the values,
+    leaving out NaN values. Along the given axis an array of estimates is returned, with the
+    median, if given, having that axis removed. The median of the values is computed unless given.
+    '''
+
+    values = np.asarray(values)
+
+    if median is None:
+        median = np.nanmedian(values, axis=axis, keepdims=True)
+    elif axis is not None:
+        median = np.expand_dims(median, axis)
+
+    mad = np.nanmedian(np.abs(values - median), axis=axis)
+
+    return MAD_TO_STD*(float(mad) if axis is None else mad)
+
+def clippedMoments(values, lower, upper, shift=0.0):
+
+    '''
+    Return the number, mean and standard deviation of the values between the lower and upper limit,
+    computed in blocks. The shift, which should be close to the mean, keeps the sums accurate.
+    '''
+
+    n = 0
+    s = 0.0
+    s_sq = 0.0
+
+    for block in blocks(values):
+
+        kept = block[(block >= lower) & (block <= upper)].astype(np.float64) - shift
+
+        n += kept.size
+        s += np.sum(kept)
+        s_sq += np.dot(kept, kept)
+
+    if n == 0: return 0, np.nan, np.nan
+
+    return n, shift + s/n, np.sqrt(max(s_sq/n - (s/n)**2, 0.0))
+
+def sigmaClip(values, kappa=CLIP_SIGMA, iterations=CLIP_ITERATIONS):
+
+    '''
+    Return the number, mean and standard deviation of the values left after iterative sigma
+    clipping. The first limits lie kappa robust (MAD-based) standard deviations from the median,
+    and the following ones kappa standard deviations from the mean of the remaining values,
+    until no more values are clipped. Integer images are clipped through their histogram,
+    other values in blocks, so the memory use does not grow with the number of values.
+    '''
+
+    values = np.asarray(values)
+
+    if values.size == 0: return 0, np.nan, np.nan
+
+    if aphs.hasHistogram(values):
+        return histogramSigmaClip(*aphs.histogram(values if values.ndim > 1 else values[np.newaxis, :]),
+                                  kappa=kappa, iterations=iterations)
+
+    centre = float(np.median(values))
+    spread = madStd(values, centre)
+
+    # Fall back to the standard deviation if most values are equal
+    if spread == 0: spread = float(np.std(values))
+
+    n_prev = -1
+
+    for i in range(iterations):
+
+        n, mean, std = clippedMoments(values, centre - kappa*spread, centre + kappa*spread, shift=centre)
+
+        if n == n_prev or n == 0: break
+
+        n_prev = n
+        centre, spread = mean, std
+
+    return n, mean, std
+
+def histogramSigmaClip(hist, offset=0, kappa=CLIP_SIGMA, iterations=CLIP_ITERATIONS):
+
+    '''
+    Return the number, mean and standard deviation of the pixel values counted in the histogram
+    that are left after iterative sigma clipping, in the same way as "sigmaClip". Each iteration
+    only goes through the histogram bins.
+    '''
+
+    centre = aphs.histogramMedian(hist, offset)
+    spread = MAD_TO_STD*aphs.histogramMAD(hist, offset)
+
+    if spread == 0: spread = aphs.histogramMoments(hist, offset)[2]
+
+    n_prev = -1
+
+    for i in range(iterations):
+
+        # Histogram bins of the values within the limits
+        lo = min(max(int(np.ceil(centre - kappa*spread)) - offset, 0), len(hist))
+        hi = min(max(int(np.floor(centre + kappa*spread)) - offset + 1, lo), len(hist))
+
+        n, mean, std = aphs.histogramMoments(hist[lo:hi], offset + lo)[:3]
+
+        if n == n_prev or n == 0: break
+
+        n_prev = n
+        centre, spread = mean, std
+
+    return n, mean, std
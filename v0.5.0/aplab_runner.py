@@ -8,6 +8,7 @@ Written by Lars Frogner
 
 import tkinter as tk
 import os
+import multiprocessing
 import numpy as np
 import aplab_common as apc
 from aplab_common import C, ErrorWindow, Catcher
@@ -203,12 +204,17 @@ if startup_success:
         startup_success = False
         startup_error = 'Invalid last line in "telescope.txt". Must be\n"Telescope: <telescope name>".'
     
-# Run application, or show error message if an error occurred
+# Run application, or show error message if an error occurred.
+# Worker processes used for decoding import this module without running it.
     
-if startup_success:
-    app = ToolManager(None if no_cdefault else C.CNAME.index(CDEFAULT),
-                      None if no_tdefault else C.TNAME.index(TDEFAULT), FS)
-    app.mainloop()
-else:
-    error = ErrorWindow(startup_error)
-    error.mainloop()
\ No newline at end of file
+if __name__ == '__main__':
+
+    multiprocessing.freeze_support()
+
+    if startup_success:
+        app = ToolManager(None if no_cdefault else C.CNAME.index(CDEFAULT),
+                          None if no_tdefault else C.TNAME.index(TDEFAULT), FS)
+        app.mainloop()
+    else:
+        error = ErrorWindow(startup_error)
+        error.mainloop()
\ No newline at end of file
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import aplab_robust_stats as aprs
+
+SAMPLE_SIZE = 1 << 18 # Number of pixels drawn for approximate statistics
+STRATA = 16           # The image is divided into this many strips in each direction, with equal samples from each
+Z_95 = 1.96           # Number of standard errors spanned by a 95 % confidence interval
+
+def samplePositions(shape, size=SAMPLE_SIZE, seed=None):
+
+    '''
+    Return the row and column indices of about the given number of pixels drawn at random from
+    an image of the given shape. The image is divided into a grid of cells, and the same number
+    of pixels is drawn from each, so that every part of the image is represented.
+    '''
+
+    h, w = shape
+    ny = min(STRATA, h)
+    nx = min(STRATA, w)
+
+    rng = np.random.default_rng(seed)
+
+    per_cell = max(size//(ny*nx), 1)
+
+    # Edges of the grid cells
+    y_edges = np.linspace(0, h, ny + 1).astype(int)
+    x_edges = np.linspace(0, w, nx + 1).astype(int)
+
+    cell_y = np.repeat(np.arange(ny), nx*per_cell)
+    cell_x = np.tile(np.repeat(np.arange(nx), per_cell), ny)
+
+    y0 = y_edges[cell_y]
+    x0 = x_edges[cell_x]
+
+    ys = y0 + (rng.random(cell_y.size)*(y_edges[cell_y + 1] - y0)).astype(int)
+    xs = x0 + (rng.random(cell_x.size)*(x_edges[cell_x + 1] - x0)).astype(int)
+
+    return ys, xs
+
+def approximateStatistics(values, clip=False):
+
+    '''
+    Return the number, mean, median and standard deviation of the sampled pixel values, each
+    with the half-width of its 95 % confidence interval. The intervals assume simple random
+    sampling, which makes them slightly conservative for stratified samples. With clipping,
+    the number, mean and standard deviation are those of the values left after sigma clipping.
+    '''
+
+    values = np.sort(np.asarray(values).ravel())
+
+    n = values.size
+
+    if n == 0: return 0, (np.nan, np.nan), (np.nan, np.nan), (np.nan, np.nan)
+
+    if clip:
+        n_kept, mean, std = aprs.sigmaClip(values)
+    else:
+        n_kept, mean, std = n, np.mean(values, dtype=np.float64), np.std(values, dtype=np.float64)
+
+    median = float(np.median(values))
+
+    # The ranks of the confidence limits of the median follow from the binomial distribution
+    lo = max(int(np.floor(0.5*n - 0.5*Z_95*np.sqrt(n))), 0)
+    hi = min(int(np.ceil(0.5*n + 0.5*Z_95*np.sqrt(n))), n - 1)
+
+    return n_kept, (float(mean), Z_95*std/np.sqrt(max(n_kept, 1))), \
+           (median, 0.5*(float(values[hi]) - float(values[lo]))), \
+           (float(std), Z_95*std/np.sqrt(max(2*(n_kept - 1), 1)))
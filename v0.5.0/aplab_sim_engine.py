@@ -0,0 +1,274 @@
+# -*- coding: utf-8 -*-
+
+import os
+import math
+import concurrent.futures
+import numpy as np
+
+TILE_ROWS = 64            # Rows of the tiles that are simulated separately, each with its own random number stream
+FRACTION_TOLERANCE = 1e-9 # Fractions of an ADU this close to one are taken as whole numbers
+SUB_CLIP_SIGMA = 6.0      # Pixels whose subframe values come this many standard deviations from 0 or the white level are stacked exactly
+
+class StackSimulation:
+
+    def __init__(self, shape, gain, read_noise, black_level, white_level, components,
+                 bias_offset=True, bias_noise=True):
+
+        '''
+        Initialize the simulation of a stack of subframes of the given shape. Each subframe is the
+        bias (black level offset and Gaussian read noise, in ADU) plus the electrons of each
+        component converted to whole ADU with the gain, truncated to the range from zero to the
+        white level. The components are given as tuples with the mean number of electrons per
+        subframe (a number or an array of the given shape), and whether the signal and the Poisson
+        noise of the component are included. Noise without signal has the mean subtracted.
+        '''
+
+        self.shape = tuple(shape)
+        self.gain = float(gain)
+        self.read_noise = float(read_noise)
+        self.black_level = float(black_level)
+        self.white_level = int(white_level)
+        self.bias_offset = bias_offset
+        self.bias_noise = bias_noise
+
+        # Leave out components that contribute nothing
+        self.components = [(mean_e, signal, noise) for mean_e, signal, noise in components if signal or noise]
+
+    def pixels(self, values, index):
+
+        '''Return the given number or array of per-pixel values for the pixels selected by the index.'''
+
+        return np.broadcast_to(values, self.shape)[index]
+
+    def subframe(self, index=(), rng=np.random):
+
+        '''
+        Return one simulated subframe, as integer ADU, for the pixels selected by the index (all
+        pixels by default). The random numbers are drawn from the given generator.
+        '''
+
+        size = np.broadcast_to(0, self.shape)[index].shape
+
+        if self.bias_noise:
+            img = rng.normal(self.black_level if self.bias_offset else 0.0, self.read_noise, size).astype('int32')
+        elif self.bias_offset:
+            img = np.full(size, int(self.black_level), dtype='int32')
+        else:
+            img = np.zeros(size, dtype='int32')
+
+        electrons = np.zeros(size)
+
+        for mean_e, signal, noise in self.components:
+
+            mean_e = self.pixels(mean_e, index)
+
+            if noise:
+                electrons += rng.poisson(mean_e, size)
+                if not signal: electrons -= mean_e
+            else:
+                electrons += mean_e
+
+        img += (electrons/self.gain).astype('int32')
+
+        # Truncate invalid pixel values
+        np.clip(img, 0, self.white_level, out=img)
+
+        return img
+
+    def exactStack(self, subs, rows=slice(None), rng=np.random):
+
+        '''
+        Return the mean of the given number of subframes, simulated one at a time, relative to
+        the white level, for the given rows.
+        '''
+
+        stack_img = self.subframe((rows,), rng).astype('float32')
+
+        for i in range(1, subs):
+            stack_img += self.subframe((rows,), rng)
+
+        stack_img /= float(subs*self.white_level)
+
+        return stack_img
+
+    def subframeMoments(self, rows=slice(None)):
+
+        '''
+        Return the expected value and the variance of every pixel in the given rows of a subframe
+        before it is truncated to the valid range, including the average effect of converting the
+        bias and the electrons to whole ADU, and which pixels have electrons that can be negative.
+        Conversion of values that are always positive rounds down. For the bias it loses half an
+        ADU on average, with a variance of 1/12 ADU^2, and read noise centred on zero is rounded
+        towards zero. With noise, the electrons are whole numbers plus a constant (the signal of
+        the components without noise, less the mean of those without signal), and their
+        conversion is averaged over the fractions of an ADU that such numbers can have. The
+        conversion of electrons that can be negative is rounded towards zero, which the moments
+        do not describe, so those pixels have to be simulated exactly.
+        '''
+
+        shape = np.broadcast_to(0, self.shape)[rows].shape
+
+        mean = np.zeros(shape)
+        variance = np.zeros(shape)
+
+        # Conversion of the bias
+        if self.bias_offset and self.bias_noise:
+            mean += self.black_level - 0.5
+            variance += self.read_noise**2 + 1/12
+        elif self.bias_offset:
+            mean += int(self.black_level)
+        elif self.bias_noise and self.read_noise > 0:
+
+            # Probabilities of the Gaussian read noise reaching each whole ADU
+            k = np.arange(1, int(10*self.read_noise) + 12)
+            cdf = 0.5*(1 + np.array([math.erf(x) for x in k/(np.sqrt(2)*self.read_noise)]))
+
+            variance += 2*np.sum(k[:-1]**2*(cdf[1:] - cdf[:-1]))
+
+        # Conversion of the electrons
+        signal = any(signal for mean_e, signal, noise in self.components)
+        noise = any(noise for mean_e, signal, noise in self.components)
+
+        signal_adu = sum(self.pixels(mean_e, rows) for mean_e, has_signal, has_noise in self.components
+                         if has_signal)/self.gain
+        noise_adu = sum(self.pixels(mean_e, rows) for mean_e, has_signal, has_noise in self.components
+                        if has_noise)/self.gain**2
+        noise_only_adu = sum(self.pixels(mean_e, rows) for mean_e, has_signal, has_noise in self.components
+                             if has_noise and not has_signal)/self.gain**2
+
+        variance += noise_adu
+
+        # Poisson electrons with their signal are never negative, only the noise of the components
+        # without signal can take the electrons below zero
+        negative = (noise_only_adu > 0) & (signal_adu - SUB_CLIP_SIGMA*np.sqrt(noise_only_adu) < 0)
+
+        if noise:
+
+            # Fractions of an ADU of the whole numbers of electrons, and their shift by the constant,
+            # with fractions within rounding errors of one taken as zero
+            lattice = np.sort((np.arange(10000)/self.gain + FRACTION_TOLERANCE) % 1 - FRACTION_TOLERANCE)
+            shift = sum((self.pixels(mean_e, rows) if has_signal else -self.pixels(mean_e, rows))
+                        for mean_e, has_signal, has_noise in self.components
+                        if has_signal != has_noise)/self.gain % 1
+
+            # Shifted fractions of one or more wrap around to zero
+            first = np.searchsorted(lattice, 1 - shift - FRACTION_TOLERANCE)
+            wrapped = len(lattice) - first
+            wrapped_sum = np.sum(lattice) - np.concatenate([[0.0], np.cumsum(lattice)])[first]
+
+            fraction_mean = np.mean(lattice) + shift - wrapped/len(lattice)
+            fraction_sq = np.mean(lattice**2) + 2*shift*np.mean(lattice) + shift**2 \
+                          - (2*wrapped_sum + (2*shift - 1)*wrapped)/len(lattice)
+
+            # Pixels without noise always have the same number of electrons
+            constant = noise_adu == 0
+
+            mean += np.where(constant, np.trunc(signal_adu), signal_adu - fraction_mean)
+            variance += np.where(constant, 0.0, fraction_sq - fraction_mean**2)
+        elif signal:
+            mean += np.trunc(signal_adu)
+
+        return mean, variance, np.broadcast_to(negative, shape)
+
+    def fastStack(self, subs, rows=slice(None), rng=np.random):
+
+        '''
+        Return a statistically equivalent version of "exactStack" drawn in a fixed number of
+        passes over the image, whatever the number of subframes. The sum of the Poisson electrons
+        of all subframes is itself Poisson distributed, and the sum of the Gaussian read noise
+        Gaussian with a standard deviation scaled by the square root of the number of subframes.
+        The conversion to whole ADU is included through its mean and variance. Pixels that may
+        be truncated at zero or the white level in some subframes, or whose electrons may be
+        negative, are simulated exactly.
+        '''
+
+        if subs == 1: return self.exactStack(1, rows, rng)
+
+        mean, variance, negative = self.subframeMoments(rows)
+
+        # Pixels that can leave the valid range in any subframe, and those that always do
+        spread = SUB_CLIP_SIGMA*np.sqrt(np.maximum(variance, 1.0))
+        clipped = (mean - spread < 0) | (mean + spread > self.white_level) | negative
+        saturated = mean - spread > self.white_level
+        clipped &= ~saturated & (mean + spread >= 0)
+
+        if np.all(clipped): return self.exactStack(subs, rows, rng)
+
+        total = subs*mean
+
+        # Electrons of all the subframes together
+        for mean_e, signal, noise in self.components:
+
+            if not noise: continue
+
+            mean_e = self.pixels(mean_e, rows)
+
+            total += (rng.poisson(subs*mean_e) - subs*mean_e)/self.gain
+            variance = variance - mean_e/self.gain**2
+
+        # Read noise and conversion to whole ADU of all the subframes together
+        gaussian_std = np.sqrt(subs*np.clip(variance, 0, None))
+
+        if np.any(gaussian_std > 0):
+            total += rng.normal(0, 1, total.shape)*gaussian_std
+
+        stack_img = (total/(subs*self.white_level)).astype('float32')
+
+        # Pixels that are truncated in every subframe
+        stack_img[saturated] = 1
+        stack_img[mean + spread < 0] = 0
+
+        # Simulate the pixels that can be truncated one subframe at a time
+        if np.any(clipped):
+
+            ys, xs = np.nonzero(clipped)
+            index = (ys + (rows.start or 0), xs)
+
+            clipped_sum = np.zeros(len(ys))
+
+            for i in range(subs):
+                clipped_sum += self.subframe(index, rng)
+
+            stack_img[clipped] = clipped_sum/(subs*self.white_level)
+
+        return stack_img
+
+    def simulate(self, subs, exact=False, seed=None, max_workers=None, progress=None, out=None):
+
+        '''
+        Return the simulated stack, relative to the white level, with every subframe simulated
+        ("exactStack") or the stack drawn directly ("fastStack"). The image is split into tiles
+        of TILE_ROWS rows that are simulated concurrently in a pool of threads. Each tile draws
+        its random numbers from its own generator, spawned from the given seed, so the result
+        only depends on the seed and not on the number of threads. Without a seed every call
+        gives a new image. Calls progress with the number of finished and of all tiles if given.
+        The stack is written to the given float32 array, such as a memory-mapped file, if given,
+        so that only the tiles being simulated are held in memory.
+        '''
+
+        starts = range(0, self.shape[0], TILE_ROWS)
+        seeds = np.random.SeedSequence(seed).spawn(len(starts))
+
+        stack_img = np.empty(self.shape, dtype='float32') if out is None else out
+
+        def simulateTile(start, seed_sequence):
+
+            '''Simulate the rows of one tile with the generator of the tile.'''
+
+            rows = slice(start, start + TILE_ROWS)
+            rng = np.random.default_rng(seed_sequence)
+
+            stack_img[rows] = (self.exactStack if exact else self.fastStack)(subs, rows, rng)
+
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers or os.cpu_count() or 1)
+
+        futures = [executor.submit(simulateTile, start, seed_sequence) for start, seed_sequence in zip(starts, seeds)]
+
+        try:
+            for done, future in enumerate(concurrent.futures.as_completed(futures)):
+                future.result()
+                if progress is not None: progress(done + 1, len(futures))
+        finally:
+            executor.shutdown()
+
+        return stack_img
@@ -0,0 +1,269 @@
+# -*- coding: utf-8 -*-
+
+import os
+import concurrent.futures
+import numpy as np
+import astropy.io.fits as pyfits
+import aplab_frame_reader as apfr
+import aplab_robust_stats as aprs
+
+STACK_MEMORY = 256*1024**2 # Bytes of frame data combined at a time by each worker process
+
+def stageFrame(filepath, path):
+
+    '''
+    Decode a frame and write it to a memory-mappable .npy file at the given path.
+    Returns the shape of the frame.
+    '''
+
+    img = apfr.readFrame(filepath)[0]
+
+    if len(img.shape) != 2:
+        raise ValueError('Frame "{}" is not a single-channel image.'.format(filepath))
+
+    mm = np.lib.format.open_memmap(path, mode='w+', dtype=img.dtype, shape=img.shape)
+    mm[...] = img
+    mm.flush()
+    del mm
+
+    return img.shape
+
+def clippedMean(values, kappa=3.0, iterations=3):
+
+    '''
+    Return the mean along the first axis of the values that lie within kappa standard deviations
+    of the median, repeating the rejection the given number of times. The standard deviation is
+    estimated from the median absolute deviation, so that a single strong outlier among a few
+    values cannot hide itself by inflating it, or from the standard deviation where that is zero.
+    '''
+
+    values = np.array(values, dtype=np.float32)
+
+    for i in range(iterations):
+
+        centre = np.nanmedian(values, axis=0)
+        spread = aprs.madStd(values, centre, axis=0)
+
+        # Fall back to the standard deviation where most values are equal, as for integer frames with low noise
+        spread = np.where(spread > 0, spread, np.nanstd(values, axis=0))
+
+        rejected = np.abs(values - centre) > kappa*spread
+
+        if not np.any(rejected): break
+
+        values[rejected] = np.nan
+
+    return np.nanmean(values, axis=0)
+
+def combineBlock(paths, out_path, start, stop, method='median', subtract_path=None, divide_path=None,
+                 kappa=3.0, iterations=3):
+
+    '''
+    Combine rows start to stop of the memory-mapped frames at the given paths pixel by pixel,
+    with the median ("median"), the mean ("mean") or the sigma-clipped mean ("sigma"), and
+    write the result to the same rows of the output file. Each frame is first calibrated by
+    subtracting the frame at subtract_path and dividing by the one at divide_path, if given.
+    '''
+
+    block = np.empty((len(paths), stop - start, np.load(paths[0], mmap_mode='r').shape[1]), dtype=np.float32)
+
+    for i, path in enumerate(paths):
+        block[i] = np.load(path, mmap_mode='r')[start:stop]
+
+    if subtract_path is not None:
+        block -= np.load(subtract_path, mmap_mode='r')[start:stop]
+
+    if divide_path is not None:
+        block /= np.load(divide_path, mmap_mode='r')[start:stop]
+
+    if method == 'median':
+        combined = np.median(block, axis=0)
+    elif method == 'mean':
+        combined = np.mean(block, axis=0)
+    else:
+        combined = clippedMean(block, kappa, iterations)
+
+    out = np.load(out_path, mmap_mode='r+')
+    out[start:stop] = combined
+    out.flush()
+    del out
+
+class Stacker:
+
+    def __init__(self, directory, max_workers=None, progress=None):
+
+        '''
+        Initialize engine for building master calibration frames and calibrated stacks of light
+        frames. Decoded frames and results are kept as memory-mapped files in the given directory,
+        and are combined in blocks of rows by a pool of worker processes, so the memory use does
+        not grow with the number or size of the frames. The files and the directory are deleted
+        on closing. Calls progress with a message if given.
+        '''
+
+        self.directory = directory
+        self.progress = progress
+
+        self.masters = {}  # Path of each master frame ("Bias", "Dark" or "Flat")
+        self.files = set() # Paths of all written files that have not been deleted yet
+
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+        self.executor = concurrent.futures.ProcessPoolExecutor(max_workers=max_workers or os.cpu_count() or 1)
+
+    def report(self, message):
+
+        '''Pass a progress message on if a progress function is given.'''
+
+        if self.progress is not None: self.progress(message)
+
+    def wait(self, futures, message):
+
+        '''Wait for the futures to finish while reporting progress, and raise any error.'''
+
+        done = 0
+
+        for future in concurrent.futures.as_completed(futures):
+            future.result()
+            done += 1
+            self.report('{} ({:d} of {:d} done)'.format(message, done, len(futures)))
+
+    def stage(self, filepaths, type):
+
+        '''Decode the given frames of an image type in parallel, and return the paths of the decoded files.'''
+
+        paths = [os.path.join(self.directory, '{}_{:d}.npy'.format(type.lower(), i)) for i in range(len(filepaths))]
+        self.files.update(paths)
+
+        futures = [self.executor.submit(stageFrame, filepath, path) for filepath, path in zip(filepaths, paths)]
+
+        self.wait(futures, 'Decoding {} frames..'.format(type.lower()))
+
+        shapes = set(np.load(path, mmap_mode='r').shape for path in paths)
+
+        if len(shapes) > 1:
+            raise ValueError('The {} frames do not all have the same size.'.format(type.lower()))
+
+        return paths
+
+    def combine(self, paths, out_path, method='median', subtract_path=None, divide_path=None,
+                kappa=3.0, iterations=3):
+
+        '''Combine the decoded frames at the given paths into a new frame, in parallel blocks of rows.'''
+
+        height, width = np.load(paths[0], mmap_mode='r').shape
+
+        for path in [subtract_path, divide_path]:
+            if path is not None and np.load(path, mmap_mode='r').shape != (height, width):
+                raise ValueError('The calibration frames do not have the same size as the frames to stack.')
+
+        self.files.add(out_path)
+        out = np.lib.format.open_memmap(out_path, mode='w+', dtype=np.float32, shape=(height, width))
+        del out
+
+        # Limit the amount of frame data each worker holds at a time
+        rows = max(STACK_MEMORY//(4*len(paths)*width), 1)
+
+        futures = [self.executor.submit(combineBlock, paths, out_path, start, min(start + rows, height), method,
+                                        subtract_path, divide_path, kappa, iterations)
+                   for start in range(0, height, rows)]
+
+        self.wait(futures, 'Combining frames..')
+
+        return out_path
+
+    def makeMaster(self, filepaths, type, method='median'):
+
+        '''
+        Build the master frame of the given image type ("Bias", "Dark" or "Flat") from the given files.
+        Flats have the master bias subtracted, if any, and are normalized to a mean of one.
+        '''
+
+        paths = self.stage(filepaths, type)
+
+        out_path = os.path.join(self.directory, 'master_{}.npy'.format(type.lower()))
+
+        subtract_path = self.masters.get('Bias') if type == 'Flat' else None
+
+        self.combine(paths, out_path, method, subtract_path=subtract_path)
+        self.removeFiles(paths)
+
+        if type == 'Flat':
+
+            master = np.load(out_path, mmap_mode='r+')
+            mean = np.mean(master, dtype=np.float64)
+
+            if not mean > 0:
+                del master
+                raise ValueError('The master flat has a mean of {:g} after bias subtraction, so it cannot be normalized.' \
+                                 .format(mean))
+
+            master /= mean
+
+            # Avoid dividing by dead pixels
+            master[master <= 0] = 1
+            master.flush()
+            del master
+
+        self.masters[type] = out_path
+
+        return out_path
+
+    def stackLights(self, filepaths, out_path, method='sigma', kappa=3.0, iterations=3):
+
+        '''
+        Calibrate the light frames with the master frames that have been built (dark, or else bias,
+        and flat), and combine them into a stack written to out_path as a FITS file. The frames
+        are combined pixel by pixel without registration.
+        '''
+
+        paths = self.stage(filepaths, 'Light')
+
+        stack_path = os.path.join(self.directory, 'stack.npy')
+
+        self.combine(paths, stack_path, method, subtract_path=self.masters.get('Dark', self.masters.get('Bias')),
+                     divide_path=self.masters.get('Flat'), kappa=kappa, iterations=iterations)
+        self.removeFiles(paths)
+
+        self.report('Writing stacked frame..')
+
+        stack = np.load(stack_path, mmap_mode='r')
+
+        header = pyfits.Header()
+        header['NCOMBINE'] = (len(filepaths), 'Number of stacked frames')
+        header['HISTORY'] = 'Stacked with the {} of calibrated frames'.format({'median': 'median', 'mean': 'mean',
+                                                                              'sigma': 'sigma-clipped mean'}[method])
+
+        pyfits.writeto(out_path, stack, header, overwrite=True)
+
+        del stack
+        self.removeFiles([stack_path])
+
+        return out_path
+
+    def removeFiles(self, paths):
+
+        '''Delete the given decoded files, ignoring files that are still in use.'''
+
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError:
+                continue
+            self.files.discard(path)
+
+    def close(self):
+
+        '''Stop the worker processes and delete all files, including those left by a failed step, and the directory.'''
+
+        self.executor.shutdown()
+
+        self.removeFiles(list(self.files))
+        self.masters = {}
+
+        try:
+            os.rmdir(self.directory)
+        except OSError:
+            pass
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import aplab_sim_engine as apse
+
+ROWS = 8192          # Rows of the test images; all pixels of a column are independent draws of the same pixel
+SUBS = 16            # Number of stacked subframes
+SIGMA = 5.0          # Largest allowed difference of the column means and variances, in standard errors
+MEAN_ADU = 0.01      # Allowed further difference of the column means in ADU, for the modelled conversion to whole ADU
+VARIANCE_ADU = 1e-3  # Allowed further difference of the column variances in ADU^2, for pixels that are always truncated
+
+def columnMoments(simulation, exact, seed):
+
+    '''
+    Return the mean and variance of every column of the simulated stack, in ADU, and the
+    squared standard errors of both.
+    '''
+
+    rng = np.random.default_rng(seed)
+    stack_img = (simulation.exactStack if exact else simulation.fastStack)(SUBS, rng=rng).astype(np.float64) \
+                *simulation.white_level
+
+    mean = np.mean(stack_img, axis=0)
+    variance = np.var(stack_img, axis=0, ddof=1)
+
+    # The standard error of the variance follows from the fourth central moment, since the
+    # truncated pixels are far from normally distributed
+    fourth = np.mean((stack_img - mean)**4, axis=0)
+
+    return mean, variance, variance/ROWS, np.maximum(fourth - variance**2, 0)/ROWS
+
+def assertEquivalent(simulation):
+
+    '''Check that the fast and the exact stack have the same mean and variance in every column.'''
+
+    fast_mean, fast_var, fast_mean_sq_err, fast_var_sq_err = columnMoments(simulation, False, 1)
+    exact_mean, exact_var, exact_mean_sq_err, exact_var_sq_err = columnMoments(simulation, True, 2)
+
+    mean_tolerance = SIGMA*np.sqrt(fast_mean_sq_err + exact_mean_sq_err) + MEAN_ADU
+    var_tolerance = SIGMA*np.sqrt(fast_var_sq_err + exact_var_sq_err) + VARIANCE_ADU
+
+    assert np.all(np.abs(fast_mean - exact_mean) <= mean_tolerance), (fast_mean, exact_mean)
+    assert np.all(np.abs(fast_var - exact_var) <= var_tolerance), (fast_var, exact_var)
+
+def columnLevels(levels):
+
+    '''Return an image of ROWS rows with the given values along each row.'''
+
+    return np.tile(np.asarray(levels, dtype=np.float32), (ROWS, 1))
+
+def test_offset_read_noise_signal_noise():
+
+    # Bias with offset and read noise, and every component with signal and Poisson noise
+    target = columnLevels([0, 3, 20, 150, 1000, 5000])
+
+    assertEquivalent(apse.StackSimulation(target.shape, 1.3, 2.5, 512, 16383,
+                                          [(8.0, True, True), (40.0, True, True), (target, True, True)]))
+
+def test_read_noise_truncated_at_zero():
+
+    # Read noise without offset, so that about half of every subframe is truncated at zero
+    target = columnLevels([0, 2, 5, 10, 40])
+
+    assertEquivalent(apse.StackSimulation(target.shape, 1.0, 3.0, 0, 4095,
+                                          [(target, True, True)], bias_offset=False))
+
+    # Read noise alone
+    assertEquivalent(apse.StackSimulation(target.shape, 1.0, 3.0, 0, 4095, [], bias_offset=False))
+
+def test_target_saturated_at_white_level():
+
+    # Target levels below, around and far above the white level
+    target = columnLevels([3000, 3900, 4050, 4095, 4150, 8000])
+
+    assertEquivalent(apse.StackSimulation(target.shape, 1.0, 3.0, 64, 4095,
+                                          [(10.0, True, True), (target, True, True)]))
+
+def test_mixed_signal_and_noise_components():
+
+    # Dark signal without noise, sky noise without signal, and the target with both
+    target = columnLevels([0, 10, 100, 1000])
+
+    assertEquivalent(apse.StackSimulation(target.shape, 2.0, 2.0, 256, 16383,
+                                          [(30.0, True, False), (200.0, False, True), (target, True, True)]))
+
+    # Noise without signal only, with the bias offset but no read noise
+    assertEquivalent(apse.StackSimulation(target.shape, 2.0, 2.0, 256, 16383,
+                                          [(target, False, True)], bias_noise=False))
+
+def test_faint_signal_noise_stacked_fast():
+
+    # Every component with signal and Poisson noise, all below 36 electrons
+    target = columnLevels([0, 1, 5, 20, 35])
+    simulation = apse.StackSimulation(target.shape, 1.0, 2.5, 512, 16383,
+                                      [(3.0, True, True), (target, True, True)])
+
+    assert not np.any(simulation.subframeMoments()[2])
+
+    # No pixel is simulated one subframe at a time
+    subframe = simulation.subframe
+    calls = []
+    simulation.subframe = lambda *args: calls.append(args) or subframe(*args)
+    simulation.fastStack(SUBS, rng=np.random.default_rng(1))
+
+    assert not calls
+
+    del simulation.subframe
+    assertEquivalent(simulation)
+
+def test_simulation_depends_only_on_seed():
+
+    target = columnLevels([0, 10, 100, 1000])
+    simulation = apse.StackSimulation(target.shape, 1.0, 3.0, 64, 4095, [(target, True, True)])
+
+    for exact in [False, True]:
+
+        one = simulation.simulate(4, exact=exact, seed=7, max_workers=1)
+        four = simulation.simulate(4, exact=exact, seed=7, max_workers=4)
+        other = simulation.simulate(4, exact=exact, seed=8, max_workers=1)
+
+        assert np.array_equal(one, four)
+        assert not np.array_equal(one, other)